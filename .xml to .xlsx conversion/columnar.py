@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+# Column-oriented replacements for building DataFrames from lists of dicts.
+# Path keys are interned to integer column ids once, values are appended to
+# one list per column, and pandas receives finished columns. Nothing is
+# allocated per record except the values themselves.
+
+
+class ColumnarBuilder:
+    """Collect rows as per-column (row numbers, values) arrays addressed by interned column ids"""
+
+    def __init__(self):
+        self.ids = {}       # key -> column id
+        self.names = []     # column id -> key
+        self.columns = []   # column id -> (row numbers, values)
+        self.appenders = {}  # (path, suffix) -> column id and its append methods
+        self.nrows = 0
+
+    def column_id(self, key):
+        col_id = self.ids.get(key)
+        if col_id is None:
+            col_id = self.ids[key] = len(self.names)
+            self.names.append(key)
+            self.columns.append(([], []))
+        return col_id
+
+    def appender(self, path, suffix, sep="/"):
+        """(row append, value append) for the column "path<sep>suffix", building the key only once"""
+        found = self.appenders.get((path, suffix, sep))
+        if found is None:
+            rows, values = self.columns[self.column_id(f"{path}{sep}{suffix}")]
+            found = self.appenders[(path, suffix, sep)] = (rows.append, values.append)
+        return found
+
+    def start_row(self):
+        self.nrows += 1
+        return self.nrows - 1
+
+    def set(self, col_id, value):
+        """Set a value in the current row (a later value for the same column wins)"""
+        rows, values = self.columns[col_id]
+        rows.append(self.nrows - 1)
+        values.append(value)
+
+    def set_key(self, key, value):
+        self.set(self.column_id(key), value)
+
+    def add_record(self, record):
+        row = self.start_row()
+        for key, value in record.items():
+            rows, values = self.columns[self.column_id(key)]
+            rows.append(row)
+            values.append(value)
+
+    def to_frame(self, columns=None):
+        """Hand the finished columns to pandas; columns= fixes the column order and set"""
+        if columns is None:
+            # Like a list of dicts, a column exists only once some row has a value in it
+            names = [name for name, (rows, _) in zip(self.names, self.columns) if rows]
+            if not self.nrows:
+                return pd.DataFrame([])
+        else:
+            names = list(columns)
+        grid = np.full((self.nrows, len(names)), np.nan, dtype=object)
+        for i, name in enumerate(names):
+            col_id = self.ids.get(name)
+            if col_id is None:
+                continue
+            rows, values = self.columns[col_id]
+            if rows:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+                # Assigned in order, so a repeated cell keeps its last value
+                grid[np.asarray(rows, dtype=np.intp), i] = column
+        # pandas infers string columns from the object grid; anything left as object
+        # (empty or non-string columns) gets the same inference a list of dicts gets
+        frame = pd.DataFrame(grid, index=pd.RangeIndex(self.nrows), columns=names)
+        if (frame.dtypes == object).any():
+            frame = frame.infer_objects()
+        return frame
+
+
+def node_rows_columnar(root, builder=None):
+    """Columnar twin of xmltoexcel.parse_node: one row per leaf, no parent_data copies
+
+    Returns the builder; builder.to_frame() equals pd.DataFrame(parse_node(root)).
+    """
+    builder = builder or ColumnarBuilder()
+    appender = builder.appender
+    appenders = builder.appenders
+    inherited = []  # (column key parts, value) for every ancestor attribute
+
+    def walk(node, path):
+        pushed = 0
+        for attr, value in node.attrib.items():
+            inherited.append(((path, attr, "@"), value))
+            pushed += 1
+        has_children = False
+        for child in node:
+            has_children = True
+            walk(child, f"{path}/{child.tag}" if path else child.tag)
+        if not has_children and node.text and node.text.strip():
+            # Columns are registered as their first value arrives, which keeps pandas' column order
+            row = builder.start_row()
+            for key, value in inherited:
+                add_row, add_value = appenders.get(key) or appender(*key)
+                add_row(row)
+                add_value(value)
+            add_row, add_value = appender(path, "", "")
+            add_row(row)
+            add_value(node.text.strip())
+        if pushed:
+            del inherited[-pushed:]
+
+    walk(root, "")
+    return builder
+
+
+def element_record_columnar(root, builder, indexed=False):
+    """Add one row to the builder, the columnar twin of parse_element(root, "", data_dict)
+
+    indexed=False follows xmltoexcel2, indexed=True follows xmltoexcel1.
+    """
+    row = builder.start_row()
+    appender = builder.appender
+    appenders = builder.appenders
+
+    def walk(element, current_path):
+        text = element.text.strip() if element.text else ""
+        if text and not indexed:
+            add_row, add_value = appenders.get((current_path, "text", "/")) or appender(current_path, "text")
+            add_row(row)
+            add_value(text)
+        for attr, value in element.attrib.items():
+            add_row, add_value = appender(current_path, f"@{attr}")
+            add_row(row)
+            add_value(value)
+        if text and indexed:
+            add_row, add_value = appenders.get((current_path, "text", "/")) or appender(current_path, "text")
+            add_row(row)
+            add_value(text)
+
+        if indexed:
+            tag_counts = {}
+            for child in element:
+                tag = child.tag
+                count = tag_counts[tag] = tag_counts.get(tag, 0) + 1
+                if count > 1:
+                    walk(child, f"{current_path}/{tag}[{count}]/{tag}")
+                else:
+                    walk(child, f"{current_path}/{tag}/{tag}")
+        else:
+            for child in element:
+                walk(child, f"{current_path}/{child.tag}")
+
+    walk(root, root.tag)
+    return builder
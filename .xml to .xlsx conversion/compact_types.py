@@ -0,0 +1,177 @@
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+# Typing stage for flattened submissions. Every value parse_node and
+# parse_element produce is a str, so without it every column is text. Here
+# each column becomes the most compact dtype that holds all of its values:
+# integers (the smallest width, nullable when some are missing), floats,
+# booleans, dates, or a category when few distinct values repeat. Where the
+# form declares a field's type (an XForm bind) that type is used, so e.g. a
+# phone number declared as text is never turned into a number. Without a
+# declared type a column only becomes numbers when every value writes back as
+# exactly the same text, so "+91...", "007", IDs beyond int64 and "1e400"
+# stay text.
+
+# XForm bind types, as form_plan stores them in FlatteningPlan.binds
+INTEGER_TYPES = {"int", "integer", "long", "short"}
+DECIMAL_TYPES = {"decimal", "double", "float"}
+BOOLEAN_TYPES = {"boolean"}
+DATE_TYPES = {"date"}
+DATETIME_TYPES = {"dateTime"}
+
+# At most this many distinct values, each used at least twice on average, make a category
+CATEGORY_MAX_UNIQUE = 1000
+CATEGORY_MAX_RATIO = 0.5
+
+INTEGER = re.compile(r"[+-]?\d+\Z")
+INT64 = np.iinfo("int64")
+DATE = re.compile(r"\d{4}-\d{2}-\d{2}\Z")
+# ODK dateTime values carry an offset; those stay text, as Excel cannot store time zones
+NAIVE_DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?\Z")
+TRUE_VALUES = {"true", "1"}
+FALSE_VALUES = {"false", "0"}
+NULLABLE_INTEGERS = ("Int8", "Int16", "Int32", "Int64")
+
+
+def text_values(series):
+    """The non-missing values of a column that holds only text, else None"""
+    if not (series.dtype == object or isinstance(series.dtype, pd.StringDtype)):
+        return None
+    values = series.dropna()
+    if values.empty or pd.api.types.infer_dtype(values, skipna=False) != "string":
+        return None
+    return values
+
+
+def smallest_integers(series, numbers):
+    if not numbers.isna().any():
+        return pd.to_numeric(numbers, downcast="integer")
+    low, high = numbers.min(), numbers.max()
+    for dtype in NULLABLE_INTEGERS:
+        info = np.iinfo(dtype.lower())
+        if info.min <= low and high <= info.max:
+            return numbers.astype(dtype)
+    return series
+
+
+def round_trips(value):
+    """Whether value is an int64 or finite float that writes back as exactly the same text"""
+    try:
+        number = int(value)
+        return INT64.min <= number <= INT64.max and str(number) == value
+    except ValueError:
+        pass
+    try:
+        number = float(value)
+    except ValueError:
+        return False
+    return math.isfinite(number) and repr(number) == value
+
+
+def as_numbers(series, values, declared):
+    """series as integers or floats, or None when some value is not a number"""
+    if declared is None and not values.map(round_trips).all():
+        # "007", "+91..." or "1e400" are codes, IDs and text, not numbers
+        return None
+    try:
+        numbers = pd.to_numeric(series.astype(object), errors="raise")
+    except (ValueError, TypeError):
+        return None
+    if declared in DECIMAL_TYPES:
+        return numbers.astype("float64")
+    if values.map(lambda value: bool(INTEGER.match(value.strip()))).all():
+        if not values.map(lambda value: INT64.min <= int(value) <= INT64.max).all():
+            # Beyond int64 pandas keeps Python ints in an object column
+            return None
+        return smallest_integers(series, numbers)
+    if declared in INTEGER_TYPES:
+        return None
+    return numbers.astype("float64")
+
+
+def as_booleans(series, values, declared):
+    lowered = values.str.strip().str.lower()
+    # Undeclared columns of 1 and 0 are numbers
+    accepted = TRUE_VALUES | FALSE_VALUES if declared in BOOLEAN_TYPES else {"true", "false"}
+    if not lowered.isin(accepted).all():
+        return None
+    result = pd.Series(pd.NA, index=series.index, dtype="boolean")
+    result[lowered.index] = lowered.isin(TRUE_VALUES).to_numpy()
+    return result
+
+
+def as_dates(series, values, pattern, fmt):
+    if not values.map(lambda value: bool(pattern.match(value.strip()))).all():
+        return None
+    try:
+        return pd.to_datetime(series.astype(object), format=fmt, errors="raise")
+    except (ValueError, TypeError):
+        return None
+
+
+def as_category(series, values):
+    unique = values.nunique()
+    if unique > CATEGORY_MAX_UNIQUE or unique > len(values) * CATEGORY_MAX_RATIO:
+        return None
+    return series.astype("category")
+
+
+def compact_series(series, declared=None):
+    """series in the most compact dtype that keeps every value; declared is its XForm type, if known"""
+    values = text_values(series)
+    if values is None:
+        return series
+
+    candidates = []
+    if declared in INTEGER_TYPES or declared in DECIMAL_TYPES:
+        candidates = [lambda: as_numbers(series, values, declared)]
+    elif declared in BOOLEAN_TYPES:
+        candidates = [lambda: as_booleans(series, values, declared)]
+    elif declared in DATE_TYPES:
+        candidates = [lambda: as_dates(series, values, DATE, "%Y-%m-%d")]
+    elif declared in DATETIME_TYPES:
+        candidates = [lambda: as_dates(series, values, NAIVE_DATETIME, "ISO8601")]
+    elif declared is None:
+        candidates = [lambda: as_booleans(series, values, None),
+                      lambda: as_numbers(series, values, None),
+                      lambda: as_dates(series, values, DATE, "%Y-%m-%d"),
+                      lambda: as_dates(series, values, NAIVE_DATETIME, "ISO8601")]
+    # Declared text (strings, selects, geopoints ...) can still be a category
+    candidates.append(lambda: as_category(series, values))
+
+    for candidate in candidates:
+        result = candidate()
+        if result is not None:
+            return result
+    return series
+
+
+def compact_frame(df, types=None):
+    """df with every text column in its most compact dtype
+
+    types is {column: XForm type} for the columns the form declares (see
+    plan_types); the others are inferred from their values.
+    """
+    types = types or {}
+    columns = {}
+    for position, (name, series) in enumerate(df.items()):
+        compacted = compact_series(series, types.get(name))
+        if compacted is not series:
+            columns[position] = compacted
+    if not columns:
+        return df
+    df = df.copy(deep=False)
+    for position, series in columns.items():
+        # By position, as flattened frames can repeat a column name
+        df.isetitem(position, series)
+    return df
+
+
+def plan_types(plan):
+    """{column key: XForm type} for the plan's columns whose field has a typed bind"""
+    if plan is None:
+        return {}
+    return {column: plan.binds[nodeset] for column, nodeset in plan.nodes.items() if nodeset in plan.binds}
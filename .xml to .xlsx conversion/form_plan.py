@@ -0,0 +1,199 @@
+import copy
+import json
+import os
+import xml.etree.ElementTree as ET
+
+from xml_streaming import ElementFlattener, iter_tree_events, tree_records
+
+# A flattening plan is the fixed, ordered list of column keys a form produces,
+# compiled once from the form definition (the XForm) and cached on disk. With a
+# plan the converters no longer need a column-discovery pass over every file;
+# paths the form did not declare are appended to the plan as they show up.
+
+PLAN_VERSION = 1
+
+XFORMS = "{http://www.w3.org/2002/xforms}"
+XHTML = "{http://www.w3.org/1999/xhtml}"
+JR_TEMPLATE = "{http://openrosa.org/javarosa}template"
+
+# "element" keys come from xmltoexcel2.parse_element,
+# "indexed" keys from xmltoexcel1.process_xml_file records
+LAYOUTS = ("element", "indexed")
+
+
+class FlatteningPlan:
+    """Ordered column keys for one form plus what the form says about them"""
+
+    def __init__(self, columns=(), layout="element", repeats=(), nodes=None, binds=None,
+                 source=None, fingerprint=None):
+        self.layout = layout
+        self.columns = []
+        self.positions = {}
+        self.repeats = list(repeats)    # nodesets of repeating groups, e.g. /data/Q3_cropping
+        self.nodes = dict(nodes or {})  # column key -> nodeset of the field it holds
+        self.binds = dict(binds or {})  # nodeset -> XForm bind type (int, decimal, date ...)
+        self.source = source
+        self.fingerprint = fingerprint
+        self.changed = False
+        self.add(columns)
+        self.changed = False
+
+    def add(self, keys):
+        """Append keys not in the plan yet; returns how many were new"""
+        added = 0
+        for key in keys:
+            if key not in self.positions:
+                self.positions[key] = len(self.columns)
+                self.columns.append(key)
+                added += 1
+        if added:
+            self.changed = True
+        return added
+
+    def repeat_tags(self):
+        return [nodeset.rstrip("/").split("/")[-1] for nodeset in self.repeats]
+
+    def to_dict(self):
+        return {
+            "version": PLAN_VERSION,
+            "layout": self.layout,
+            "source": self.source,
+            "fingerprint": self.fingerprint,
+            "columns": self.columns,
+            "repeats": self.repeats,
+            "nodes": self.nodes,
+            "binds": self.binds,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["columns"], layout=data["layout"], repeats=data.get("repeats", ()),
+                   nodes=data.get("nodes"), binds=data.get("binds"),
+                   source=data.get("source"), fingerprint=data.get("fingerprint"))
+
+    def save(self, plan_file):
+        tmp_file = f"{plan_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=1)
+        os.replace(tmp_file, plan_file)
+        self.changed = False
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def local_tag(tag):
+    # Submissions carry the instance without the XForms default namespace
+    return tag[len(XFORMS):] if tag.startswith(XFORMS) else tag
+
+
+def instance_template(xform_root):
+    """The primary instance of an XForm, shaped like a submission
+
+    Repeat templates are kept once, jr:template markers are dropped and every
+    leaf gets its own nodeset as text, so flattening the template yields each
+    column key together with the field it came from.
+    """
+    model = xform_root.find(f"{XHTML}head/{XFORMS}model")
+    if model is None:
+        raise ValueError("no XForms model in the form definition")
+    instance = next((inst for inst in model.findall(f"{XFORMS}instance") if "id" not in inst.attrib), None)
+    if instance is None or len(instance) == 0:
+        raise ValueError("no primary instance in the form definition")
+    template = copy.deepcopy(instance[0])
+
+    def prepare(element, nodeset):
+        element.tag = local_tag(element.tag)
+        element.attrib.pop(JR_TEMPLATE, None)
+        seen = set()
+        for child in list(element):
+            child_tag = local_tag(child.tag)
+            if child_tag in seen:
+                # A repeat's template and its first default instance are the same shape
+                element.remove(child)
+                continue
+            seen.add(child_tag)
+            prepare(child, f"{nodeset}/{child_tag}")
+        if len(element) == 0:
+            element.text = nodeset
+        else:
+            element.text = None
+
+    prepare(template, f"/{local_tag(template.tag)}")
+    return template
+
+
+def template_records(template, layout):
+    if layout == "indexed":
+        return tree_records(template)
+    flattener = ElementFlattener(indexed=False)
+    for event, elem in iter_tree_events(template):
+        if event == "start":
+            flattener.start(elem)
+        else:
+            flattener.end(elem)
+    return [flattener.data]
+
+
+def compile_xform(xform_file, layout="element"):
+    """Compile an XForm (.xml) into a FlatteningPlan for the given converter layout"""
+    root = ET.parse(xform_file).getroot()
+    template = instance_template(root)
+    columns = []
+    nodes = {}
+    for record in template_records(template, layout):
+        for key, value in record.items():
+            columns.append(key)
+            if key.endswith("/text"):
+                nodes[key] = value
+
+    repeats = [element.get("nodeset") for element in root.iter(f"{XFORMS}repeat") if element.get("nodeset")]
+    binds = {}
+    for bind in root.iter(f"{XFORMS}bind"):
+        if bind.get("nodeset") and bind.get("type"):
+            binds[bind.get("nodeset")] = bind.get("type").split(":")[-1]
+
+    if layout == "indexed":
+        # xmltoexcel1 writes its columns sorted
+        columns = sorted(set(columns))
+    return FlatteningPlan(columns, layout=layout, repeats=repeats, nodes=nodes, binds=binds,
+                          source=os.path.abspath(xform_file), fingerprint=file_fingerprint(xform_file))
+
+
+def compile_plan(form_file, layout="element"):
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown layout {layout!r}")
+    if form_file.lower().endswith((".xlsx", ".xls")):
+        # A Forms_IDs workbook lists leaf names like Q1_name, not the flattened
+        # paths the converters write, and says nothing about repeats
+        raise ValueError(f"{os.path.basename(form_file)} is not an XForm; a Forms_IDs workbook cannot be "
+                         "compiled into a plan, pass the form's .xml definition")
+    return compile_xform(form_file, layout)
+
+
+def default_plan_file(form_file, layout="element"):
+    return f"{os.path.splitext(form_file)[0]}.{layout}.plan.json"
+
+
+def load_plan(form_file, layout="element", plan_file=None):
+    """Cached plan for form_file, recompiled when the form definition has changed
+
+    Columns added by earlier conversions are kept as long as the form is unchanged.
+    """
+    plan_file = plan_file or default_plan_file(form_file, layout)
+    if os.path.exists(plan_file):
+        try:
+            with open(plan_file, encoding="utf-8") as f:
+                data = json.load(f)
+            if (data.get("version") == PLAN_VERSION and data.get("layout") == layout
+                    and data.get("fingerprint") == file_fingerprint(form_file)):
+                return FlatteningPlan.from_dict(data)
+        except (OSError, ValueError, KeyError) as e:
+            print(f" Ignoring unreadable plan {plan_file}: {e}")
+
+    plan = compile_plan(form_file, layout)
+    plan.save(plan_file)
+    print(f" Compiled {len(plan.columns)} columns from {os.path.basename(form_file)} into {plan_file}")
+    return plan
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_io import tag_value, untag_value  # noqa: E402
+
+# Incremental conversion. A manifest in the output folder records, for every
+# input XML, its size, mtime and MD5 and the files made from it, so a run
+# converts only new or changed files and deletes the outputs of files that are
+# gone. What each input contributes to the combined result is appended to a
+# results log next to the manifest, one JSON line per input; the combined file
+# is rebuilt from the log instead of converting or re-reading every input again.
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = ".conversion_manifest.json"
+# A value JSON has no type for (a date, a numpy integer ...) is logged as {TAGGED: [type tag, text]}
+TAGGED = "$tag"
+
+
+def file_md5(path, block_size=1024 * 1024):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tagged_value(value):
+    return {TAGGED: list(tag_value(value))}
+
+
+def untagged_value(obj):
+    if len(obj) == 1 and TAGGED in obj:
+        return untag_value(*obj[TAGGED])
+    return obj
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class Manifest:
+    """Inputs converted by earlier runs, and the results log of what each one produced
+
+    settings (converter, output format ...) are stored with the manifest; when
+    they change, every input counts as changed.
+    """
+
+    def __init__(self, folder, settings):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_FILE)
+        self.settings = settings
+        self.files = {}
+        self.columns = []   # union of the column keys seen so far, in order of first appearance
+        self.log_name = None
+        self.log = None
+        self.pending = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            print(f" Ignoring unreadable conversion manifest: {self.path}")
+            return
+        if data.get("version") != MANIFEST_VERSION:
+            return
+        self.files = data.get("files", {})
+        self.log_name = data.get("log")
+        if data.get("settings") != self.settings:
+            print(" Conversion settings changed since the last run, converting every file again")
+            # Keep the entries so their old outputs are replaced, but make them all look changed
+            for entry in self.files.values():
+                entry["md5"] = None
+                entry.pop("result", None)
+            return
+        self.columns = data.get("columns", [])
+
+    def scan(self, paths):
+        """(paths of new or changed inputs, names of inputs that are gone)
+
+        Size and mtime decide first; an input whose size or mtime changed but
+        whose content did not is only re-stamped.
+        """
+        changed = []
+        seen = set()
+        for path in paths:
+            name = os.path.basename(path)
+            seen.add(name)
+            stat = os.stat(path)
+            stamp = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            entry = self.files.get(name)
+            if entry and entry.get("md5") and all(entry.get(key) == value for key, value in stamp.items()):
+                continue
+            stamp["md5"] = file_md5(path)
+            if entry and entry.get("md5") == stamp["md5"]:
+                entry.update(stamp)
+                continue
+            self.pending[name] = stamp
+            changed.append(path)
+        removed = sorted(name for name in self.files if name not in seen)
+        return changed, removed
+
+    def outputs(self, name):
+        entry = self.files.get(name)
+        return list(entry.get("outputs", [])) if entry else []
+
+    def add_columns(self, keys):
+        known = set(self.columns)
+        for key in keys:
+            if key not in known:
+                known.add(key)
+                self.columns.append(key)
+
+    def record(self, path, outputs, result):
+        """An input converted; outputs are the files written for it, result goes to the log
+
+        Outputs of an earlier conversion that were not written again are deleted.
+        """
+        name = os.path.basename(path)
+        remove_files(output for output in self.outputs(name) if output not in outputs)
+        entry = dict(self.pending.pop(name))
+        entry["outputs"] = list(outputs)
+        entry["result"] = self.append(result)
+        self.files[name] = entry
+
+    def forget(self, name):
+        """Drop an input that is gone; returns the outputs it had"""
+        outputs = self.outputs(name)
+        self.files.pop(name, None)
+        return outputs
+
+    # ----------------------- results log -----------------------
+    def log_path(self, log_name=None):
+        return os.path.join(self.folder, log_name or self.log_name)
+
+    def append(self, result):
+        if self.log is None:
+            if self.log_name is None:
+                self.log_name = ".conversion_results.0.jsonl"
+            self.log = open(self.log_path(), "ab")
+        offset = self.log.seek(0, os.SEEK_END)
+        line = json.dumps(result, ensure_ascii=False, default=tagged_value) + "\n"
+        self.log.write(line.encode("utf-8"))
+        return [offset, self.log.tell() - offset]
+
+    def results(self):
+        """(name, result) for every recorded input, in name order
+
+        Results come back as JSON gives them, so tuples are lists.
+        """
+        if self.log is not None:
+            self.log.flush()
+        names = sorted(name for name, entry in self.files.items() if entry.get("result"))
+        if not names:
+            return
+        with open(self.log_path(), "rb") as f:
+            for name in names:
+                f.seek(self.files[name]["result"][0])
+                yield name, json.loads(f.readline(), object_hook=untagged_value)
+
+    def compact(self):
+        """Rewrite the log without the results of replaced or removed inputs once they are most of it"""
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        if self.log_name is None or not os.path.exists(self.log_path()):
+            return
+        live = sum(entry["result"][1] for entry in self.files.values() if entry.get("result"))
+        if live * 2 >= os.path.getsize(self.log_path()):
+            return
+
+        generation = int(self.log_name.split(".")[-2]) + 1
+        new_name = f".conversion_results.{generation}.jsonl"
+        old_path = self.log_path()
+        with open(old_path, "rb") as old, open(self.log_path(new_name), "wb") as new:
+            for name in sorted(self.files):
+                entry = self.files[name]
+                if not entry.get("result"):
+                    continue
+                offset, length = entry["result"]
+                old.seek(offset)
+                entry["result"] = [new.tell(), length]
+                new.write(old.read(length))
+        self.log_name = new_name
+        # The manifest names the new log before the old one goes away
+        self.write()
+        os.remove(old_path)
+
+    def write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings, "log": self.log_name,
+                       "columns": self.columns, "files": self.files}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def save(self):
+        self.compact()
+        self.write()
@@ -0,0 +1,236 @@
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+from columnar import ColumnarBuilder
+from compact_types import compact_frame
+from parallel_convert import parallel_map
+from xml_streaming import iter_events, iter_tree_events
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_io import FORMATS, book_path, write_sheets  # noqa: E402
+from instrumentation import count, instrumented  # noqa: E402
+
+# Normalized output: one table of submissions plus one table per repeat group,
+# instead of one wide row per leaf (parse_node) or header fields copied into
+# every line item (xmltoexcel1). Every row is stored once and linked by keys
+# in the style of ODK Briefcase exports:
+#   KEY             the row's own key, "<submission>/<group>/<repeat>[n]/..."
+#   PARENT_KEY      KEY of the enclosing repeat instance, or of the submission
+#   SUBMISSION_KEY  KEY of the submission (meta/instanceID, else the file name)
+# Repeat groups are the paths a form declares as repeats plus every path that
+# occurs more than once under the same parent in any file, so nothing is hardcoded.
+
+SUBMISSIONS = "submissions"
+# Characters Excel does not allow in sheet names
+SHEET_NAME_CHARS = str.maketrans({char: "_" for char in '[]:*?/\\'})
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+class Scope:
+    """What one element holds once it has closed: its own values and its children's scopes"""
+
+    __slots__ = ("path", "fields", "children")
+
+    def __init__(self, path):
+        self.path = path
+        self.fields = {}     # "@attr" -> value, "" -> the text of a leaf
+        self.children = {}   # tag -> [Scope], in document order
+
+
+def read_scopes(events):
+    """The root Scope of a document from its start/end events"""
+    stack = []
+    for event, elem in events:
+        if event == "start":
+            path = f"{stack[-1].path}/{elem.tag}" if stack else elem.tag
+            scope = Scope(path)
+            if stack:
+                stack[-1].children.setdefault(elem.tag, []).append(scope)
+            stack.append(scope)
+        else:
+            scope = stack.pop()
+            for attr, value in elem.attrib.items():
+                scope.fields[f"@{attr}"] = value
+            if not scope.children and elem.text and elem.text.strip():
+                scope.fields[""] = elem.text.strip()
+            if not stack:
+                return scope
+    raise ValueError("empty document")
+
+
+def document_events(xml_file, streaming=False):
+    if streaming:
+        return iter_events(xml_file)
+    return iter_tree_events(ET.parse(xml_file).getroot())
+
+
+def find_repeats(xml_file, streaming=False):
+    """Discovery task: (paths occurring more than once under one parent, None), or (None, error message)"""
+    try:
+        repeats = set()
+        stack = []  # {tag: count} of every open element's children
+        for event, elem in document_events(xml_file, streaming):
+            if event == "start":
+                if stack:
+                    path, counts = stack[-1]
+                    counts[elem.tag] = counts.get(elem.tag, 0) + 1
+                    if counts[elem.tag] == 2:
+                        repeats.add(f"{path}/{elem.tag}")
+                    stack.append((f"{path}/{elem.tag}", {}))
+                else:
+                    stack.append((elem.tag, {}))
+            else:
+                stack.pop()
+        return repeats, None
+    except Exception as e:
+        return None, str(e)
+
+
+def submission_key(root, xml_file):
+    """meta/instanceID of the submission (with or without the orx namespace), else the file name"""
+    for tag, metas in root.children.items():
+        if local_name(tag) != "meta":
+            continue
+        for child_tag, ids in metas[0].children.items():
+            if local_name(child_tag) == "instanceID" and ids[0].fields.get(""):
+                return ids[0].fields[""]
+    return os.path.splitext(os.path.basename(xml_file))[0]
+
+
+def column(scope, relative, suffix):
+    if suffix.startswith("@"):
+        return f"{relative}{suffix}"
+    # A repeated leaf is a row of its own; its value goes in a column named after it
+    return relative or local_name(scope.path.rsplit("/", 1)[-1])
+
+
+def normalize_scope(root, key, repeats, file_name=None):
+    """{repeat path or None for the submission: [row dicts]} for one submission's Scope tree"""
+    tables = {}
+
+    def flatten(scope, row, relative, key_path):
+        for suffix, value in scope.fields.items():
+            row[column(scope, relative, suffix)] = value
+        for tag, children in scope.children.items():
+            child_path = f"{scope.path}/{tag}"
+            if child_path in repeats or len(children) > 1:
+                # Each instance is a row of its own table, linked to the row it sits in
+                for number, child in enumerate(children, 1):
+                    child_key = f"{key_path}/{tag}[{number}]"
+                    child_row = {"KEY": child_key, "PARENT_KEY": row["KEY"], "SUBMISSION_KEY": key}
+                    tables.setdefault(child_path, []).append(child_row)
+                    flatten(child, child_row, "", child_key)
+            else:
+                child_relative = f"{relative}/{tag}" if relative else tag
+                flatten(children[0], row, child_relative, f"{key_path}/{tag}")
+
+    submission = {"KEY": key, "FILE": file_name}
+    tables[None] = [submission]
+    flatten(root, submission, "", key)
+    return tables
+
+
+def normalize_file(xml_file, repeats=(), streaming=False):
+    """Conversion task: ({table: [row dicts]}, None) for one submission, or (None, error message)"""
+    try:
+        root = read_scopes(document_events(xml_file, streaming))
+        key = submission_key(root, xml_file)
+        return normalize_scope(root, key, set(repeats), os.path.basename(xml_file)), None
+    except Exception as e:
+        return None, str(e)
+
+
+def table_names(paths):
+    """{repeat path: sheet name}, the repeat's tag unless two repeats share it"""
+    names = {None: SUBMISSIONS}
+    taken = {SUBMISSIONS}
+    for path in paths:
+        name = local_name(path.rsplit("/", 1)[-1]).translate(SHEET_NAME_CHARS)[:31]
+        base, number = name, 1
+        while name in taken:
+            number += 1
+            suffix = f" ({number})"
+            name = f"{base[:31 - len(suffix)]}{suffix}"
+        taken.add(name)
+        names[path] = name
+    return names
+
+
+def table_types(path, binds):
+    """{column: XForm type} of a table's fields, from the form's binds (nodeset -> type)"""
+    if path is None:
+        # The submission's own fields, /<root>/<column>
+        return {nodeset.split("/", 2)[-1]: kind for nodeset, kind in binds.items() if nodeset.count("/") >= 2}
+    prefix = f"/{path}/"
+    return {nodeset[len(prefix):]: kind for nodeset, kind in binds.items() if nodeset.startswith(prefix)}
+
+
+@instrumented("normalized.normalize_xml_files")
+def normalize_xml_files(xml_files, output_path, repeats=(), streaming=False, workers=1, fmt="xlsx", typed=False,
+                        binds=None):
+    """Write the submissions table and one table per repeat group for xml_files
+
+    output_path is an .xlsx workbook with a sheet per table, or for
+    parquet/feather a folder with a file per table (frame_io.write_sheets).
+    Repeats declared by the form can be passed in; the others are found by a
+    first pass over the files. With typed the columns are stored in compact
+    dtypes (compact_types.py), by the form's binds where given. Returns the
+    number of files that failed to normalize.
+    """
+    repeats = set(repeats)
+    for xml_file, (found, error) in zip(xml_files, parallel_map(find_repeats, xml_files, workers,
+                                                                args=(streaming,))):
+        if error is not None:
+            print(f" Repeat discovery failed for {os.path.basename(xml_file)}: {error}")
+            continue
+        repeats.update(found)
+
+    failed = 0
+    builders = {None: ColumnarBuilder()}
+    for path in sorted(repeats):
+        builders[path] = ColumnarBuilder()
+    results = parallel_map(normalize_file, xml_files, workers, args=(sorted(repeats), streaming))
+    for xml_file, (tables, error) in zip(xml_files, results):
+        if error is not None:
+            print(f" Failed: {os.path.basename(xml_file)} - {error}")
+            count(errors=1)
+            failed += 1
+            continue
+        count(files=1, bytes=os.path.getsize(xml_file))
+        for path, rows in tables.items():
+            builder = builders.setdefault(path, ColumnarBuilder())
+            for row in rows:
+                builder.add_record(row)
+
+    names = table_names(path for path in builders if path is not None)
+    sheets = [(names[path], builder.to_frame()) for path, builder in builders.items()]
+    if typed:
+        sheets = [(name, compact_frame(df, table_types(path, binds or {})))
+                  for (name, df), path in zip(sheets, builders)]
+    write_sheets(sheets, output_path, fmt)
+    counts = {name: len(df) for name, df in sheets}
+    count(rows=sum(counts.values()))
+    print(f" Normalized {len(xml_files)} files into {output_path}: "
+          + ", ".join(f"{name} {rows} rows" for name, rows in counts.items()))
+    return failed
+
+
+def normalize_xml_folder(input_folder, output_folder, repeats=(), streaming=False, workers=1, fmt="xlsx", typed=False,
+                         binds=None):
+    """normalize_xml_files for every XML file in input_folder, written to output_folder/normalized
+
+    Returns the number of XML files that failed to normalize.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    xml_files = sorted(os.path.join(input_folder, file_name) for file_name in os.listdir(input_folder)
+                       if file_name.lower().endswith(".xml"))
+    if not xml_files:
+        print(f" No XML files found in {input_folder}")
+        return 0
+    output_path = book_path(os.path.join(output_folder, f"normalized{FORMATS['xlsx']}"), fmt)
+    return normalize_xml_files(xml_files, output_path, repeats, streaming, workers, fmt, typed, binds)
@@ -0,0 +1,66 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instrumentation import merge, recorded, stage  # noqa: E402
+
+# Spreads per-file conversion work over a process pool. Items are grouped into
+# chunks so each task carries enough work to hide the pickling and scheduling
+# overhead, and results are put back in the order of the input list, so the
+# output does not depend on which worker finished first. Every item is a run
+# of the stage named after func, in the workers as in this process.
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def default_chunksize(count, workers):
+    # About four chunks per worker keeps the pool busy when file sizes vary
+    return max(1, min(64, count // (workers * 4)))
+
+
+def chunked(items, size):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def task_name(func):
+    """Stage name of func: module.function, with the script's name for __main__"""
+    module = func.__module__
+    if module == "__main__":
+        module = os.path.splitext(os.path.basename(getattr(sys.modules["__main__"], "__file__", "main")))[0]
+    return f"{module}.{func.__name__}"
+
+
+def run_chunk(func, chunk, args):
+    """Pool task: apply func to every item of one chunk"""
+    results = []
+    for item in chunk:
+        with stage(task_name(func)):
+            results.append(func(item, *args))
+    return results
+
+
+def parallel_map(func, items, workers=1, chunksize=None, args=()):
+    """[func(item, *args) for item in items], computed in a process pool
+
+    func must be a module-level function so it can be sent to the workers.
+    With workers <= 1 (or a single item) it runs in this process.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return run_chunk(func, items, args)
+
+    workers = min(workers, len(items))
+    chunksize = chunksize or default_chunksize(len(items), workers)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(recorded, None, run_chunk, func, chunk, args) for chunk in chunked(items, chunksize)]
+        # Merge in submission order, not completion order
+        for future in futures:
+            chunk_results, recording = future.result()
+            merge(recording)
+            results.extend(chunk_results)
+    return results
@@ -0,0 +1,254 @@
+import os
+import pickle
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# .xlsx through xlsx_stream, .parquet/.feather in row batches
+from frame_io import write_rows  # noqa: E402
+
+# Streaming versions of the flatteners in xmltoexcel.py, xmltoexcel1.py and
+# xmltoexcel2.py. The document is read with iterparse and every element is
+# dropped as soon as it closes, so memory stays bounded however large the
+# file is, while the rows/records match parse_node and parse_element exactly.
+
+
+def iter_events(xml_file):
+    """iterparse start/end events, discarding each element once it has closed"""
+    stack = []
+    for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            yield event, elem
+        else:
+            yield event, elem
+            stack.pop()
+            elem.clear()
+            if stack:
+                # Earlier siblings are already gone, so this is the first child
+                stack[-1].remove(elem)
+
+
+def iter_node_rows(xml_file):
+    """Yield the same rows as xmltoexcel.parse_node(root), one per leaf as it closes"""
+    frames = []  # [path, inherited attribute data, has_children]
+    for event, elem in iter_events(xml_file):
+        if event == "start":
+            if frames:
+                parent = frames[-1]
+                parent[2] = True
+                path = f"{parent[0]}/{elem.tag}" if parent[0] else elem.tag
+                data = parent[1]
+            else:
+                path, data = "", {}
+            if elem.attrib:
+                data = dict(data)
+                for attr, value in elem.attrib.items():
+                    data[f"{path}@{attr}"] = value
+            frames.append([path, data, False])
+        else:
+            path, data, has_children = frames.pop()
+            if not has_children and elem.text and elem.text.strip():
+                row = dict(data)
+                row[path] = elem.text.strip()
+                yield row
+
+
+class ElementFlattener:
+    """Streaming twin of parse_element: feed it start/end events, read .data
+
+    indexed=True follows xmltoexcel1 (attributes before text, repeated tags
+    numbered as tag[2], tag[3]...); indexed=False follows xmltoexcel2 (text
+    before attributes, no numbering). Keys for which skip(key) is true are
+    not stored.
+    """
+
+    def __init__(self, indexed=False, skip=None):
+        self.indexed = indexed
+        self.skip = skip
+        self.data = {}
+        self.frames = []  # [current_path, tag_counts, element, pending]
+
+    def _store(self, key, value):
+        if self.skip is None or not self.skip(key):
+            self.data[key] = value
+
+    def _flush(self, frame):
+        # Text is complete once the first child starts or the element ends
+        if not frame[3]:
+            return
+        frame[3] = False
+        current_path, _, elem, _ = frame
+        text = elem.text.strip() if elem.text else ""
+        if not self.indexed and text:
+            self._store(f"{current_path}/text", text)
+        for attr, value in elem.attrib.items():
+            self._store(f"{current_path}/@{attr}", value)
+        if self.indexed and text:
+            self._store(f"{current_path}/text", text)
+
+    def start(self, elem):
+        if not self.frames:
+            current_path = elem.tag
+        else:
+            parent = self.frames[-1]
+            self._flush(parent)
+            parent_path = parent[0]
+            if self.indexed:
+                counts = parent[1]
+                counts[elem.tag] = counts.get(elem.tag, 0) + 1
+                if counts[elem.tag] > 1:
+                    parent_path = f"{parent_path}/{elem.tag}[{counts[elem.tag]}]"
+                else:
+                    parent_path = f"{parent_path}/{elem.tag}"
+            current_path = f"{parent_path}/{elem.tag}"
+        self.frames.append([current_path, {}, elem, True])
+
+    def end(self, elem):
+        """Close the element; returns True when the flattener's own root has closed"""
+        frame = self.frames.pop()
+        self._flush(frame)
+        return not self.frames
+
+
+def parse_element_streaming(xml_file, indexed=False):
+    """Same dict as parse_element(root, "", {}) from xmltoexcel2 (or xmltoexcel1 when indexed)"""
+    flattener = ElementFlattener(indexed=indexed)
+    for event, elem in iter_events(xml_file):
+        if event == "start":
+            flattener.start(elem)
+        else:
+            flattener.end(elem)
+    return flattener.data
+
+
+def iter_tree_events(element):
+    """start/end events for an already parsed tree, in the order iterparse gives them"""
+    yield "start", element
+    for child in element:
+        yield from iter_tree_events(child)
+    yield "end", element
+
+
+def iter_repeat_items(events, header, repeat_tag="Q3_cropping"):
+    """Feed events to the header flattener and yield each repeat instance's data in start order
+
+    The header flattener is complete once the generator is exhausted.
+    """
+    open_items = []  # [sequence, flattener]
+    finished = {}
+    sequence = 0
+    next_out = 0
+    depth = 0
+    for event, elem in events:
+        if event == "start":
+            header.start(elem)
+            for _, item in open_items:
+                item.start(elem)
+            # Repeat instances below the root, in document order like findall('.//tag')
+            if depth > 0 and elem.tag == repeat_tag:
+                item = ElementFlattener(indexed=True)
+                item.start(elem)
+                open_items.append([sequence, item])
+                sequence += 1
+            depth += 1
+        else:
+            depth -= 1
+            header.end(elem)
+            still_open = []
+            for number, item in open_items:
+                if item.end(elem):
+                    finished[number] = item.data
+                else:
+                    still_open.append([number, item])
+            open_items = still_open
+            # Nested repeats close inner-first; release them in start order
+            while next_out in finished:
+                yield finished.pop(next_out)
+                next_out += 1
+
+
+def header_flattener(repeat_tag="Q3_cropping"):
+    return ElementFlattener(indexed=True, skip=lambda key: repeat_tag in key)
+
+
+def tree_records(root, repeat_tag="Q3_cropping"):
+    """Same records as xmltoexcel1.process_xml_file, from a single walk over the parsed tree"""
+    header = header_flattener(repeat_tag)
+    items = list(iter_repeat_items(iter_tree_events(root), header, repeat_tag))
+    if not items:
+        return [header.data]
+    return [{**header.data, **items[0]}] + items[1:]
+
+
+def iter_process_xml_file(xml_file, repeat_tag="Q3_cropping"):
+    """Yield the same records as xmltoexcel1.process_xml_file, without building the tree
+
+    Each repeat instance is flattened while it is read and spooled to a
+    temporary file once it closes, because the first record also needs the
+    header fields that may come after the repeats.
+    """
+    header = header_flattener(repeat_tag)
+    first_item = None
+    spooled = 0
+
+    with tempfile.TemporaryFile() as spool:
+        for data in iter_repeat_items(iter_events(xml_file), header, repeat_tag):
+            if first_item is None:
+                first_item = data
+            else:
+                pickle.dump(data, spool)
+                spooled += 1
+
+        if first_item is None:
+            yield header.data
+            return
+        yield {**header.data, **first_item}
+        spool.seek(0)
+        for _ in range(spooled):
+            yield pickle.load(spool)
+
+
+def compact_rows(rows, keep_columns=2):
+    """xmltoexcel.shift_and_truncate_sheet on plain rows (None for an empty cell)
+
+    Only the non-empty values and the first keep_columns cells of each row are held.
+    """
+    lead = []
+    tails = None
+    for row in rows:
+        if tails is None:
+            tails = [[] for _ in row[keep_columns:]]
+        lead.append(row[:keep_columns])
+        for column, value in zip(tails, row[keep_columns:]):
+            if value is not None:
+                column.append(value)
+    if not tails:
+        return []
+    keep = max(len(column) for column in tails)
+    return [lead[r] + [column[r] if r < len(column) else None for column in tails] for r in range(keep)]
+
+
+def odk_xml_to_excel_streaming(xml_file, excel_file, compact=False):
+    """Streaming odk_xml_to_excel: two bounded passes, the second writes rows as they are read"""
+    try:
+        # First pass only collects the columns, in the order pandas would give them
+        columns = {}
+        for row in iter_node_rows(xml_file):
+            for key in row:
+                columns.setdefault(key, len(columns))
+
+        paths = list(columns)
+        header = [col.split("/")[-1] for col in paths]
+        rows = ([row.get(path) for path in paths] for row in iter_node_rows(xml_file))
+        if compact:
+            rows = compact_rows(rows)
+        write_rows(excel_file, header, rows)
+        print(f"Successfully converted to {excel_file}")
+        return True
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return False
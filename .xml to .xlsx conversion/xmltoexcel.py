@@ -1,9 +1,24 @@
 
 import os
+import sys
+import argparse
+import numpy as np
 import pandas as pd
 import xml.etree.ElementTree as ET
 from collections import defaultdict
 import openpyxl
+from xml_streaming import odk_xml_to_excel_streaming
+from columnar import node_rows_columnar
+from parallel_convert import parallel_map
+from incremental import Manifest, remove_files
+from normalized import normalize_xml_folder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xlsx_stream import StackedRows  # noqa: E402
+from frame_io import FORMATS, file_format, read_frame, write_frame  # noqa: E402
+from instrumentation import add_arguments, count, file_sizes, instrumented, session  # noqa: E402
+from submission_store import SubmissionStore, store_submissions  # noqa: E402
 
 # ----------------------- Step 1: Convert XML to Excel -----------------------
 def parse_node(node, path="", parent_data=None):
@@ -31,34 +46,66 @@ def parse_node(node, path="", parent_data=None):
     
     return results
 
-def odk_xml_to_excel(xml_file, excel_file):
+def odk_xml_to_excel(xml_file, excel_file, compact=False):
     try:
         tree = ET.parse(xml_file)
         root = tree.getroot()
         
-        all_data = parse_node(root)
-        
-        df = pd.DataFrame(all_data)
+        # Same frame as pd.DataFrame(parse_node(root)), built column by column
+        df = node_rows_columnar(root).to_frame()
         
         # Clean column names (remove path prefixes)
         df.columns = [col.split("/")[-1] for col in df.columns]
         
-        df.to_excel(excel_file, index=False, engine='openpyxl')
+        if compact:
+            # Step 2 done here, so the gap-free sheet is written once
+            df = compact_gaps(df)
+        
+        # .xlsx, or .parquet/.feather when the stages exchange columnar files
+        write_frame(df, excel_file)
         print(f"Successfully converted to {excel_file}")
+        return True
         
     except Exception as e:
         print(f"Error: {str(e)}")
+        return False
 
-def convert_xml_folder(input_folder, output_folder):
+def xml_jobs(input_folder, output_folder):
+    """(xml_file, output_folder) for every XML file in input_folder, in name order"""
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
     
-    for file_name in os.listdir(input_folder):
-        if file_name.lower().endswith(".xml"):
-            xml_file = os.path.join(input_folder, file_name)
-            excel_file = os.path.join(output_folder, f"{os.path.splitext(file_name)[0]}.xlsx")
-            print(f"Converting '{xml_file}' to '{excel_file}'...")
-            odk_xml_to_excel(xml_file, excel_file)
+    return [(os.path.join(input_folder, file_name), output_folder)
+            for file_name in sorted(os.listdir(input_folder))
+            if file_name.lower().endswith(".xml")]
+
+def convert_job(job, streaming=False, compact=False, fmt="xlsx"):
+    """Convert one (xml_file, output_folder) job; returns the file written, or None if it failed"""
+    xml_file, output_folder = job
+    file_name = os.path.basename(xml_file)
+    excel_file = os.path.join(output_folder, f"{os.path.splitext(file_name)[0]}{FORMATS[fmt]}")
+    print(f"Converting '{xml_file}' to '{excel_file}'...")
+    if streaming:
+        # Bounded memory for very large XML files
+        converted = odk_xml_to_excel_streaming(xml_file, excel_file, compact=compact)
+    else:
+        converted = odk_xml_to_excel(xml_file, excel_file, compact=compact)
+    return excel_file if converted else None
+
+def convert_xml_folder(input_folder, output_folder, streaming=False, workers=1, compact=False, fmt="xlsx"):
+    convert_xml_folders([(input_folder, output_folder)], streaming, workers, compact, fmt)
+
+@instrumented("xmltoexcel.convert_xml_folders")
+def convert_xml_folders(folders, streaming=False, workers=1, compact=False, fmt="xlsx"):
+    """Step 1 for several (input_folder, output_folder) pairs; all their files share one process pool
+
+    With compact=True the sheets are written with Step 2 already applied.
+    fmt is the format of the files written (xlsx, parquet or feather).
+    """
+    jobs = [job for input_folder, output_folder in folders for job in xml_jobs(input_folder, output_folder)]
+    converted = parallel_map(convert_job, jobs, workers, args=(streaming, compact, fmt))
+    done = [xml_file for (xml_file, _), excel_file in zip(jobs, converted) if excel_file is not None]
+    count(files=len(done), bytes=file_sizes(done), errors=len(jobs) - len(done))
 
 # ----------------------- Step 2: Process Excel Sheets -----------------------
 def shift_and_truncate_sheet(ws):
@@ -88,6 +135,27 @@ def shift_and_truncate_sheet(ws):
         for row in range(max_data_row + 1, max_row + 1):
             ws.cell(row=row, column=col).value = None
 
+def compact_gaps(df):
+    """shift_and_truncate_sheet as column operations on the DataFrame before it is written
+
+    From the third column on, the non-empty values of each column move up
+    (keeping their order) and the rest is emptied; the first two columns are
+    cut at the last row that still has data. Gives the same cells Step 2 gives.
+    """
+    values = df.to_numpy(dtype=object, copy=True)
+    keep = 0
+    if values.shape[1] > 2:
+        tail = values[:, 2:]
+        present = pd.notna(tail)
+        # A stable sort on "is empty" moves the values up without reordering them
+        order = np.argsort(~present, axis=0, kind="stable")
+        tail = np.take_along_axis(tail, order, axis=0)
+        counts = present.sum(axis=0)
+        tail[np.arange(len(values))[:, None] >= counts] = np.nan
+        values[:, 2:] = tail
+        keep = int(counts.max())
+    return pd.DataFrame(values[:keep], columns=df.columns)
+
 def process_workbook(input_file_path, output_file_path):
     wb = openpyxl.load_workbook(input_file_path)
     
@@ -96,72 +164,251 @@ def process_workbook(input_file_path, output_file_path):
     
     wb.save(output_file_path)
 
-def process_folder(input_folder, output_folder):
+def process_frame_file(input_file_path, output_file_path):
+    # A columnar file holds the values exactly as Step 1 wrote them, so the
+    # gaps are removed on the DataFrame, which gives the same cells
+    df = read_frame(input_file_path, excel_types=False)
+    write_frame(compact_gaps(df), output_file_path)
+
+def process_file(input_file_path, output_file_path, fmt="xlsx"):
+    if fmt == "xlsx":
+        process_workbook(input_file_path, output_file_path)
+    else:
+        process_frame_file(input_file_path, output_file_path)
+
+@instrumented("xmltoexcel.process_folder")
+def process_folder(input_folder, output_folder, fmt="xlsx"):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
     
     for file_name in os.listdir(input_folder):
-        if file_name.lower().endswith(".xlsx"):
+        if file_name.lower().endswith(FORMATS[fmt]):
             input_file_path = os.path.join(input_folder, file_name)
             output_file_path = os.path.join(output_folder, file_name)
             print(f"Processing: {input_file_path} -> {output_file_path}")
-            process_workbook(input_file_path, output_file_path)
+            process_file(input_file_path, output_file_path, fmt)
+            count(files=1, bytes=os.path.getsize(input_file_path))
     
     print("All files processed successfully!")
 
 # ----------------------- Step 3: Combine All Excel Sheets -----------------------
-def combine_excels(folder_path, combined_file):
-    combined_data = pd.DataFrame()
-    header_included = False
-
-    for file in os.listdir(folder_path):
-        if file.endswith('.xlsx') or file.endswith('.xls'):
-            file_path = os.path.join(folder_path, file)
-            
-            try:
-                # Read the Excel file
-                df = pd.read_excel(file_path)
+@instrumented("xmltoexcel.combine_excels")
+def combine_excels(folder_path, combined_file, cache=True):
+    # Each file is read once and its rows are spooled; the result is written
+    # row by row at the end, moving on to a new sheet past Excel's row limit.
+    # A .parquet/.feather combined_file is written from one pd.concat instead.
+    # Files unchanged since an earlier run are read from the cache (frame_cache.py).
+    columnar = file_format(combined_file) != "xlsx"
+    frames = []
+    with StackedRows() as combined_data:
+        for file in sorted(os.listdir(folder_path)):
+            if file.lower().endswith(('.xlsx', '.xls', '.parquet', '.feather')):
+                file_path = os.path.join(folder_path, file)
                 
-                # If header is not included, add it
-                if not header_included:
-                    combined_data = pd.concat([combined_data, df], ignore_index=True)
-                    header_included = True
-                else:
-                    # Append all data rows (header is already excluded by pd.read_excel)
-                    combined_data = pd.concat([combined_data, df], ignore_index=True)
+                try:
+                    # Read the file (header is already excluded from the rows);
+                    # columnar files are typed the way pd.read_excel types a sheet
+                    df = read_frame(file_path, cache=cache)
+                    count(files=1, bytes=os.path.getsize(file_path), rows=len(df))
+                    if columnar:
+                        frames.append(df)
+                    else:
+                        combined_data.add_frame(df)
+                    
+                    print(f"Data from '{file}' added successfully.")
+                
+                except Exception as e:
+                    print(f"Failed to read '{file}': {e}")
 
-                print(f"Data from '{file}' added successfully.")
-            
-            except Exception as e:
-                print(f"Failed to read '{file}': {e}")
+        # Save combined data to a new file
+        if not columnar:
+            combined_data.write(combined_file)
+        elif frames:
+            write_frame(pd.concat(frames, ignore_index=True), combined_file)
+        else:
+            write_frame(pd.DataFrame(), combined_file)
 
-    # Save combined data to a new Excel file
-    combined_data.to_excel(combined_file, index=False)
+@instrumented("xmltoexcel.store_sheets")
+def store_sheets(folder_path, store, xml_folder, cache=True):
+    """Step 3 into a submission store (submission_store.py) instead of a combined file
+
+    Each processed sheet becomes the submission of the XML file of the same
+    name in xml_folder, and the store's submissions of that form are replaced.
+    """
+    def sheets():
+        for file in sorted(os.listdir(folder_path)):
+            if file.lower().endswith(('.xlsx', '.xls', '.parquet', '.feather')):
+                file_path = os.path.join(folder_path, file)
+                try:
+                    df = read_frame(file_path, cache=cache)
+                except Exception as e:
+                    print(f"Failed to read '{file}': {e}")
+                    continue
+                count(files=1, bytes=os.path.getsize(file_path), rows=len(df))
+                yield f"{os.path.splitext(file)[0]}.xml", list(df.columns), list(df.itertuples(index=False, name=None))
+
+    return store_submissions(store, xml_folder, sheets())
+
+
+
+# ----------------------- Incremental Runs -----------------------
+@instrumented("xmltoexcel.update_project")
+def update_project(input_folder, output_folder, processed_folder, combined_file, streaming=False, workers=1,
+                   compact=False, fmt="xlsx", store=None):
+    """Steps 1-3 for only the XML files that are new or changed since the last run
+
+    A manifest in output_folder records every XML file and keeps the rows of its
+    processed sheet, so the combined file is rebuilt without reading the sheets
+    of unchanged files again. Outputs of XML files that are gone are deleted.
+    With store (a submission_store.SubmissionStore) the changed submissions are
+    written to the store instead, and no combined file is made.
+
+    Returns the number of XML files that failed to convert or process.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    os.makedirs(processed_folder, exist_ok=True)
+    # With compact the sheets go straight to the processed folder, as in a full run
+    target_folder = processed_folder if compact else output_folder
+    xml_files = [xml_file for xml_file, _ in xml_jobs(input_folder, target_folder)]
+    
+    manifest = Manifest(output_folder, {"converter": "xmltoexcel", "format": fmt, "compact": compact})
+    changed, removed = manifest.scan(xml_files)
+    print(f"{len(changed)} new or changed, {len(xml_files) - len(changed)} unchanged, {len(removed)} removed XML files")
+    for name in removed:
+        print(f"Removing the outputs of '{name}'")
+        remove_files(manifest.forget(name))
+    
+    converted = parallel_map(convert_job, [(xml_file, target_folder) for xml_file in changed], workers,
+                             args=(streaming, compact, fmt))
+    failed = 0
+    for xml_file, excel_file in zip(changed, converted):
+        if excel_file is None:
+            # Not recorded, so it is tried again on the next run
+            failed += 1
+            count(errors=1)
+            continue
+        count(files=1, bytes=os.path.getsize(xml_file))
+        outputs = [excel_file]
+        processed_file = excel_file
+        try:
+            if not compact:
+                processed_file = os.path.join(processed_folder, os.path.basename(excel_file))
+                print(f"Processing: {excel_file} -> {processed_file}")
+                process_file(excel_file, processed_file, fmt)
+                outputs.append(processed_file)
+            
+            # Read once here; later runs take the rows from the manifest, so it is not cached
+            df = read_frame(processed_file, cache=False)
+            manifest.record(xml_file, outputs, (list(df.columns), list(df.itertuples(index=False, name=None))))
+        except Exception as e:
+            print(f"Failed to process '{processed_file}': {e}")
+            failed += 1
+    
+    if store is not None:
+        store_submissions(store, input_folder, ((name, columns, rows) for name, (columns, rows) in manifest.results()),
+                          changed=[os.path.basename(xml_file) for xml_file in changed])
+        manifest.save()
+        return failed
+    
+    with StackedRows() as combined_data:
+        for _, (columns, rows) in manifest.results():
+            combined_data.add_rows(columns, rows)
+        
+        if file_format(combined_file) == "xlsx":
+            combined_data.write(combined_file)
+        else:
+            write_frame(combined_data.to_frame(), combined_file)
+    manifest.save()
+    count(rows=combined_data.count)
+    print(f"Combined {combined_data.count} rows into '{combined_file}'")
+    return failed
 
 
 
 # ----------------------- Step 4: Run All Steps -----------------------
 if __name__ == "__main__":
 
-    # Paths
-    for i in range (6,14):
+    parser = argparse.ArgumentParser(description="Convert ODK XML files to Excel, remove gaps and combine")
+    parser.add_argument("--streaming", action="store_true",
+                        help="parse XML files with iterparse so memory stays bounded for very large files")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="convert XML files in a pool of this many processes, across all project folders")
+    parser.add_argument("--compact", action="store_true",
+                        help="remove the gaps while converting and write straight to the processed folder (skips Step 2)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="xlsx",
+                        help="file format the steps hand to each other, including the combined result "
+                             "(parquet/feather are much faster to read back than xlsx)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="convert only new or changed XML files (tracked in a manifest in each output folder) "
+                             "and rebuild the combined result from the stored rows")
+    parser.add_argument("--normalized", action="store_true",
+                        help="write a submissions table plus one table per repeat group, linked by KEY/PARENT_KEY, "
+                             "to normalized.xlsx in each output folder instead of Steps 1-3")
+    parser.add_argument("--typed", action="store_true",
+                        help="with --normalized, store numbers, booleans, dates and repeated values as compact types "
+                             "instead of text (Steps 1-3 read the sheets back typed already)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always parse the processed sheets in Step 3, even unchanged ones in .frame_cache")
+    parser.add_argument("--store", metavar="DATABASE",
+                        help="write each project's submissions to this SQLite submission store (submission_store.py) "
+                             "in Step 3 instead of a combined result file")
+    add_arguments(parser)
+    args = parser.parse_args()
 
-        # os.makedirs(f"S:\\Downloads\\processed_Outputs_of_path{i}", exist_ok=True)
+    store = SubmissionStore(args.store) if args.store else None
+    with session(args.report, args.profile):
+        # Paths
+        projects = []
+        for i in range (6,14):
 
-        input_folder = f"S:\\Desktop\\path{i}"   # Folder containing XML files
-        xml_to_excel_output = f"{input_folder}\\Outputs_of_path{i}"     # Output folder for XML to Excel
+            # os.makedirs(f"S:\\Downloads\\processed_Outputs_of_path{i}", exist_ok=True)
+
+            input_folder = f"S:\\Desktop\\path{i}"   # Folder containing XML files
+            xml_to_excel_output = f"{input_folder}\\Outputs_of_path{i}"     # Output folder for XML to Excel
         
-        processed_folder = f"{input_folder}\\processed_Outputs_of_path{i}" # Output folder for processed Excel files - removing gap
-        combined_file = f"{xml_to_excel_output}\\combined result.xlsx" # Final combined  combined
+            processed_folder = f"{input_folder}\\processed_Outputs_of_path{i}" # Output folder for processed Excel files - removing gap
+            combined_file = f"{xml_to_excel_output}\\combined result{FORMATS[args.format]}" # Final combined  combined
+            projects.append((input_folder, xml_to_excel_output, processed_folder, combined_file))
+
+        if args.normalized:
+            # No row per leaf: each repeat instance is stored once, in its repeat group's table
+            for input_folder, xml_to_excel_output, _, _ in projects:
+                print(f"\n=== Normalizing {input_folder} ===")
+                normalize_xml_folder(input_folder, xml_to_excel_output, streaming=args.streaming, workers=args.workers,
+                                     fmt=args.format, typed=args.typed)
+        elif args.incremental:
+            # Only new or changed XML files go through Steps 1 and 2; each project keeps its manifest
+            for input_folder, xml_to_excel_output, processed_folder, combined_file in projects:
+                print(f"\n=== Updating {input_folder} ===")
+                update_project(input_folder, xml_to_excel_output, processed_folder, combined_file, streaming=args.streaming,
+                               workers=args.workers, compact=args.compact, fmt=args.format, store=store)
+        else:
+            # Step 1 for every project folder at once, so the pool is never waiting on one small folder
+            print("\n=== Step 1: Converting XML to Excel ===")
+            if args.compact:
+                # Sheets come out of Step 1 already compacted, so they go straight to the processed folder
+                convert_xml_folders([(input_folder, processed_folder) for input_folder, _, processed_folder, _ in projects],
+                                    streaming=args.streaming, workers=args.workers, compact=True, fmt=args.format)
+            else:
+                convert_xml_folders([(input_folder, xml_to_excel_output) for input_folder, xml_to_excel_output, _, _ in projects],
+                                    streaming=args.streaming, workers=args.workers, fmt=args.format)
 
-        print("\n=== Step 1: Converting XML to Excel ===")
-        convert_xml_folder(input_folder, xml_to_excel_output)
+            for input_folder, xml_to_excel_output, processed_folder, combined_file in projects:
 
-        print("\n=== Step 2: Processing Excel Files ===")
-        process_folder(xml_to_excel_output, processed_folder)
+                if args.compact:
+                    # Nothing was written here in Step 1, but the combined file still goes here
+                    os.makedirs(xml_to_excel_output, exist_ok=True)
+                else:
+                    print("\n=== Step 2: Processing Excel Files ===")
+                    process_folder(xml_to_excel_output, processed_folder, fmt=args.format)
 
-        print("\n=== Step 3: Combining Excel Files ===")
-        combine_excels(processed_folder, combined_file)
+                print("\n=== Step 3: Combining Excel Files ===")
+                if store is not None:
+                    store_sheets(processed_folder, store, input_folder, cache=not args.no_cache)
+                else:
+                    combine_excels(processed_folder, combined_file, cache=not args.no_cache)
 
-        print("\n=== All Steps Completed Successfully! ===")
+                print("\n=== All Steps Completed Successfully! ===")
 
+    if store is not None:
+        store.close()
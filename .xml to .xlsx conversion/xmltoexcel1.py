@@ -1,8 +1,23 @@
 import os
+import sys
 import glob
+import argparse
 import xml.etree.ElementTree as ET
 import pandas as pd
 from datetime import datetime
+from xml_streaming import iter_process_xml_file, tree_records
+from columnar import ColumnarBuilder
+from form_plan import default_plan_file, load_plan
+from parallel_convert import parallel_map
+from incremental import Manifest, remove_files
+from normalized import normalize_xml_folder
+from compact_types import compact_frame, plan_types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_io import FORMATS, write_frame  # noqa: E402
+from instrumentation import add_arguments, count, instrumented, session  # noqa: E402
+from submission_store import SubmissionStore, records_layout, store_submissions  # noqa: E402
 
 def parse_element(element, parent_path, data_dict):
     """Parse XML elements with proper path construction"""
@@ -29,105 +44,236 @@ def process_xml_file(xml_file):
     """Process XML file and separate header data from repeating elements"""
     tree = ET.parse(xml_file)
     root = tree.getroot()
-    
-    # First parse to get all data
-    full_data = {}
-    parse_element(root, "", full_data)
-    
-    # Separate header data (non-repeating elements)
-    header_data = {k: v for k, v in full_data.items() if "Q3_cropping" not in k}
-    
-    # Process repeating Q3_cropping elements
-    line_items = []
-    for crop in root.findall('.//Q3_cropping'):
-        item_data = {}
-        parse_element(crop, "", item_data)
-        line_items.append(item_data)
-    
-    # Create records with header only in first row
-    records = []
-    if line_items:
-        # First record combines header + first line item
-        records.append({**header_data, **line_items[0]})
-        # Subsequent records contain only line items
-        records.extend(line_items[1:])
-    else:
-        # If no line items, just use header data
-        records.append(header_data)
-    
-    return records
 
-def convert_xml_folder(input_folder, output_folder):
-    """Convert XML files with proper header/lineitem separation"""
+    # One walk fills the header data (keys without Q3_cropping) and every
+    # Q3_cropping line item, the same as parse_element on the root and then
+    # again on each Q3_cropping node. The header goes only in the first record.
+    return tree_records(root, "Q3_cropping")
+
+def read_records(xml_file, streaming=False):
+    # Streaming yields the same records with iterparse, without holding the whole tree
+    if streaming:
+        return iter_process_xml_file(xml_file)
+    return process_xml_file(xml_file)
+
+def read_columns(xml_file, streaming=False):
+    """First-pass task: (column keys, None) for one file, or (None, error message)"""
+    try:
+        keys = {}
+        for record in read_records(xml_file, streaming):
+            keys.update(dict.fromkeys(record))
+        return list(keys), None
+    except Exception as e:
+        return None, str(e)
+
+def convert_file(xml_file, output_folder, columns, streaming=False, fmt="xlsx", types=None):
+    """Second-pass task: write one file's Excel sheet
+
+    types ({column: XForm type}) types the columns with compact_types; None keeps them as text.
+    Returns ((records, file written), None) or (None, error message).
+    """
+    try:
+        # The records are returned for the combined results, so they are all kept
+        records = list(read_records(xml_file, streaming))
+        
+        # Create DataFrame with consistent columns (plus any path the plan did not know yet)
+        df = pd.DataFrame(records, columns=sorted(set(columns).union(*records)))
+        if types is not None:
+            df = compact_frame(df, types)
+        
+        # Save individual file
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base_name = os.path.basename(xml_file).replace('.xml', '')
+        output_file = os.path.join(output_folder, f"{base_name}_{timestamp}{FORMATS[fmt]}")
+        write_frame(df, output_file)
+        return (records, output_file), None
+    except Exception as e:
+        return None, str(e)
+
+@instrumented("xmltoexcel1.convert_xml_folder")
+def convert_xml_folder(input_folder, output_folder, streaming=False, form_file=None, plan_file=None, workers=1, fmt="xlsx",
+                       incremental=False, normalized=False, typed=False, store=None):
+    """Convert XML files with proper header/lineitem separation
+
+    With form_file (an XForm) the columns come from its
+    cached flattening plan and every file is parsed only once. workers > 1
+    spreads the files over a process pool; results are merged in file order.
+    fmt (xlsx, parquet or feather) is the format of every file written.
+
+    With incremental only files that are new or changed since the last run are
+    converted (their previous output is replaced), and the combined results are
+    rebuilt from the records the manifest in output_folder kept of the others.
+
+    With normalized the files are written as a submissions table plus one table
+    per repeat group (normalized.py) instead of the Q3_cropping line items; the
+    form's repeats, if form_file is given, are used along with the ones found.
+
+    With typed every column is stored as numbers, booleans, dates or categories
+    where its values allow it (compact_types.py), following the form's field
+    types when form_file is given.
+
+    With store (a submission_store.SubmissionStore) every file's records go to
+    the store as its submission instead of into the combined results file.
+
+    Returns the number of XML files that failed to convert.
+    """
     os.makedirs(output_folder, exist_ok=True)
-    xml_files = glob.glob(os.path.join(input_folder, "*.xml"))
+    xml_files = sorted(glob.glob(os.path.join(input_folder, "*.xml")))
     
     if not xml_files:
         print(f" No XML files found in {input_folder}")
-        return
+        if not incremental:
+            # Leave the combined result of an earlier run alone
+            return 0
+        # Still written below: an empty combined result, and the outputs of removed files deleted
     
     all_columns = set()
-    all_records = []
+    converted = []
+    combined = ColumnarBuilder()
     success_count = 0
     failure_count = 0
+    plan = load_plan(form_file, "indexed", plan_file) if form_file else None
+    if normalized:
+        repeats = [nodeset.strip("/") for nodeset in plan.repeats] if plan is not None else ()
+        return normalize_xml_folder(input_folder, output_folder, repeats, streaming, workers, fmt, typed=typed,
+                                    binds=plan.binds if plan is not None else None)
+    types = plan_types(plan) if typed else None
     
-    # First pass: Discover all columns
-    for xml_file in xml_files:
-        try:
-            records = process_xml_file(xml_file)
-            for record in records:
-                all_columns.update(record.keys())
-        except Exception as e:
-            print(f" Column discovery failed for {os.path.basename(xml_file)}: {str(e)}")
+    settings = {"converter": "xmltoexcel1", "format": fmt, "form": form_file}
+    if typed:
+        settings["typed"] = True
+    manifest = Manifest(output_folder, settings) if incremental else None
+    
+    if manifest is not None:
+        xml_files, removed = manifest.scan(xml_files)
+        print(f" {len(xml_files)} new or changed files, {len(removed)} removed")
+        for name in removed:
+            remove_files(manifest.forget(name))
+        # Incremental runs start from the columns of the files converted before
+        all_columns = set(manifest.columns)
+    
+    if plan is None:
+        # First pass: Discover all columns
+        for xml_file, (keys, error) in zip(xml_files, parallel_map(read_columns, xml_files, workers, args=(streaming,))):
+            if error is not None:
+                print(f" Column discovery failed for {os.path.basename(xml_file)}: {error}")
+                continue
+            all_columns.update(keys)
+    else:
+        all_columns = plan.columns
     
     # Convert to sorted list for consistent ordering
     columns = sorted(all_columns)
     
     # Second pass: Process files
-    for xml_file in xml_files:
-        try:
-            records = process_xml_file(xml_file)
-            
-            # Create DataFrame with consistent columns
-            df = pd.DataFrame(records, columns=columns)
-            
-            # Save individual file
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            base_name = os.path.basename(xml_file).replace('.xml', '')
-            output_file = os.path.join(output_folder, f"{base_name}_{timestamp}.xlsx")
-            df.to_excel(output_file, index=False)
-            
-            all_records.extend(records)
-            success_count += 1
-            print(f" Converted: {os.path.basename(xml_file)}")
-            
-        except Exception as e:
+    results = parallel_map(convert_file, xml_files, workers, args=(output_folder, columns, streaming, fmt, types))
+    for xml_file, (result, error) in zip(xml_files, results):
+        if error is not None:
             failure_count += 1
-            print(f" Failed: {os.path.basename(xml_file)} - {str(e)}")
+            print(f" Failed: {os.path.basename(xml_file)} - {error}")
+            count(errors=1)
+            continue
+        records, output_file = result
+        if plan is not None and sum(plan.add(record) for record in records):
+            print(f" New columns from {os.path.basename(xml_file)} added to the plan")
+            columns = sorted(plan.columns)
+        
+        if manifest is not None:
+            for record in records:
+                manifest.add_columns(record)
+            manifest.record(xml_file, [output_file], records)
+        elif store is not None:
+            converted.append((os.path.basename(xml_file), records))
+        else:
+            for record in records:
+                combined.add_record(record)
+        success_count += 1
+        count(files=1, bytes=os.path.getsize(xml_file))
+        print(f" Converted: {os.path.basename(xml_file)}")
+    
+    if manifest is not None:
+        # Every file still in the folder, from the manifest
+        live_columns = set()
+        for name, records in manifest.results():
+            if store is not None:
+                converted.append((name, records))
+            for record in records:
+                if store is None:
+                    combined.add_record(record)
+                live_columns.update(record)
+        if plan is None:
+            columns = sorted(live_columns)
     
-    # Save combined results
-    if all_records:
-        combined_df = pd.DataFrame(all_records, columns=columns)
-        combined_file = os.path.join(output_folder, "combined_results.xlsx")
-        combined_df.to_excel(combined_file, index=False)
+    if store is not None:
+        changed = [os.path.basename(xml_file) for xml_file in xml_files] if manifest is not None else None
+        store_submissions(store, input_folder, ((name, *records_layout(records)) for name, records in converted),
+                          columns=columns, changed=changed)
+    
+    # Save combined results, even with no rows, so it never shows files that are gone
+    if store is None:
+        combined_df = combined.to_frame(columns=columns)
+        if types is not None:
+            combined_df = compact_frame(combined_df, types)
+        combined_file = os.path.join(output_folder, f"combined_results{FORMATS[fmt]}")
+        write_frame(combined_df, combined_file)
+        count(rows=len(combined_df))
         print(f"\n Combined results saved to: {combined_file}")
     
+    if plan is not None and plan.changed:
+        plan.save(plan_file or default_plan_file(form_file, "indexed"))
+    if manifest is not None:
+        manifest.save()
+    
     print(f"\n Conversion Summary:")
     print(f"Success: {success_count} files")
     print(f"Failed: {failure_count} files")
+    return failure_count
 
 
 # Example usage
 if __name__ == "__main__":
-    INPUT_FOLDER = "S:\Desktop\path1"
-    OUTPUT_FOLDER = f"{INPUT_FOLDER}/Outputs_of path1"
+    parser = argparse.ArgumentParser(description="Convert ODK XML files with header/line-item separation")
+    parser.add_argument("--streaming", action="store_true",
+                        help="parse XML files with iterparse instead of building the whole tree; the column "
+                             "pass stays bounded, but each file's records are still kept for its sheet and "
+                             "the combined results")
+    parser.add_argument("--form", help="XForm (.xml) to take the columns from "
+                                       "instead of scanning every file first")
+    parser.add_argument("--plan", help="where to cache the compiled plan (default: next to the form)")
+    parser.add_argument("--workers", type=int, default=1, help="convert files in a pool of this many processes")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="xlsx",
+                        help="format of the per-file and combined outputs (xlsx, or parquet/feather for the next stage)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="convert only new or changed files, tracked in a manifest in the output folder")
+    parser.add_argument("--normalized", action="store_true",
+                        help="write a submissions table plus one table per repeat group, linked by KEY/PARENT_KEY, "
+                             "instead of copying the header into every line item")
+    parser.add_argument("--typed", action="store_true",
+                        help="store numbers, booleans, dates and repeated values as compact types instead of text "
+                             "(the --form field types are used when given)")
+    parser.add_argument("--store", metavar="DATABASE",
+                        help="write every file's records to this SQLite submission store (submission_store.py) "
+                             "instead of the combined results file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    store = SubmissionStore(args.store) if args.store else None
+    with session(args.report, args.profile):
+        INPUT_FOLDER = "S:\Desktop\path1"
+        OUTPUT_FOLDER = f"{INPUT_FOLDER}/Outputs_of path1"
     
-    print(" Starting XML conversion with header/lineitem separation...")
-    convert_xml_folder(INPUT_FOLDER, OUTPUT_FOLDER)
+        print(" Starting XML conversion with header/lineitem separation...")
+        convert_xml_folder(INPUT_FOLDER, OUTPUT_FOLDER, streaming=args.streaming, form_file=args.form, plan_file=args.plan,
+                           workers=args.workers, fmt=args.format, incremental=args.incremental,
+                           normalized=args.normalized, typed=args.typed, store=store)
 
-    INPUT_FOLDER = "S:\Desktop\path2"
-    OUTPUT_FOLDER = f"{INPUT_FOLDER}/Outputs_of path2"
+        INPUT_FOLDER = "S:\Desktop\path2"
+        OUTPUT_FOLDER = f"{INPUT_FOLDER}/Outputs_of path2"
     
-    print(" Starting XML cfor path2")
-    convert_xml_folder(INPUT_FOLDER, OUTPUT_FOLDER)
+        print(" Starting XML cfor path2")
+        convert_xml_folder(INPUT_FOLDER, OUTPUT_FOLDER, streaming=args.streaming, form_file=args.form, plan_file=args.plan,
+                           workers=args.workers, fmt=args.format, incremental=args.incremental,
+                           normalized=args.normalized, typed=args.typed, store=store)
 
+    if store is not None:
+        store.close()
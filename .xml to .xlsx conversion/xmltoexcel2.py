@@ -1,8 +1,22 @@
 import os
+import sys
 import glob
+import argparse
 import xml.etree.ElementTree as ET
 import pandas as pd
 from datetime import datetime
+from xml_streaming import parse_element_streaming
+from columnar import ColumnarBuilder
+from form_plan import default_plan_file, load_plan
+from parallel_convert import parallel_map
+from incremental import Manifest, remove_files
+from compact_types import compact_frame, plan_types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_io import FORMATS, write_frame  # noqa: E402
+from instrumentation import add_arguments, count, instrumented, session  # noqa: E402
+from submission_store import SubmissionStore, records_layout, store_submissions  # noqa: E402
 
 def parse_element(element, parent_path, data_dict):
     """Recursively parse XML elements and collect data in dictionary"""
@@ -20,81 +34,221 @@ def parse_element(element, parent_path, data_dict):
     for child in element:
         parse_element(child, current_path, data_dict)
 
-def convert_xml_folder(input_folder, output_folder):
-    """Convert all XML files and create combined results"""
+def read_element_data(xml_file, streaming=False):
+    """Flatten one XML file into a {path: value} dict"""
+    if streaming:
+        return parse_element_streaming(xml_file)
+    tree = ET.parse(xml_file)
+    root = tree.getroot()
+    data_dict = {}
+    parse_element(root, "", data_dict)
+    return data_dict
+
+def read_columns(xml_file, streaming=False):
+    """First-pass task: (column keys, None) for one file, or (None, error message)"""
+    try:
+        return list(read_element_data(xml_file, streaming)), None
+    except Exception as e:
+        return None, str(e)
+
+def convert_file(xml_file, output_folder, all_columns, streaming=False, fmt="xlsx", types=None):
+    """Second-pass task: write one file's Excel sheet
+
+    types ({column: XForm type}) types the columns with compact_types; None keeps them as text.
+    Returns ((element data, file written), None) or (None, error message).
+    """
+    try:
+        element_data = read_element_data(xml_file, streaming)
+        data_dict = {col: None for col in all_columns}
+        data_dict.update(element_data)
+        
+        # Create individual Excel file
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base_name = os.path.basename(xml_file).replace('.xml', '')
+        output_file = os.path.join(output_folder, f"{base_name}_{timestamp}{FORMATS[fmt]}")
+        
+        df = pd.DataFrame([data_dict])
+        if types is not None:
+            df = compact_frame(df, types)
+        write_frame(df, output_file)
+        return (element_data, output_file), None
+    except Exception as e:
+        return None, str(e)
+
+@instrumented("xmltoexcel2.convert_xml_folder")
+def convert_xml_folder(input_folder, output_folder, streaming=False, form_file=None, plan_file=None, workers=1, fmt="xlsx",
+                       incremental=False, typed=False, store=None):
+    """Convert all XML files and create combined results
+
+    With form_file (an XForm) the columns come from its
+    cached flattening plan and every file is parsed only once. workers > 1
+    spreads the files over a process pool; results are merged in file order.
+    fmt (xlsx, parquet or feather) is the format of every file written.
+
+    With incremental only files that are new or changed since the last run are
+    converted (their previous output is replaced), and the combined results are
+    rebuilt from what the manifest in output_folder kept of the other files, with
+    the same columns in the same order as a full run. Sheets of unchanged files
+    keep the columns they were written with.
+
+    With typed every column is stored as numbers, booleans, dates or categories
+    where its values allow it (compact_types.py), following the form's field
+    types when form_file is given.
+
+    With store (a submission_store.SubmissionStore) every file's data goes to
+    the store as its submission instead of into the combined result file.
+
+    Returns the number of XML files that failed to convert.
+    """
     os.makedirs(output_folder, exist_ok=True)
-    xml_files = glob.glob(os.path.join(input_folder, "*.xml"))
+    xml_files = sorted(glob.glob(os.path.join(input_folder, "*.xml")))
     
     if not xml_files:
-        print(f" No XML files found in {INPUT_FOLDER},{input_folder}")
-        return
+        print(f" No XML files found in {input_folder}")
+        if not incremental:
+            # Leave the combined result of an earlier run alone
+            return 0
+        # Still written below: an empty combined result, and the outputs of removed files deleted
     
     success_count = 0
     failure_count = 0
-    all_data = []
-    all_columns = set()
+    combined = ColumnarBuilder()
+    converted = []
+    plan = load_plan(form_file, "element", plan_file) if form_file else None
+    types = plan_types(plan) if typed else None
+    settings = {"converter": "xmltoexcel2", "format": fmt, "form": form_file}
+    if typed:
+        settings["typed"] = True
+    manifest = Manifest(output_folder, settings) if incremental else None
 
-    # First pass: Collect all possible columns
-    for xml_file in xml_files:
-        try:
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
-            temp_dict = {}
-            parse_element(root, "", temp_dict)
-            all_columns.update(temp_dict.keys())
-        except Exception as e:
-            print(f" Column detection failed for {os.path.basename(xml_file)}: {str(e)}")
-            continue
+    if manifest is not None:
+        xml_files, removed = manifest.scan(xml_files)
+        print(f" {len(xml_files)} new or changed files, {len(removed)} removed")
+        for name in removed:
+            remove_files(manifest.forget(name))
+
+    if plan is not None:
+        # Columns are known up front; the list grows if a file has paths the form did not declare
+        all_columns = plan.columns
+    else:
+        # Incremental runs start from the columns of the files converted before. An ordered
+        # dict, not a set, so the columns come out in file order on every run
+        all_columns = dict.fromkeys(manifest.columns) if manifest is not None else {}
+
+        # First pass: Collect all possible columns
+        for xml_file, (keys, error) in zip(xml_files, parallel_map(read_columns, xml_files, workers, args=(streaming,))):
+            if error is not None:
+                print(f" Column detection failed for {os.path.basename(xml_file)}: {error}")
+                continue
+            all_columns.update(dict.fromkeys(keys))
 
     # Second pass: Process files and collect data
-    for xml_file in xml_files:
-        try:
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
-            data_dict = {col: None for col in all_columns}
-            parse_element(root, "", data_dict)
-            
-            # Create individual Excel file
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            base_name = os.path.basename(xml_file).replace('.xml', '')
-            output_file = os.path.join(output_folder, f"{base_name}_{timestamp}.xlsx")
-            
-            df = pd.DataFrame([data_dict])
-            df.to_excel(output_file, index=False)
-            all_data.append(df)
-            
-            print(f" Converted: {os.path.basename(xml_file)}")
-            success_count += 1
-            
-        except Exception as e:
-            print(f" Failed: {os.path.basename(xml_file)} - {str(e)}")
+    columns = list(all_columns)
+    results = parallel_map(convert_file, xml_files, workers, args=(output_folder, columns, streaming, fmt, types))
+    for xml_file, (result, error) in zip(xml_files, results):
+        if error is not None:
+            print(f" Failed: {os.path.basename(xml_file)} - {error}")
             failure_count += 1
+            count(errors=1)
+            continue
+        element_data, output_file = result
+        if plan is not None and plan.add(element_data):
+            print(f" New columns from {os.path.basename(xml_file)} added to the plan")
+        if manifest is not None:
+            manifest.add_columns(element_data)
+            manifest.record(xml_file, [output_file], element_data)
+        elif store is not None:
+            converted.append((os.path.basename(xml_file), element_data))
+        else:
+            data_dict = {col: None for col in columns}
+            data_dict.update(element_data)
+            combined.add_record(data_dict)
+        
+        print(f" Converted: {os.path.basename(xml_file)}")
+        success_count += 1
+        count(files=1, bytes=os.path.getsize(xml_file))
+
+    combined_columns = None
+    if manifest is not None:
+        # Every file still in the folder, from the manifest. The columns are built as in a
+        # full run: the plan's columns, then the paths in the order the files first have them
+        combined_columns = dict.fromkeys(columns) if plan is not None else {}
+        for name, element_data in manifest.results():
+            if store is not None:
+                converted.append((name, element_data))
+            else:
+                combined.add_record(element_data)
+            combined_columns.update(dict.fromkeys(element_data))
 
-    # Create combined results
-    if all_data:
+    if store is not None:
+        layout = combined_columns
+        if layout is None:
+            # As in the combined result: every column, then the paths the plan did not know yet
+            layout = dict.fromkeys(columns)
+            for _, element_data in converted:
+                layout.update(dict.fromkeys(element_data))
+        changed = [os.path.basename(xml_file) for xml_file in xml_files] if manifest is not None else None
+        store_submissions(store, input_folder,
+                          ((name, *records_layout([element_data])) for name, element_data in converted),
+                          columns=list(layout), changed=changed)
+
+    # Create combined results, even with no rows, so it never shows files that are gone
+    if store is None:
         try:
-            combined_df = pd.concat(all_data, ignore_index=True)
-            combined_file = os.path.join(output_folder, "combined result.xlsx")
+            combined_df = combined.to_frame(columns=combined_columns)
+            if types is not None:
+                combined_df = compact_frame(combined_df, types)
+            combined_file = os.path.join(output_folder, f"combined result{FORMATS[fmt]}")
             
             # Write combined file with headers
-            combined_df.to_excel(combined_file, index=False)
+            write_frame(combined_df, combined_file)
+            count(rows=len(combined_df))
             print(f"\n Combined results saved to: {combined_file}")
         except Exception as e:
             print(f"\n Failed to create combined file: {str(e)}")
-    else:
-        print("\n No data to combine")
+
+    if plan is not None and plan.changed:
+        plan.save(plan_file or default_plan_file(form_file, "element"))
+    if manifest is not None:
+        manifest.save()
 
     print(f"\n Conversion Summary:")
     print(f"Successfully converted: {success_count} files")
     print(f"Failed conversions: {failure_count} files")
+    return failure_count
 
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert ODK XML files to Excel with combined results")
+    parser.add_argument("--streaming", action="store_true",
+                        help="parse XML files with iterparse so memory stays bounded for very large files")
+    parser.add_argument("--form", help="XForm (.xml) to take the columns from "
+                                       "instead of scanning every file first")
+    parser.add_argument("--plan", help="where to cache the compiled plan (default: next to the form)")
+    parser.add_argument("--workers", type=int, default=1, help="convert files in a pool of this many processes")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="xlsx",
+                        help="format of the per-file and combined outputs (xlsx, or parquet/feather for the next stage)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="convert only new or changed files, tracked in a manifest in the output folder")
+    parser.add_argument("--typed", action="store_true",
+                        help="store numbers, booleans, dates and repeated values as compact types instead of text "
+                             "(the --form field types are used when given)")
+    parser.add_argument("--store", metavar="DATABASE",
+                        help="write every file's data to this SQLite submission store (submission_store.py) "
+                             "instead of the combined result file")
+    add_arguments(parser)
+    args = parser.parse_args()
     
     INPUT_FOLDER = (f"S:\\Downloads\\your xml files directory")
     OUTPUT_FOLDER = (f"{INPUT_FOLDER}\\Outputs")
 
     print(" Starting XML to Excel conversion with combined results...")
-    convert_xml_folder(INPUT_FOLDER, OUTPUT_FOLDER)
+    store = SubmissionStore(args.store) if args.store else None
+    with session(args.report, args.profile):
+        convert_xml_folder(INPUT_FOLDER, OUTPUT_FOLDER, streaming=args.streaming, form_file=args.form,
+                           plan_file=args.plan, workers=args.workers, fmt=args.format, incremental=args.incremental,
+                           typed=args.typed, store=store)
+    if store is not None:
+        store.close()
 
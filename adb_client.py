@@ -0,0 +1,355 @@
+import os
+import socket
+import struct
+import subprocess
+import threading
+from collections import namedtuple
+
+# Client for the adb server's host protocol, so the collector talks to the
+# local adb server over a socket instead of starting an `adb` process for
+# every command. A request is its length in 4 hex digits followed by the
+# service name; the server answers OKAY, or FAIL and a length-prefixed
+# message. "host:transport:<serial>" binds the connection to a device, and one
+# device service (shell, exec, sync) then runs on it. The sync service keeps
+# its connection open for any number of STAT/LIST/RECV requests, so a single
+# connection per device lists and pulls every file.
+
+DEFAULT_PORT = 5037
+DEFAULT_TIMEOUT = 10
+# Longest DATA chunk the sync protocol sends
+SYNC_DATA_MAX = 64 * 1024
+# shell,v2 packet ids
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+# Marks the exit code printed after a command on devices without shell_v2
+EXIT_MARKER = b"\x1e__adb_exit__:"
+
+ShellResult = namedtuple("ShellResult", ["returncode", "stdout", "stderr"])
+FileStat = namedtuple("FileStat", ["mode", "size", "mtime"])
+DirEntry = namedtuple("DirEntry", ["name", "mode", "size", "mtime"])
+
+
+class AdbError(Exception):
+    """The adb server refused a request, or the connection to it failed"""
+
+
+def server_port():
+    return int(os.environ.get("ANDROID_ADB_SERVER_PORT", DEFAULT_PORT))
+
+
+def recv_exact(sock, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        try:
+            chunk = sock.recv(min(remaining, SYNC_DATA_MAX))
+        except OSError as e:
+            raise AdbError(f"connection to the adb server failed: {str(e)}") from e
+        if not chunk:
+            raise AdbError("connection closed by the adb server")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_all(sock, data):
+    try:
+        sock.sendall(data)
+    except OSError as e:
+        raise AdbError(f"connection to the adb server failed: {str(e)}") from e
+
+
+def send_request(sock, service):
+    data = service.encode("utf-8")
+    send_all(sock, b"%04x" % len(data) + data)
+
+
+def read_string(sock):
+    length = int(recv_exact(sock, 4), 16)
+    return recv_exact(sock, length).decode("utf-8", "replace")
+
+
+def read_status(sock):
+    status = recv_exact(sock, 4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        raise AdbError(read_string(sock))
+    raise AdbError(f"unexpected reply from the adb server: {status!r}")
+
+
+def parse_devices(text):
+    """{serial: state} from a device list, one "serial<TAB>state" per line"""
+    devices = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            devices[parts[0]] = parts[1]
+    return devices
+
+
+class AdbClient:
+    """Requests to the adb server at host:port (ANDROID_ADB_SERVER_PORT, else 5037)
+
+    Every host request uses a new connection, as the server closes it after
+    answering; opening one is a local socket connect, not a process launch.
+    """
+
+    def __init__(self, host="127.0.0.1", port=None, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port or server_port()
+        self.timeout = timeout
+        self.features = {}
+        self.lock = threading.Lock()
+
+    def connect(self, timeout=None):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=timeout or self.timeout)
+        except OSError as e:
+            raise AdbError(f"cannot connect to the adb server on port {self.port}: {str(e)}") from e
+        # Requests are small writes each waiting for a reply; delayed, they cost ~40ms apiece
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def request(self, service, timeout=None):
+        """The connection after the server accepted service"""
+        sock = self.connect(timeout)
+        try:
+            send_request(sock, service)
+            read_status(sock)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def query(self, service):
+        """The length-prefixed answer of a host service"""
+        sock = self.request(service)
+        try:
+            return read_string(sock)
+        finally:
+            sock.close()
+
+    def version(self):
+        return int(self.query("host:version"), 16)
+
+    def available(self):
+        """Whether the adb server answers, starting it with `adb start-server` once if it does not"""
+        try:
+            self.version()
+            return True
+        except AdbError:
+            pass
+        try:
+            subprocess.run(["adb", "start-server"], check=True, capture_output=True, timeout=30)
+            self.version()
+            return True
+        except (subprocess.SubprocessError, OSError, AdbError):
+            return False
+
+    def devices(self):
+        """{serial: state} of every device the server knows"""
+        return parse_devices(self.query("host:devices"))
+
+    def track_devices(self):
+        """A DeviceTracker giving the device list every time it changes"""
+        sock = self.request("host:track-devices")
+        sock.settimeout(None)
+        return DeviceTracker(sock)
+
+    def device_features(self, serial):
+        with self.lock:
+            if serial in self.features:
+                return self.features[serial]
+        features = set(self.query(f"host-serial:{serial}:features").split(","))
+        with self.lock:
+            self.features[serial] = features
+        return features
+
+    def device(self, serial=None):
+        """The device with serial, or the only authorized device when serial is None"""
+        if serial is None:
+            serials = [serial for serial, state in self.devices().items() if state == "device"]
+            if len(serials) != 1:
+                raise AdbError("more than one device" if serials else "no devices found")
+            serial = serials[0]
+        return Device(self, serial)
+
+
+class DeviceTracker:
+    """Iterates over {serial: state} lists from host:track-devices until closed"""
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def __iter__(self):
+        try:
+            while True:
+                yield parse_devices(read_string(self.sock))
+        except AdbError:
+            return
+
+    def close(self):
+        # Also called from another thread to stop an iteration waiting for the next list
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class Device:
+    def __init__(self, client, serial):
+        self.client = client
+        self.serial = serial
+
+    def open(self, service, timeout=None):
+        """A connection running a device service"""
+        sock = self.client.request(f"host:transport:{self.serial}", timeout)
+        try:
+            send_request(sock, service)
+            read_status(sock)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def shell(self, command, timeout=None):
+        """ShellResult of command in the device shell, with its exit code"""
+        if "shell_v2" in self.client.device_features(self.serial):
+            return self.shell_v2(command, timeout)
+        # Older devices have no exit codes in their shell protocol, so it is printed after the
+        # output; the subshell lets it run even when the command calls exit
+        sock = self.open(f"shell:({command}\n); echo \"{EXIT_MARKER.decode()}$?\"", timeout)
+        try:
+            output = read_to_end(sock)
+        finally:
+            sock.close()
+        output, marker, code = output.rpartition(EXIT_MARKER)
+        if not marker:
+            raise AdbError("the device shell ended without an exit code")
+        return ShellResult(int(code.strip() or 255), output, b"")
+
+    def shell_v2(self, command, timeout=None):
+        sock = self.open(f"shell,v2,raw:{command}", timeout)
+        stdout, stderr = [], []
+        try:
+            while True:
+                packet_id, length = struct.unpack("<BI", recv_exact(sock, 5))
+                data = recv_exact(sock, length)
+                if packet_id == SHELL_STDOUT:
+                    stdout.append(data)
+                elif packet_id == SHELL_STDERR:
+                    stderr.append(data)
+                elif packet_id == SHELL_EXIT:
+                    return ShellResult(data[0], b"".join(stdout), b"".join(stderr))
+        finally:
+            sock.close()
+
+    def exec_out(self, command):
+        """Binary file object streaming command's stdout, as `adb exec-out` gives it; close it when done"""
+        sock = self.open(f"exec:{command}")
+        sock.settimeout(None)
+        stream = sock.makefile("rb")
+        # The connection stays open until the stream is closed
+        sock.close()
+        return stream
+
+    def sync(self):
+        return SyncConnection(self.open("sync:"))
+
+
+def read_to_end(sock):
+    chunks = []
+    while True:
+        try:
+            chunk = sock.recv(SYNC_DATA_MAX)
+        except OSError as e:
+            raise AdbError(f"connection to the adb server failed: {str(e)}") from e
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+class SyncConnection:
+    """File transfers over one sync service connection
+
+    After a FAIL reply the device closes the connection, so a failed transfer
+    leaves it broken; open a new one from Device.sync() to go on.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def send(self, request, path):
+        data = path.encode("utf-8")
+        send_all(self.sock, request + struct.pack("<I", len(data)) + data)
+
+    def fail(self, length):
+        raise AdbError(recv_exact(self.sock, length).decode("utf-8", "replace"))
+
+    def stat(self, path):
+        """FileStat of a remote path, or None when it does not exist"""
+        self.send(b"STAT", path)
+        reply, mode, size, mtime = struct.unpack("<4sIII", recv_exact(self.sock, 16))
+        if reply != b"STAT":
+            raise AdbError(f"unexpected sync reply {reply!r}")
+        if not (mode or size or mtime):
+            return None
+        return FileStat(mode, size, mtime)
+
+    def list(self, path):
+        """DirEntry for everything in a remote folder, without . and .."""
+        self.send(b"LIST", path)
+        entries = []
+        while True:
+            reply, mode, size, mtime, length = struct.unpack("<4sIIII", recv_exact(self.sock, 20))
+            if reply == b"DONE":
+                return entries
+            if reply == b"FAIL":
+                self.fail(length)
+            if reply != b"DENT":
+                raise AdbError(f"unexpected sync reply {reply!r}")
+            name = recv_exact(self.sock, length).decode("utf-8", "replace")
+            if name not in (".", ".."):
+                entries.append(DirEntry(name, mode, size, mtime))
+
+    def recv(self, path, target):
+        """Write the remote file at path to the binary file object target"""
+        self.send(b"RECV", path)
+        while True:
+            reply, length = struct.unpack("<4sI", recv_exact(self.sock, 8))
+            if reply == b"DATA":
+                target.write(recv_exact(self.sock, length))
+            elif reply == b"DONE":
+                return
+            elif reply == b"FAIL":
+                self.fail(length)
+            else:
+                raise AdbError(f"unexpected sync reply {reply!r}")
+
+    def pull(self, remote_path, local_path):
+        """Copy a remote file to local_path; nothing is left behind when it fails"""
+        try:
+            with open(local_path, "wb") as target:
+                self.recv(remote_path, target)
+        except BaseException:
+            try:
+                os.remove(local_path)
+            except OSError:
+                pass
+            raise
+
+    def close(self):
+        try:
+            self.send(b"QUIT", "")
+        except AdbError:
+            pass
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,119 @@
+"""Compare `adb` processes per command against the native adb server client on a fake device.
+
+    python benchmarks/bench_adb_client.py --files 2000 --latency 0.002
+    python benchmarks/bench_adb_client.py --files 500 --no-shell-v2
+
+main.find_and_pull_xml runs per file and in bulk, first through the fake `adb`
+executable (benchmarks/fake_adb.py, one process per command) and then with
+main.use_native_adb against benchmarks/fake_adb_server.py, which speaks the
+adb server protocol over a socket. --latency is added to every device request
+in both, so the difference left is the cost of the process launches. The
+pulled folders are compared, and the sync connection's STAT/LIST and failure
+handling are checked.
+"""
+import argparse
+import filecmp
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fake_adb  # noqa: E402
+import main  # noqa: E402
+from adb_client import AdbClient, AdbError  # noqa: E402
+from bench_pull import make_device  # noqa: E402
+
+SERIAL = "FAKE001"
+
+
+def start_server():
+    """The fake adb server in its own process, so client and server do not share the GIL"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb_server.py")
+    proc = subprocess.Popen([sys.executable, script, "--port", "0"], stdout=subprocess.PIPE, text=True)
+    return proc, int(proc.stdout.readline())
+
+
+def run_mode(downloads, bulk):
+    start = time.perf_counter()
+    summary = main.find_and_pull_xml(SERIAL, downloads, bulk=bulk)
+    return time.perf_counter() - start, summary
+
+
+def check_protocol(client, files):
+    """STAT, LIST and RECV over one connection, and a failed RECV leaving the next connection usable"""
+    device = client.device(SERIAL)
+    folder = os.path.dirname(files[0])
+    with device.sync() as connection:
+        assert connection.stat(files[0]).size > 0
+        assert connection.stat(folder + "/missing.xml") is None
+        names = {entry.name for entry in connection.list(folder)}
+        assert os.path.basename(files[0]) in names and "." not in names
+        with tempfile.TemporaryDirectory() as tmp:
+            for remote_path in files[:20]:
+                connection.pull(remote_path, os.path.join(tmp, "copy.xml"))
+            try:
+                connection.pull(folder + "/missing.xml", os.path.join(tmp, "missing.xml"))
+                raise AssertionError("pulling a missing file did not fail")
+            except AdbError:
+                assert not os.path.exists(os.path.join(tmp, "missing.xml"))
+    with device.sync() as connection:
+        assert connection.stat(files[0]) is not None
+    result = device.shell("echo out; echo err >&2; exit 3")
+    assert result.returncode == 3 and b"out" in result.stdout
+    print(" Protocol checks passed (STAT, LIST, RECV reuse, FAIL, shell exit codes)")
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=500, help="number of small XML files on the fake device")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every device request")
+    parser.add_argument("--no-shell-v2", action="store_true",
+                        help="the fake device lacks shell_v2, so the exit code is echoed after the output")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work:
+        work = Path(work)
+        fake_adb.install(work / "bin")
+        os.environ["PATH"] = str(work / "bin") + os.pathsep + os.environ["PATH"]
+        os.environ["FAKE_ADB_ROOT"] = str(work / "devices")
+        os.environ["FAKE_ADB_LATENCY"] = str(args.latency)
+        if args.no_shell_v2:
+            os.environ["FAKE_ADB_NO_SHELL_V2"] = "1"
+        make_device(work / "devices", SERIAL, args.files)
+        # No Drive uploads, only the transfer is measured
+        main.google_drive_auth = lambda: None
+
+        results = {}
+        for label, bulk in (("adb per-file", False), ("adb bulk", True)):
+            results[label] = run_mode(work / label, bulk)
+
+        server, port = start_server()
+        try:
+            client = main.use_native_adb(AdbClient(port=port))
+            assert main.check_adb_availability() and main.list_authorized_devices() == [SERIAL]
+            for label, bulk in (("native per-file", False), ("native bulk", True)):
+                results[label] = run_mode(work / label, bulk)
+            files = main.find_remote_xml(SERIAL)
+            check_protocol(client, files)
+        finally:
+            main.ADB_CLIENT = None
+            server.terminate()
+            server.wait()
+
+        for label, (seconds, summary) in results.items():
+            print(f" {label:>16}: {summary['pulled']} files in {seconds:6.2f}s ({summary['pulled'] / seconds:.0f} files/s)")
+        for label in ("adb per-file", "native per-file", "adb bulk", "native bulk"):
+            compare = filecmp.dircmp(work / "adb per-file", work / label)
+            assert not (compare.left_only or compare.right_only or compare.diff_files), label
+        print(" Outputs identical: True")
+        print(f" Per-file speed-up: {results['adb per-file'][0] / results['native per-file'][0]:.1f}x, "
+              f"bulk: {results['adb bulk'][0] / results['native bulk'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,80 @@
+"""frame_cache.py: pd.read_excel vs the cached reader, cold, from the sidecar files and from memory.
+
+    python benchmarks/bench_cache.py --projects 8 --rows 20000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "data_arrangement"))
+
+import arrange  # noqa: E402
+from bench_master import make_combined_results  # noqa: E402
+from frame_cache import CACHE  # noqa: E402
+from frame_io import read_frame, read_sheets  # noqa: E402
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def describe(label, elapsed):
+    print(f" {label:<28}{elapsed * 1000:10.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=10000, help="rows per sheet")
+    parser.add_argument("--columns", type=int, default=40)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_combined_results(tmp, args.projects, args.rows, args.columns)
+        with contextlib.redirect_stdout(io.StringIO()):
+            master = arrange.create_master_sheet(tmp, "xlsx", cache=False)
+        files = sorted(Path(tmp).glob("Combined result of Output of path*.xlsx"))
+        print(f" {args.projects} sheets x {args.rows} rows x {args.columns} columns, "
+              f"master workbook {os.path.getsize(master) / 1e6:.1f} MB")
+
+        print(" master workbook, every sheet")
+        reference, elapsed = timed(pd.read_excel, master, sheet_name=None)
+        describe("pd.read_excel", elapsed)
+        sheets, elapsed = timed(read_sheets, master, cache=False)
+        describe("streaming reader", elapsed)
+        for label in ("cold (parse + sidecar)", "sidecar", "memory"):
+            if label == "sidecar":
+                CACHE.clear()
+            cached, elapsed = timed(read_sheets, master)
+            describe(label, elapsed)
+            assert list(cached) == list(reference)
+            for name in reference:
+                pd.testing.assert_frame_equal(cached[name], reference[name])
+                pd.testing.assert_frame_equal(sheets[name], reference[name])
+
+        print(" combined results, first sheet of each file")
+        _, elapsed = timed(lambda: [pd.read_excel(file) for file in files])
+        describe("pd.read_excel", elapsed)
+        for label in ("cold (parse + sidecar)", "sidecar", "memory"):
+            if label == "sidecar":
+                CACHE.clear()
+            _, elapsed = timed(lambda: [read_frame(file) for file in files])
+            describe(label, elapsed)
+
+        print(f" {dict(CACHE.stats)}, {CACHE.nbytes / 1e6:.1f} MB in memory")
+        print(" cached frames match pd.read_excel")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Microbenchmark: dict-per-record flattening vs the columnar builder.
+
+    python benchmarks/bench_columnar.py --submissions 2000 --fields 60 --repeats 6
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+
+import columnar  # noqa: E402
+import xmltoexcel  # noqa: E402
+import xmltoexcel1  # noqa: E402
+import xmltoexcel2  # noqa: E402
+from odk_generator import submission_xml  # noqa: E402
+
+
+def timed(label, func, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return label, best, result
+
+
+def peak_memory(func):
+    """Peak traced memory in MB while func runs"""
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def parse_element_records(module, roots):
+    records = []
+    for root in roots:
+        data = {}
+        module.parse_element(root, "", data)
+        records.append(data)
+    return pd.DataFrame(records)
+
+
+def columnar_records(roots, indexed):
+    builder = columnar.ColumnarBuilder()
+    for root in roots:
+        columnar.element_record_columnar(root, builder, indexed=indexed)
+    return builder.to_frame()
+
+
+def node_frames(roots):
+    return [pd.DataFrame(xmltoexcel.parse_node(root)) for root in roots]
+
+
+def node_frames_columnar(roots):
+    return [columnar.node_rows_columnar(root).to_frame() for root in roots]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=1000)
+    parser.add_argument("--fields", type=int, default=40)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    roots = [ET.fromstring(submission_xml(n, fields=args.fields, repeats=args.repeats, depth=args.depth))
+             for n in range(args.submissions)]
+    print(f" {len(roots)} generated submissions, {args.fields} fields, repeats up to {args.repeats}, depth {args.depth}")
+
+    cases = [
+        ("parse_node per file", lambda: node_frames(roots), lambda: node_frames_columnar(roots)),
+        ("parse_element (xmltoexcel2)", lambda: parse_element_records(xmltoexcel2, roots),
+         lambda: columnar_records(roots, indexed=False)),
+        ("parse_element (xmltoexcel1)", lambda: parse_element_records(xmltoexcel1, roots),
+         lambda: columnar_records(roots, indexed=True)),
+    ]
+    for name, current, candidate in cases:
+        _, old_time, old_result = timed("dicts", current)
+        _, new_time, new_result = timed("columnar", candidate)
+        if isinstance(old_result, list):
+            for old, new in zip(old_result, new_result):
+                pd.testing.assert_frame_equal(old, new)
+        else:
+            pd.testing.assert_frame_equal(old_result, new_result)
+        old_peak, new_peak = peak_memory(current), peak_memory(candidate)
+        print(f" {name:<30} dicts {old_time:7.3f}s {old_peak:8.1f} MB  columnar {new_time:7.3f}s {new_peak:8.1f} MB  "
+              f"speed-up {old_time / new_time:4.1f}x  (identical frames)")
+
+
+if __name__ == "__main__":
+    main()
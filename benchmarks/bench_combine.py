@@ -0,0 +1,89 @@
+"""Step 3 (combine_excels) on many per-submission workbooks: repeated pd.concat vs the streaming combine.
+
+    python benchmarks/bench_combine.py --files 5000 --compare-concat
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+
+import xmltoexcel  # noqa: E402
+from xlsx_stream import write_rows  # noqa: E402
+
+
+def make_workbooks(folder, count, columns=60, rows=8, seed=0):
+    """Small workbooks shaped like Step 2 output; each one misses a few of the columns"""
+    rng = random.Random(seed)
+    names = [f"q{i}" for i in range(columns)]
+    os.makedirs(folder, exist_ok=True)
+    for number in range(count):
+        present = [name for name in names if rng.random() > 0.1]
+        data = ([f"{rng.randint(0, 999)}" if rng.random() > 0.3 else None for _ in present] for _ in range(rows))
+        write_rows(os.path.join(folder, f"submission_{number:06d}.xlsx"), present, data)
+
+
+def concat_combine(folder_path, combined_file):
+    """The previous Step 3: pd.concat of the whole accumulated frame for every file"""
+    combined_data = pd.DataFrame()
+    for file in sorted(os.listdir(folder_path)):
+        if file.endswith(".xlsx"):
+            combined_data = pd.concat([combined_data, pd.read_excel(os.path.join(folder_path, file))],
+                                      ignore_index=True)
+    combined_data.to_excel(combined_file, index=False)
+
+
+def measure(func, *args, memory=False):
+    """Wall time of one run, plus peak traced memory (MB) from a second, traced run"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(*args)
+    elapsed = time.perf_counter() - start
+    if not memory:
+        return elapsed, None
+    # tracing slows everything down, so it gets its own run
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def describe(label, elapsed, peak):
+    memory = f"  peak {peak:8.1f} MB" if peak is not None else ""
+    print(f" {label:<20}{elapsed:8.2f}s{memory}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--columns", type=int, default=60)
+    parser.add_argument("--rows", type=int, default=8, help="rows per workbook")
+    parser.add_argument("--compare-concat", action="store_true", help="also time the previous pd.concat loop")
+    parser.add_argument("--memory", action="store_true", help="also report peak memory (runs each method twice)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "processed")
+        make_workbooks(folder, args.files, args.columns, args.rows)
+        print(f" {args.files} workbooks, {args.columns} columns, {args.rows} rows each")
+        describe("streaming combine", *measure(xmltoexcel.combine_excels, folder,
+                                               os.path.join(tmp, "streaming.xlsx"), False, memory=args.memory))
+        if args.compare_concat:
+            describe("pd.concat per file", *measure(concat_combine, folder,
+                                                    os.path.join(tmp, "concat.xlsx"), memory=args.memory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""--form: one pass over the files with a compiled plan vs the column-discovery pass.
+
+    python benchmarks/bench_form_plan.py --submissions 2000 --fields 40 --depth 2
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+
+import xmltoexcel1  # noqa: E402
+import xmltoexcel2  # noqa: E402
+from form_plan import compile_plan  # noqa: E402
+from frame_io import read_frame  # noqa: E402
+from odk_generator import write_submissions, xform_xml  # noqa: E402
+
+CONVERTERS = {
+    "xmltoexcel1": (xmltoexcel1, "combined_results.xlsx"),
+    "xmltoexcel2": (xmltoexcel2, "combined result.xlsx"),
+}
+
+
+def timed(func, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(**kwargs)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=500)
+    parser.add_argument("--fields", type=int, default=40)
+    parser.add_argument("--depth", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "xml")
+        # padding fills the notes field, so every question the form declares is answered
+        write_submissions(source, args.submissions, fields=args.fields, repeats=4, depth=args.depth, padding=8)
+        xform = os.path.join(tmp, "form.xml")
+        with open(xform, "w", encoding="utf-8") as f:
+            f.write(xform_xml(fields=args.fields, depth=args.depth))
+        print(f" {args.submissions} submissions, {args.fields} fields, depth {args.depth}")
+
+        for name, (module, combined_name) in CONVERTERS.items():
+            scan_output = os.path.join(tmp, f"{name}_scan")
+            plan_output = os.path.join(tmp, f"{name}_plan")
+            scan_time = timed(module.convert_xml_folder, input_folder=source, output_folder=scan_output)
+            plan_time = timed(module.convert_xml_folder, input_folder=source, output_folder=plan_output,
+                              form_file=xform)
+            print(f" {name:<12} scan {scan_time:8.2f}s   --form {plan_time:8.2f}s  ({scan_time / plan_time:.1f}x)")
+
+            # The plan must not change what gets written, column order included
+            scanned = read_frame(os.path.join(scan_output, combined_name))
+            planned = read_frame(os.path.join(plan_output, combined_name))
+            if list(planned.columns) != list(scanned.columns):
+                missing = [column for column in scanned.columns if column not in planned.columns]
+                extra = [column for column in planned.columns if column not in scanned.columns]
+                raise SystemExit(f" {name}: combined columns differ with --form (missing {missing}, extra {extra})")
+            print(f" {name:<12} combined columns match ({len(planned.columns)})")
+
+    # A Forms_IDs workbook only lists leaf names, so it is refused rather than turned into junk columns
+    try:
+        compile_plan("Forms_IDs.xlsx")
+    except ValueError:
+        print(" Forms_IDs workbook refused as a form")
+    else:
+        raise SystemExit(" compile_plan accepted a Forms_IDs workbook")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""End-to-end pipeline time with xlsx vs Parquet/Feather files between the stages.
+
+Runs Step 1-3 of xmltoexcel.py for every project folder, then arrange.py and
+header_match.py, once per format; renamed_data.xlsx is always the xlsx export
+and is checked to be the same for every format.
+
+    python benchmarks/bench_formats.py --projects 3 --files 300 --formats xlsx parquet feather
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+sys.path.insert(0, os.path.join(ROOT, "data_arrangement"))
+
+import arrange  # noqa: E402
+import header_match  # noqa: E402
+import xmltoexcel  # noqa: E402
+from frame_io import FORMATS, with_format  # noqa: E402
+from odk_generator import write_submissions  # noqa: E402
+
+STAGES = ("step 1 convert", "step 2 gaps", "step 3 combine", "arrange", "header_match")
+
+
+def make_projects(base, projects, files, fields):
+    """path1..pathN folders of submissions, plus a Forms_IDs workbook per project"""
+    ids_directory = os.path.join(base, "Forms_IDs")
+    os.makedirs(ids_directory)
+    mapping = {}
+    for number in range(1, projects + 1):
+        write_submissions(os.path.join(base, f"path{number}"), files, fields=fields, repeats=4, depth=2)
+        ids = pd.DataFrame({"ID": [f"q{i}" for i in range(fields)],
+                            "Name": [f"Question {i} of form {number}" for i in range(fields)]})
+        ids.to_excel(os.path.join(ids_directory, f"Form{number}.xlsx"), index=False)
+        mapping[f"path{number}"] = f"Form{number}.xlsx"
+    return ids_directory, mapping
+
+
+def run_pipeline(base, projects, fmt, ids_directory, mapping, compact=False):
+    """Every stage in fmt; returns ({stage: seconds}, path of renamed_data.xlsx)"""
+    times = {}
+    folders = []
+    for number in range(1, projects + 1):
+        input_folder = os.path.join(base, f"path{number}")
+        output = os.path.join(input_folder, f"Outputs_of_path{number}")
+        processed = os.path.join(input_folder, f"processed_Outputs_of_path{number}")
+        folders.append((input_folder, output, processed))
+
+    def timed(stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args, **kwargs)
+        times[stage] = times.get(stage, 0.0) + time.perf_counter() - start
+        return result
+
+    if compact:
+        timed("step 1 convert", xmltoexcel.convert_xml_folders,
+              [(input_folder, processed) for input_folder, _, processed in folders], compact=True, fmt=fmt)
+    else:
+        timed("step 1 convert", xmltoexcel.convert_xml_folders,
+              [(input_folder, output) for input_folder, output, _ in folders], fmt=fmt)
+    for _, output, processed in folders:
+        if compact:
+            os.makedirs(output, exist_ok=True)
+        else:
+            timed("step 2 gaps", xmltoexcel.process_folder, output, processed, fmt=fmt)
+        timed("step 3 combine", xmltoexcel.combine_excels, processed,
+              with_format(os.path.join(output, "combined result"), fmt))
+
+    dest_dir = os.path.join(base, "combined sheet")
+    timed("arrange", arrange.fetch_and_rename_excel_files, base, dest_dir, fmt)
+    master_path = timed("arrange", arrange.create_master_sheet, dest_dir, fmt)
+    renamed = os.path.join(base, "renamed_data.xlsx")
+    timed("header_match", header_match.match_headers, master_path, ids_directory, renamed, mapping)
+    return times, renamed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=3)
+    parser.add_argument("--files", type=int, default=200, help="submissions per project")
+    parser.add_argument("--fields", type=int, default=40)
+    parser.add_argument("--formats", nargs="+", choices=sorted(FORMATS), default=["xlsx", "parquet", "feather"])
+    parser.add_argument("--compact", action="store_true", help="remove the gaps in Step 1 (xmltoexcel.py --compact)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source")
+        ids_directory, mapping = make_projects(source, args.projects, args.files, args.fields)
+        print(f" {args.projects} projects x {args.files} submissions, {args.fields} fields")
+        print(" " + f"{'format':<10}" + "".join(f"{stage:>16}" for stage in STAGES) + f"{'total':>10}")
+
+        reference = None
+        for fmt in args.formats:
+            base = os.path.join(tmp, fmt)
+            shutil.copytree(source, base)
+            times, renamed = run_pipeline(base, args.projects, fmt, ids_directory, mapping, args.compact)
+            print(" " + f"{fmt:<10}" + "".join(f"{times.get(stage, 0.0):15.2f}s" for stage in STAGES)
+                  + f"{sum(times.values()):9.2f}s")
+
+            # The final export must not depend on the format used in between
+            sheets = pd.read_excel(renamed, sheet_name=None)
+            if reference is None:
+                reference = sheets
+                continue
+            # arrange.py orders the sheets the way glob lists the files
+            assert sorted(sheets) == sorted(reference), f"{fmt}: different sheets"
+            for name in reference:
+                pd.testing.assert_frame_equal(sheets[name], reference[name], obj=f"{fmt} sheet {name}")
+        print(" renamed_data.xlsx is the same for every format")
+
+
+if __name__ == "__main__":
+    main()
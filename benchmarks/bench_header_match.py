@@ -0,0 +1,124 @@
+"""header_match.py: renaming through DataFrames vs --headers-only on a large master workbook.
+
+    python benchmarks/bench_header_match.py --projects 8 --rows 50000 --memory
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import pandas as pd
+from openpyxl import load_workbook
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "data_arrangement"))
+
+import arrange  # noqa: E402
+import header_match  # noqa: E402
+from bench_master import make_combined_results  # noqa: E402
+from xlsx_headers import read_header, sheet_parts  # noqa: E402
+
+
+def make_ids(ids_directory, projects, columns):
+    os.makedirs(ids_directory, exist_ok=True)
+    mapping = {}
+    for number in range(1, projects + 1):
+        ids = pd.DataFrame({"ID": [f"q{i}" for i in range(columns)],
+                            "Name": [f"Question {i} of form {number}" for i in range(columns)]})
+        ids.to_excel(os.path.join(ids_directory, f"Form{number}.xlsx"), index=False)
+        mapping[f"path{number}"] = f"Form{number}.xlsx"
+    return mapping
+
+
+def measure(func, *args, memory=False, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    if not memory:
+        return elapsed, None
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def headers(path):
+    wb = load_workbook(path, read_only=True)
+    result = {ws.title: [cell.value for cell in next(ws.iter_rows(max_row=1))] for ws in wb.worksheets}
+    wb.close()
+    return result
+
+
+def data_after_header(path):
+    """{sheet name: every byte of its part after the header row}, as a digest"""
+    result = {}
+    with zipfile.ZipFile(path) as zf:
+        for name, part in sheet_parts(zf).items():
+            digest = hashlib.md5()
+            with zf.open(part) as f:
+                data, span = read_header(f)
+                digest.update(data[span[1]:])
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            result[name] = digest.hexdigest()
+    return result
+
+
+def stored_parts(path):
+    """{part name: (CRC, compressed size)} of every part that is not a sheet"""
+    with zipfile.ZipFile(path) as zf:
+        sheets = set(sheet_parts(zf).values())
+        return {info.filename: (info.CRC, info.compress_size) for info in zf.infolist() if info.filename not in sheets}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=10000, help="rows per sheet")
+    parser.add_argument("--columns", type=int, default=40)
+    parser.add_argument("--skip-dataframes", action="store_true", help="only time --headers-only")
+    parser.add_argument("--memory", action="store_true", help="also report peak memory (runs each twice)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_combined_results(tmp, args.projects, args.rows, args.columns)
+        with contextlib.redirect_stdout(io.StringIO()):
+            master = arrange.create_master_sheet(tmp, "xlsx")
+        mapping = make_ids(os.path.join(tmp, "Forms_IDs"), args.projects, args.columns)
+        print(f" {args.projects} sheets x {args.rows} rows x {args.columns} columns, "
+              f"master workbook {os.path.getsize(master) / 1e6:.1f} MB")
+
+        fast = os.path.join(tmp, "renamed_headers_only.xlsx")
+        elapsed, peak = measure(header_match.match_headers, master, os.path.join(tmp, "Forms_IDs"), fast, mapping,
+                                headers_only=True, cache=False, memory=args.memory)
+        memory = f"  peak {peak:8.1f} MB" if peak is not None else ""
+        print(f" {'--headers-only':<16}{elapsed:8.2f}s{memory}")
+
+        if not args.skip_dataframes:
+            full = os.path.join(tmp, "renamed.xlsx")
+            elapsed, peak = measure(header_match.match_headers, master, os.path.join(tmp, "Forms_IDs"), full,
+                                    mapping, cache=False, memory=args.memory)
+            memory = f"  peak {peak:8.1f} MB" if peak is not None else ""
+            print(f" {'DataFrames':<16}{elapsed:8.2f}s{memory}")
+            assert headers(fast) == headers(full)
+            print(" headers match the DataFrame rename")
+
+        # Nothing but the header rows changed
+        assert data_after_header(fast) == data_after_header(master)
+        print(" data rows are byte-for-byte the master workbook's")
+        assert stored_parts(fast) == stored_parts(master)
+        print(" the other parts are copied without being compressed again")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""A daily run that adds a few submissions to many: full reconversion vs --incremental.
+
+    python benchmarks/bench_incremental.py --existing 20000 --new 50 --converter xmltoexcel2
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+
+import xmltoexcel  # noqa: E402
+import xmltoexcel1  # noqa: E402
+import xmltoexcel2  # noqa: E402
+from frame_io import FORMATS, read_frame, with_format  # noqa: E402
+from odk_generator import submission_xml, write_submissions  # noqa: E402
+
+
+def run_xmltoexcel(source, output, fmt, incremental):
+    processed = f"{output}_processed"
+    combined_file = with_format(os.path.join(output, "combined result"), fmt)
+    if incremental:
+        xmltoexcel.update_project(source, output, processed, combined_file, fmt=fmt)
+    else:
+        xmltoexcel.convert_xml_folder(source, output, fmt=fmt)
+        xmltoexcel.process_folder(output, processed, fmt=fmt)
+        xmltoexcel.combine_excels(processed, combined_file)
+    return combined_file
+
+
+def run_xmltoexcel1(source, output, fmt, incremental):
+    xmltoexcel1.convert_xml_folder(source, output, fmt=fmt, incremental=incremental)
+    return with_format(os.path.join(output, "combined_results"), fmt)
+
+
+def run_xmltoexcel2(source, output, fmt, incremental):
+    xmltoexcel2.convert_xml_folder(source, output, fmt=fmt, incremental=incremental)
+    return with_format(os.path.join(output, "combined result"), fmt)
+
+
+CONVERTERS = {
+    "xmltoexcel": run_xmltoexcel,
+    "xmltoexcel1": run_xmltoexcel1,
+    "xmltoexcel2": run_xmltoexcel2,
+}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--existing", type=int, default=2000, help="submissions already converted")
+    parser.add_argument("--new", type=int, default=50, help="submissions added before the daily run")
+    parser.add_argument("--fields", type=int, default=40)
+    parser.add_argument("--converter", choices=sorted(CONVERTERS), default="xmltoexcel2")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="xlsx")
+    args = parser.parse_args(argv)
+    run = CONVERTERS[args.converter]
+    options = dict(fields=args.fields, repeats=4, depth=2)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "xml")
+        write_submissions(source, args.existing, **options)
+        print(f" {args.existing} existing + {args.new} new submissions, {args.converter}, {args.format}")
+
+        elapsed, _ = timed(run, source, os.path.join(tmp, "incremental"), args.format, True)
+        print(f" first incremental run   {elapsed:8.2f}s  (converts everything and writes the manifest)")
+
+        for number in range(args.existing, args.existing + args.new):
+            with open(os.path.join(source, f"submission_{number:06d}.xml"), "w", encoding="utf-8") as f:
+                f.write(submission_xml(number, **options))
+
+        full_time, full_file = timed(run, source, os.path.join(tmp, "full"), args.format, False)
+        print(f" full run                {full_time:8.2f}s")
+        incremental_time, incremental_file = timed(run, source, os.path.join(tmp, "incremental"), args.format, True)
+        print(f" incremental run         {incremental_time:8.2f}s  ({full_time / incremental_time:.1f}x faster)")
+
+        # Same combined result either way, columns and their order included
+        full = read_frame(full_file)
+        incremental = read_frame(incremental_file)
+        pd.testing.assert_frame_equal(incremental, full)
+        print(" combined results match")
+
+
+if __name__ == "__main__":
+    main()
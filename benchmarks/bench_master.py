@@ -0,0 +1,99 @@
+"""arrange.create_master_sheet: pd.ExcelWriter vs parallel reads into a write-only workbook.
+
+    python benchmarks/bench_master.py --projects 8 --rows 20000 --workers 1 4 8 --compare-excelwriter --memory
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "data_arrangement"))
+
+import arrange  # noqa: E402
+from xlsx_stream import write_rows  # noqa: E402
+
+
+def make_combined_results(folder, projects, rows, columns, seed=0):
+    """Fetched 'Combined result of Output of path<i>.xlsx' files like arrange.py collects"""
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    for number in range(1, projects + 1):
+        names = [f"q{i}" for i in range(columns)]
+        data = ([rng.randint(0, 999) if i % 3 == 0 else (f"v{rng.randint(0, 99)}" if rng.random() > 0.2 else None)
+                 for i in range(columns)] for _ in range(rows))
+        write_rows(os.path.join(folder, f"Combined result of Output of path{number}.xlsx"), names, data)
+
+
+def excelwriter_master(dest_dir):
+    """The previous create_master_sheet: every sheet kept in one pd.ExcelWriter until it is saved"""
+    dest_dir = Path(dest_dir)
+    with pd.ExcelWriter(dest_dir / "master_excelwriter.xlsx", engine="openpyxl") as writer:
+        for file in dest_dir.glob("Combined result of Output of path*.xlsx"):
+            sheet_name = file.stem.split("Combined result of Output of ")[-1].strip()
+            pd.read_excel(file).to_excel(writer, sheet_name=sheet_name, index=False)
+    return dest_dir / "master_excelwriter.xlsx"
+
+
+def measure(func, *args, memory=False):
+    """Wall time of one run, plus peak traced memory (MB) of this process from a second, traced run"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    elapsed = time.perf_counter() - start
+    if not memory:
+        return result, elapsed, None
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1e6
+
+
+def describe(label, elapsed, peak):
+    memory = f"  peak {peak:8.1f} MB" if peak is not None else ""
+    print(f" {label:<24}{elapsed:8.2f}s{memory}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=5000, help="rows per combined result")
+    parser.add_argument("--columns", type=int, default=40)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--compare-excelwriter", action="store_true", help="also time the previous pd.ExcelWriter build")
+    parser.add_argument("--memory", action="store_true", help="also report peak memory (runs each build twice)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_combined_results(tmp, args.projects, args.rows, args.columns)
+        print(f" {args.projects} sheets x {args.rows} rows x {args.columns} columns, {os.cpu_count()} cores")
+        reference = None
+        if args.compare_excelwriter:
+            master, elapsed, peak = measure(excelwriter_master, tmp, memory=args.memory)
+            describe("pd.ExcelWriter", elapsed, peak)
+            reference = pd.read_excel(master, sheet_name=None)
+        for workers in args.workers:
+            master, elapsed, peak = measure(arrange.create_master_sheet, tmp, "xlsx", workers, False,
+                                            memory=args.memory)
+            describe(f"streaming, {workers} workers", elapsed, peak)
+            sheets = pd.read_excel(master, sheet_name=None)
+            reference = reference if reference is not None else sheets
+            assert list(sheets) == list(reference)
+            for name in reference:
+                pd.testing.assert_frame_equal(sheets[name], reference[name])
+        print(" master workbooks match")
+
+
+if __name__ == "__main__":
+    main()
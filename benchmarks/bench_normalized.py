@@ -0,0 +1,89 @@
+"""Repeat groups: one row per leaf (parse_node) and header copied into line items (xmltoexcel1) vs normalized tables.
+
+    python benchmarks/bench_normalized.py --submissions 500 --fields 40 --repeats 6 --depth 3
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+
+import normalized  # noqa: E402
+import xmltoexcel  # noqa: E402
+import xmltoexcel1  # noqa: E402
+from columnar import node_rows_columnar  # noqa: E402
+from frame_io import read_sheets  # noqa: E402
+from odk_generator import write_submissions  # noqa: E402
+
+
+def leaf_rows(xml_files):
+    """What xmltoexcel.py Step 1 builds for the files: one frame of a row per leaf each"""
+    return [node_rows_columnar(xmltoexcel.ET.parse(xml_file).getroot()).to_frame() for xml_file in xml_files]
+
+
+def line_items(xml_files):
+    """xmltoexcel1's records: the header fields plus every Q3_cropping line item"""
+    return pd.DataFrame([record for xml_file in xml_files for record in xmltoexcel1.read_records(xml_file)])
+
+
+def normalized_tables(xml_files, output_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        normalized.normalize_xml_files(xml_files, output_path, fmt="parquet")
+    return read_sheets(output_path, excel_types=False)
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1e6
+
+
+def cells(frames):
+    return sum(int(df.notna().sum().sum()) for df in frames)
+
+
+def describe(label, frames, elapsed, peak):
+    rows = sum(len(df) for df in frames)
+    print(f" {label:<28}{elapsed:8.2f}s  peak {peak:8.1f} MB  {len(frames):6} tables {rows:9} rows"
+          f" {cells(frames):10} values")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=300)
+    parser.add_argument("--fields", type=int, default=40)
+    parser.add_argument("--repeats", type=int, default=6)
+    parser.add_argument("--depth", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "submissions")
+        write_submissions(source, args.submissions, fields=args.fields, repeats=args.repeats, depth=args.depth)
+        xml_files = sorted(os.path.join(source, name) for name in os.listdir(source))
+        print(f" {args.submissions} submissions, {args.fields} fields, up to {args.repeats} repeats "
+              f"nested {args.depth} deep")
+
+        frames, elapsed, peak = measure(leaf_rows, xml_files)
+        describe("row per leaf (xmltoexcel)", frames, elapsed, peak)
+        df, elapsed, peak = measure(line_items, xml_files)
+        describe("line items (xmltoexcel1)", [df], elapsed, peak)
+        tables, elapsed, peak = measure(normalized_tables, xml_files, os.path.join(tmp, "normalized"))
+        describe("normalized", list(tables.values()), elapsed, peak)
+        print(" " + ", ".join(f"{name} {len(table)} rows" for name, table in tables.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Scaling of the process-pool conversion with the number of workers.
+
+    python benchmarks/bench_parallel.py --files 2000 --workers 1 2 4 8 16 32
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+
+import xmltoexcel  # noqa: E402
+import xmltoexcel2  # noqa: E402
+from odk_generator import write_submissions  # noqa: E402
+
+CONVERTERS = {
+    "xmltoexcel": lambda src, out, workers: xmltoexcel.convert_xml_folder(src, out, workers=workers),
+    "xmltoexcel2": lambda src, out, workers: xmltoexcel2.convert_xml_folder(src, out, workers=workers),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--fields", type=int, default=40)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--converter", choices=sorted(CONVERTERS), default="xmltoexcel")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "xml")
+        write_submissions(source, args.files, fields=args.fields, repeats=4, depth=2)
+        print(f" {args.files} files, {os.cpu_count()} cores, converter {args.converter}")
+        baseline = None
+        # The single-process run is the baseline for the speed-up
+        for workers in sorted(set(args.workers) | {1}):
+            output = os.path.join(tmp, f"out_{workers}")
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                CONVERTERS[args.converter](source, output, workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            speedup = baseline / elapsed
+            print(f" workers {workers:3d}  {elapsed:7.2f}s  {args.files / elapsed:8.1f} files/s  "
+                  f"speed-up {speedup:5.2f}x  efficiency {speedup / workers:4.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Compare per-file `adb pull` against the bulk tar transfer on a fake device.
+
+    python benchmarks/bench_pull.py --files 2000 --latency 0.02
+
+Both modes run main.find_and_pull_xml against benchmarks/fake_adb.py with
+Google Drive uploads switched off, and the pulled folders are compared.
+"""
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_adb  # noqa: E402
+import main  # noqa: E402
+
+
+def make_device(root, serial, count):
+    base = Path(root) / serial / main.DEVICE_BASE_PATH.lstrip("/")
+    for i in range(count):
+        folder = base / "instances" / f"form_{i // 50}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"submission_{i}.xml").write_text(
+            f'<data id="form"><meta><instanceID>uuid:{i}</instanceID></meta><q1>{i}</q1></data>'
+        )
+        # Same name in a second folder exercises the name(1).xml handling
+        if i % 10 == 0:
+            (folder / "last-saved.xml").write_text(f"<data><q1>{i}</q1></data>")
+
+
+def run_mode(serial, downloads, bulk):
+    start = time.perf_counter()
+    summary = main.find_and_pull_xml(serial, downloads, bulk=bulk)
+    return time.perf_counter() - start, summary
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=500, help="number of small XML files on the fake device")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds added to every adb invocation")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work:
+        fake_adb.install(Path(work) / "bin")
+        os.environ["PATH"] = str(Path(work) / "bin") + os.pathsep + os.environ["PATH"]
+        os.environ["FAKE_ADB_ROOT"] = str(Path(work) / "devices")
+        os.environ["FAKE_ADB_LATENCY"] = str(args.latency)
+        make_device(Path(work) / "devices", "FAKE001", args.files)
+
+        # No Drive uploads, only the transfer is measured
+        main.google_drive_auth = lambda: None
+
+        results = {}
+        for label, bulk in (("per-file", False), ("bulk", True)):
+            seconds, summary = run_mode("FAKE001", Path(work) / label, bulk)
+            results[label] = (seconds, summary)
+            print(f"{label:>8}: {summary['pulled']} files in {seconds:.2f}s "
+                  f"({summary['pulled'] / seconds:.0f} files/s)")
+
+        compare = filecmp.dircmp(Path(work) / "per-file", Path(work) / "bulk")
+        same = not (compare.left_only or compare.right_only or compare.diff_files)
+        print(f" Outputs identical: {same}")
+        print(f" Speed-up: {results['per-file'][0] / results['bulk'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main_bench()
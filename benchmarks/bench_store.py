@@ -0,0 +1,195 @@
+"""The SQLite submission store: exports against the Excel sink, and lookups at scale.
+
+    python benchmarks/bench_store.py --submissions 200 --scale 300000
+    python benchmarks/bench_store.py --submissions 100 --scale 0
+
+First the three converters run on generated ODK submissions twice, once
+writing their combined results and once with --store, and the store's
+exports of combined result.xlsx and master_sheet.xlsx must read back the same
+as the Excel sink's. An incremental xmltoexcel run with files added and removed
+is checked the same way. Then --scale submissions are inserted and lookups by
+instance ID, device, date and form are timed against loading a workbook.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+sys.path.insert(0, os.path.join(ROOT, "data_arrangement"))
+
+import arrange  # noqa: E402
+import xmltoexcel  # noqa: E402
+import xmltoexcel1  # noqa: E402
+import xmltoexcel2  # noqa: E402
+from frame_io import read_frame, read_sheets  # noqa: E402
+from odk_generator import write_submissions  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+
+
+def quietly(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def same_frames(expected, actual, label):
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual.reset_index(drop=True),
+                                  check_dtype=False, obj=label)
+
+
+def xmltoexcel_project(input_folder, store=None):
+    outputs = f"{input_folder}/Outputs_of_{Path(input_folder).name}"
+    processed = f"{input_folder}/processed_Outputs_of_{Path(input_folder).name}"
+    xmltoexcel.convert_xml_folders([(input_folder, outputs)])
+    xmltoexcel.process_folder(outputs, processed)
+    if store is not None:
+        xmltoexcel.store_sheets(processed, store, input_folder, cache=False)
+    else:
+        xmltoexcel.combine_excels(processed, f"{outputs}/combined result.xlsx", cache=False)
+    return f"{outputs}/combined result.xlsx"
+
+
+def check_exports(work, submissions, fields):
+    """Every converter's combined result and the master workbook, from Excel and from the store"""
+    store = SubmissionStore(work / "submissions.db")
+    combined = {}
+    for name, converter in (("path1", "xmltoexcel"), ("path2", "xmltoexcel1"), ("path3", "xmltoexcel2")):
+        excel_input = work / "excel" / name
+        store_input = work / "store" / name
+        for folder in (excel_input, store_input):
+            write_submissions(folder, submissions, fields=fields, repeats=2)
+        if converter == "xmltoexcel":
+            combined[name] = quietly(xmltoexcel_project, str(excel_input))
+            quietly(xmltoexcel_project, str(store_input), store)
+        else:
+            module = xmltoexcel1 if converter == "xmltoexcel1" else xmltoexcel2
+            quietly(module.convert_xml_folder, str(excel_input), str(excel_input / "Outputs"))
+            quietly(module.convert_xml_folder, str(store_input), str(store_input / "Outputs"), store=store)
+            file_name = "combined_results.xlsx" if converter == "xmltoexcel1" else "combined result.xlsx"
+            combined[name] = excel_input / "Outputs" / file_name
+
+        exported = work / f"{name} from store.xlsx"
+        store.export_combined(name, exported)
+        same_frames(read_frame(combined[name], cache=False), read_frame(exported, cache=False), name)
+        print(f" {converter:<12} combined result from the store matches the Excel sink")
+
+    # Master workbook: arrange.py over the fetched combined results, and from the store
+    fetched = []
+    for name, path in combined.items():
+        fetched.append(work / "fetched" / f"Combined result of Output of {name}.xlsx")
+        fetched[-1].parent.mkdir(exist_ok=True)
+        shutil.copy(path, fetched[-1])
+    excel_master = quietly(arrange.create_master_sheet, work / "fetched", fetched_files=fetched)
+    store_master = quietly(arrange.master_sheet_from_store, store, work / "from_store")
+    expected, actual = read_sheets(excel_master, cache=False), read_sheets(store_master, cache=False)
+    assert list(expected) == list(actual), (list(expected), list(actual))
+    for sheet in expected:
+        same_frames(expected[sheet], actual[sheet], f"master {sheet}")
+    print(" master_sheet.xlsx from the store matches arrange.py")
+
+    # Incremental runs: files added and removed
+    excel_input, store_input = work / "excel_inc" / "path4", work / "store_inc" / "path4"
+    for folder in (excel_input, store_input):
+        write_submissions(folder, submissions, fields=fields)
+    runs = {}
+    for step in range(2):
+        for label, folder in (("excel", excel_input), ("store", store_input)):
+            if step:
+                for removed in sorted(folder.glob("*.xml"))[:3]:
+                    removed.unlink()
+                extra = write_submissions(folder / "new", 5, fields=fields + 5)
+                for path in extra:
+                    os.replace(path, folder / f"new_{os.path.basename(path)}")
+            outputs = folder / "Outputs_of_path4"
+            runs[label] = outputs / "combined result.xlsx"
+            quietly(xmltoexcel.update_project, str(folder), str(outputs), str(folder / "processed"), str(runs[label]),
+                    store=store if label == "store" else None)
+        store.export_combined("path4", work / "path4 from store.xlsx")
+        same_frames(read_frame(runs["excel"], cache=False), read_frame(work / "path4 from store.xlsx", cache=False),
+                    f"incremental run {step + 1}")
+    print(" incremental xmltoexcel into the store matches its combined result (files added and removed)")
+    store.close()
+
+
+def timed_ms(func, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = func()
+    return (time.perf_counter() - start) * 1000 / repeats, result
+
+
+def check_scale(work, scale, fields, devices, lookups):
+    """Insert scale submissions and time indexed lookups"""
+    rng = random.Random(0)
+    columns = ["start", "end", "deviceid"] + [f"q{i}" for i in range(fields)] + ["instanceID"]
+    instance_ids = []
+    store = SubmissionStore(work / "scale.db")
+    start = time.perf_counter()
+    for form_number in range(4):
+        form = f"path{form_number + 10}"
+        with store.writer(form, replace=True) as writer:
+            for number in range(form_number, scale, 4):
+                device = f"collect:{number % devices:012x}"
+                day = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+                instance_id = f"uuid:{rng.getrandbits(128):032x}"
+                instance_ids.append(instance_id)
+                row = [f"{day}T09:00:00", f"{day}T09:45:00", device] + [rng.randint(0, 999) for _ in range(fields)]
+                writer.add(f"submission_{number:07d}.xml", columns, [row + [instance_id]],
+                           meta=(device, instance_id, f"{day}T09:45:00"))
+    seconds = time.perf_counter() - start
+    print(f"\n Inserted {scale} submissions in {seconds:.1f}s ({scale / seconds:.0f}/s), "
+          f"{os.path.getsize(work / 'scale.db') / 1e6:.0f} MB")
+
+    samples = [rng.choice(instance_ids) for _ in range(lookups)]
+    tests = [
+        ("instance ID", lambda: store.find(instance_id=samples.pop())),
+        ("device", lambda: store.find(device=f"collect:{rng.randrange(devices):012x}")),
+        ("one day", lambda: store.find(since="2024-03-05", before="2024-03-06")),
+        ("form + month", lambda: store.find(form="path11", since="2024-05-01", before="2024-06-01")),
+        ("form counts", store.forms),
+    ]
+    for label, lookup in tests:
+        ms, result = timed_ms(lookup, lookups if label == "instance ID" else 20)
+        print(f"  {label:<14} {ms:8.2f} ms  ({len(result)} results)")
+
+    # What answering the same question costs from a workbook: load it, then filter
+    sample_rows = min(scale // 4, 20000)
+    workbook = work / "path10 sample.xlsx"
+    with store.stacked("path10") as (names, rows):
+        pd.DataFrame([row for _, row in zip(range(sample_rows), rows)], columns=names).to_excel(workbook, index=False)
+    start = time.perf_counter()
+    df = pd.read_excel(workbook)
+    found = df[df["instanceID"] == instance_ids[0]]
+    print(f"  workbook load + filter of {sample_rows} rows: {(time.perf_counter() - start) * 1000:.0f} ms "
+          f"({len(found)} results)")
+    store.close()
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=100, help="XML files per converter for the export checks")
+    parser.add_argument("--fields", type=int, default=20)
+    parser.add_argument("--scale", type=int, default=200000, help="submissions inserted for the lookup timings")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--lookups", type=int, default=200, help="instance ID lookups to average")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work:
+        work = Path(work)
+        check_exports(work, args.submissions, args.fields)
+        if args.scale:
+            check_scale(work, args.scale, args.fields, args.devices, args.lookups)
+
+
+if __name__ == "__main__":
+    main_bench()
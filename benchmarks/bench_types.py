@@ -0,0 +1,78 @@
+"""compact_types.py: memory and groupby time of combined submissions as text vs compact dtypes.
+
+    python benchmarks/bench_types.py --submissions 20000 --fields 40
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+
+import columnar  # noqa: E402
+from compact_types import compact_frame, plan_types  # noqa: E402
+from form_plan import compile_xform  # noqa: E402
+from odk_generator import submission_xml, xform_xml  # noqa: E402
+
+
+def combined_frame(submissions, fields):
+    """xmltoexcel2's combined result: one row of parse_element keys per submission"""
+    builder = columnar.ColumnarBuilder()
+    for number in range(submissions):
+        columnar.element_record_columnar(ET.fromstring(submission_xml(number, fields=fields, seed=number)), builder)
+    return builder.to_frame()
+
+
+def timed(func, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def groupby(df):
+    """Mean of every numeric column per village, the kind of summary run on the combined data"""
+    village = next(column for column in df.columns if column.endswith("/q3/text"))
+    numeric = [column for column in df.columns if column.endswith(("/q0/text", "/q1/text", "/q5/text"))]
+    return df.groupby(village, observed=True)[numeric].agg(lambda values: values.astype(float).mean())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=5000)
+    parser.add_argument("--fields", type=int, default=40)
+    args = parser.parse_args(argv)
+
+    df = combined_frame(args.submissions, args.fields)
+    print(f" {len(df)} submissions x {df.shape[1]} columns")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xform = os.path.join(tmp, "form.xml")
+        with open(xform, "w", encoding="utf-8") as f:
+            f.write(xform_xml(fields=args.fields))
+        plan = compile_xform(xform, "element")
+
+    # Object columns of str are what pandas before 3.0 builds; 3.0 has a string dtype
+    frames = {"text": df.astype(object), "string dtype": df}
+    frames["inferred"], elapsed = timed(lambda: compact_frame(df), repeat=1)
+    print(f" inferring the types took {elapsed:.2f}s")
+    frames["form types"] = compact_frame(df, plan_types(plan))
+
+    base = frames["text"].memory_usage(deep=True).sum()
+    for label, frame in frames.items():
+        memory = frame.memory_usage(deep=True).sum()
+        _, elapsed = timed(lambda: groupby(frame))
+        print(f" {label:<14}{memory / 1e6:9.1f} MB ({base / memory:4.1f}x smaller)  groupby {elapsed * 1000:8.1f} ms")
+    kinds = frames["inferred"].dtypes.astype(str).value_counts()
+    print(" inferred dtypes: " + ", ".join(f"{kind} {count}" for kind, count in kinds.items()))
+
+
+if __name__ == "__main__":
+    main()
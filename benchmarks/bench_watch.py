@@ -0,0 +1,118 @@
+"""main.py --watch: time from plugging a tablet in to its files being synced, against a fake adb.
+
+    python benchmarks/bench_watch.py --devices 6 --submissions 200 --interval 0.5 --max-syncs 2
+    python benchmarks/bench_watch.py --devices 6 --submissions 200 --latency 0.02
+
+Tablets are "plugged in" one every --interval seconds by moving a device
+folder into the fake adb root; the last one first shows up unauthorized and
+is authorized a moment later. Every tablet is then unplugged and plugged in
+again, which the cooldown must ignore.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fake_adb  # noqa: E402
+import main  # noqa: E402
+from device_watch import DeviceWatcher  # noqa: E402
+from odk_generator import write_submissions  # noqa: E402
+
+
+def stage_device(staging, serial, submissions, fields):
+    folder = staging / serial
+    write_submissions(folder / main.DEVICE_BASE_PATH.lstrip("/") / "instances" / "household_survey", submissions,
+                      fields=fields)
+    return folder
+
+
+def wait_for(condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("the watcher did not finish in time")
+        time.sleep(0.01)
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--submissions", type=int, default=100, help="XML files per tablet")
+    parser.add_argument("--fields", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between tablets being plugged in")
+    parser.add_argument("--max-syncs", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every adb invocation")
+    parser.add_argument("--bulk", action="store_true")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        fake_adb.install(tmp / "bin")
+        os.environ["PATH"] = str(tmp / "bin") + os.pathsep + os.environ["PATH"]
+        os.environ["FAKE_ADB_ROOT"] = str(tmp / "devices")
+        os.environ["FAKE_ADB_LATENCY"] = str(args.latency)
+        (tmp / "devices").mkdir()
+        main.google_drive_auth = lambda: None
+
+        serials = [f"TABLET{number:02d}" for number in range(args.devices)]
+        staged = {serial: stage_device(tmp / "staging", serial, args.submissions, args.fields) for serial in serials}
+        plugged, synced, syncs = {}, {}, []
+
+        def sync(serial):
+            summary = main.sync_device(serial, tmp / "downloads" / serial, args.bulk)
+            synced[serial] = time.perf_counter()
+            syncs.append(serial)
+            return summary
+
+        watcher = DeviceWatcher(sync, max_syncs=args.max_syncs, cooldown=3600)
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            thread = threading.Thread(target=watcher.watch, daemon=True)
+            thread.start()
+            last = serials[-1]
+            (staged[last] / ".unauthorized").touch()
+            for serial in serials:
+                plugged[serial] = time.perf_counter()
+                shutil.move(str(staged[serial]), str(tmp / "devices" / serial))
+                time.sleep(args.interval)
+            # Accepting the USB debugging prompt on the last tablet
+            time.sleep(0.3)
+            plugged[last] = time.perf_counter()
+            (tmp / "devices" / last / ".unauthorized").unlink()
+            wait_for(lambda: len(synced) == len(serials), args.timeout)
+
+            # Unplug and replug everything: all within the cooldown
+            for serial in serials:
+                shutil.move(str(tmp / "devices" / serial), str(tmp / "staging" / serial))
+            time.sleep(0.3)
+            for serial in serials:
+                shutil.move(str(tmp / "staging" / serial), str(tmp / "devices" / serial))
+            time.sleep(0.5)
+            watcher.close()
+            thread.join()
+
+        pulled = {serial: len(list((tmp / "downloads" / serial).glob("*.xml"))) for serial in serials}
+        turnaround = [synced[serial] - plugged[serial] for serial in serials]
+        print(f" {args.devices} tablets x {args.submissions} files, plugged in every {args.interval}s, "
+              f"{args.max_syncs} syncs at once")
+        for serial in serials:
+            print(f" {serial}  plugged in -> synced {synced[serial] - plugged[serial]:7.2f}s  {pulled[serial]} files")
+        print(f" turnaround mean {sum(turnaround) / len(turnaround):.2f}s, max {max(turnaround):.2f}s")
+        print(f" syncs started: {len(syncs)} for {len(serials)} tablets (replugs inside the cooldown ignored)")
+        assert all(count == args.submissions for count in pulled.values())
+        assert len(syncs) == len(serials)
+        assert "not authorized" in log.getvalue()
+
+
+if __name__ == "__main__":
+    main_bench()
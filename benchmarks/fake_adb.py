@@ -0,0 +1,150 @@
+"""Minimal stand-in for the `adb` executable, backed by local folders.
+
+Each fake device is a folder under FAKE_ADB_ROOT named after its serial; the
+device path /sdcard/... maps to FAKE_ADB_ROOT/<serial>/sdcard/... Creating or
+removing a folder plugs a device in or out; a device folder holding a file
+named .unauthorized is listed as unauthorized.
+
+Environment:
+    FAKE_ADB_ROOT     folder holding one subfolder per fake device
+    FAKE_ADB_LATENCY  seconds to sleep per adb invocation (default 0)
+    FAKE_ADB_NO_TAR   set to 1 to pretend the device has no tar binary
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+DEVICE_PATH = re.compile(r'(?<![\w./])/sdcard/')
+LOCAL_PATH = re.compile(r'(?<![\w./])sdcard/')
+
+
+def install(bin_dir):
+    """Write an `adb` launcher into bin_dir that runs this script"""
+    bin_dir = Path(bin_dir)
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    launcher = bin_dir / "adb"
+    launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" "$@"\n')
+    launcher.chmod(0o755)
+    return launcher
+
+
+def device_roots():
+    root = Path(os.environ.get("FAKE_ADB_ROOT", "."))
+    return sorted(p for p in root.iterdir() if p.is_dir()) if root.exists() else []
+
+
+def device_state(root):
+    return "unauthorized" if (root / ".unauthorized").exists() else "device"
+
+
+def device_listing():
+    return "".join(f"{root.name}\t{device_state(root)}\n" for root in device_roots())
+
+
+def track_devices(interval=0.05):
+    """`adb track-devices`: the device list, prefixed by its length in 4 hex digits, on every change"""
+    last = None
+    while True:
+        listing = device_listing()
+        if listing != last:
+            data = listing.encode("utf-8")
+            try:
+                sys.stdout.buffer.write(b"%04x" % len(data) + data)
+                sys.stdout.buffer.flush()
+            except BrokenPipeError:
+                return 0
+            last = listing
+        time.sleep(interval)
+
+
+def pick_device(serial):
+    roots = device_roots()
+    if serial:
+        for root in roots:
+            if root.name == serial:
+                if device_state(root) != "device":
+                    sys.stderr.write("adb: device unauthorized.\n")
+                    sys.exit(1)
+                return root
+        sys.stderr.write(f"adb: device '{serial}' not found\n")
+        sys.exit(1)
+    if len(roots) != 1:
+        sys.stderr.write("adb: more than one device/emulator\n" if roots else "adb: no devices/emulators found\n")
+        sys.exit(1)
+    return roots[0]
+
+
+def device_command(root, command, binary):
+    """Run a device shell command against the device folder: (returncode, stdout, stderr) as bytes
+
+    Text output has its local paths turned back into device paths.
+    """
+    if os.environ.get("FAKE_ADB_NO_TAR") == "1" and re.search(r'\btar\b', command):
+        return 127, b"", b"/system/bin/sh: tar: inaccessible or not found\n"
+    if command.startswith("getprop"):
+        return 0, b"FakeTablet\n", b""
+
+    # Device paths become paths relative to the device folder
+    local_command = DEVICE_PATH.sub("sdcard/", command)
+    result = subprocess.run(["sh", "-c", local_command], cwd=root, capture_output=True)
+    stdout = result.stdout
+    if not binary:
+        stdout = LOCAL_PATH.sub("/sdcard/", stdout.decode("utf-8", "replace")).encode("utf-8")
+    return result.returncode, stdout, result.stderr
+
+
+def run_on_device(root, command, binary):
+    returncode, stdout, stderr = device_command(root, command, binary)
+    sys.stdout.buffer.write(stdout)
+    sys.stderr.buffer.write(stderr)
+    return returncode
+
+
+def main(argv):
+    time.sleep(float(os.environ.get("FAKE_ADB_LATENCY", "0")))
+
+    serial = None
+    if argv[:1] == ["-s"]:
+        serial, argv = argv[1], argv[2:]
+    if not argv:
+        return 1
+
+    command, args = argv[0], argv[1:]
+    if command == "--version":
+        print("Android Debug Bridge version 1.0.41 (fake)")
+        return 0
+    if command == "devices":
+        print("List of devices attached")
+        sys.stdout.write(device_listing())
+        print()
+        return 0
+    if command == "track-devices":
+        return track_devices()
+    if command == "get-state":
+        pick_device(serial)
+        print("device")
+        return 0
+    if command in ("shell", "exec-out"):
+        root = pick_device(serial)
+        return run_on_device(root, " ".join(args), binary=command == "exec-out")
+    if command == "pull":
+        root = pick_device(serial)
+        remote, local = args
+        source = root / remote.lstrip("/")
+        if not source.is_file():
+            sys.stderr.write(f"adb: error: remote object '{remote}' does not exist\n")
+            return 1
+        shutil.copyfile(source, local)
+        print(f"{remote}: 1 file pulled.")
+        return 0
+
+    sys.stderr.write(f"adb: unknown command {command}\n")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
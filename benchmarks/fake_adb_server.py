@@ -0,0 +1,240 @@
+"""Stand-in for the adb server, speaking its socket protocol, backed by the fake adb's device folders.
+
+    python benchmarks/fake_adb_server.py --port 5037
+
+Serves host:version, host:devices, host:track-devices, host-serial:<serial>:features,
+host:transport:<serial> and then shell (v1 and v2), exec and sync (STAT, LIST,
+RECV, QUIT) on the fake devices described in fake_adb.py, so adb_client.py
+and `main.py --native-adb` can run without a real adb or tablet. Prints the
+port it listens on (useful with --port 0).
+
+Environment:
+    FAKE_ADB_ROOT         folder holding one subfolder per fake device
+    FAKE_ADB_LATENCY      seconds to sleep per device request (default 0)
+    FAKE_ADB_NO_TAR       set to 1 to pretend the devices have no tar binary
+    FAKE_ADB_NO_SHELL_V2  set to 1 to leave shell_v2 out of the device features
+"""
+import argparse
+import os
+import select
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_adb import device_command, device_listing, device_roots, device_state  # noqa: E402
+
+SERVER_VERSION = 41
+SYNC_DATA_MAX = 64 * 1024
+
+
+class ClientGone(Exception):
+    pass
+
+
+def latency():
+    time.sleep(float(os.environ.get("FAKE_ADB_LATENCY", "0")))
+
+
+class Handler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def recv_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ClientGone()
+            data += chunk
+        return data
+
+    def send(self, data):
+        self.request.sendall(data)
+
+    def okay(self, answer=None):
+        self.send(b"OKAY")
+        if answer is not None:
+            self.send_string(answer)
+
+    def fail(self, message):
+        self.send(b"FAIL")
+        self.send_string(message)
+
+    def send_string(self, text):
+        data = text.encode("utf-8")
+        self.send(b"%04x" % len(data) + data)
+
+    def handle(self):
+        try:
+            self.serve()
+        except (ClientGone, ConnectionError):
+            pass
+
+    def serve(self):
+        device = None
+        while True:
+            service = self.recv_exact(int(self.recv_exact(4), 16)).decode("utf-8")
+            if device is None:
+                device = self.host_service(service)
+                if device is None:
+                    return
+            else:
+                latency()
+                self.device_service(device, service)
+                return
+
+    def host_service(self, service):
+        """Answer a host request; returns the device folder once a transport is chosen"""
+        if service == "host:version":
+            self.okay(f"{SERVER_VERSION:04x}")
+        elif service == "host:devices":
+            self.okay(device_listing())
+        elif service == "host:track-devices":
+            self.okay()
+            self.track_devices()
+        elif service.startswith("host-serial:") and service.endswith(":features"):
+            root = self.find_device(service[len("host-serial:"):-len(":features")])
+            if root is not None:
+                no_v2 = os.environ.get("FAKE_ADB_NO_SHELL_V2") == "1"
+                self.okay("cmd,stat_v2" if no_v2 else "shell_v2,cmd,stat_v2")
+        elif service.startswith("host:transport:") or service == "host:transport-any":
+            root = self.find_device(service[len("host:transport:"):] if service != "host:transport-any" else None)
+            if root is not None:
+                self.okay()
+                return root
+        else:
+            self.fail(f"unknown host service '{service}'")
+        return None
+
+    def find_device(self, serial):
+        roots = device_roots()
+        if serial is None:
+            if len(roots) != 1:
+                self.fail("more than one device/emulator" if roots else "no devices/emulators found")
+                return None
+            root = roots[0]
+        else:
+            root = next((root for root in roots if root.name == serial), None)
+            if root is None:
+                self.fail(f"device '{serial}' not found")
+                return None
+        if device_state(root) != "device":
+            self.fail("device unauthorized.\nThis adb server's $ADB_VENDOR_KEYS is not set")
+            return None
+        return root
+
+    def track_devices(self, interval=0.05):
+        last = None
+        while True:
+            listing = device_listing()
+            if listing != last:
+                self.send_string(listing)
+                last = listing
+            readable, _, _ = select.select([self.request], [], [], interval)
+            if readable and not self.request.recv(1):
+                return
+
+    def device_service(self, root, service):
+        if service.startswith("shell,v2,raw:") or service.startswith("shell,v2:"):
+            returncode, stdout, stderr = device_command(root, service.split(":", 1)[1], binary=False)
+            self.okay()
+            for packet_id, data in ((1, stdout), (2, stderr), (3, bytes([returncode & 0xFF]))):
+                if data:
+                    self.send(struct.pack("<BI", packet_id, len(data)) + data)
+        elif service.startswith("shell:"):
+            returncode, stdout, stderr = device_command(root, service[len("shell:"):], binary=False)
+            self.okay()
+            # v1 merges both streams; stderr first keeps the exit code a client echoes at the very end
+            self.send(stderr + stdout)
+        elif service.startswith("exec:"):
+            returncode, stdout, stderr = device_command(root, service[len("exec:"):], binary=True)
+            self.okay()
+            self.send(stdout)
+        elif service == "sync:":
+            self.okay()
+            self.sync(root)
+        else:
+            self.fail(f"unknown device service '{service}'")
+
+    def sync(self, root):
+        while True:
+            request, length = struct.unpack("<4sI", self.recv_exact(8))
+            path = self.recv_exact(length).decode("utf-8")
+            if request == b"QUIT":
+                return
+            latency()
+            local = root / path.lstrip("/")
+            if request == b"STAT":
+                try:
+                    info = local.stat()
+                    self.send(struct.pack("<4sIII", b"STAT", info.st_mode, info.st_size, int(info.st_mtime)))
+                except OSError:
+                    self.send(struct.pack("<4sIII", b"STAT", 0, 0, 0))
+            elif request == b"LIST":
+                try:
+                    entries = [".", ".."] + sorted(os.listdir(local))
+                except OSError:
+                    entries = []
+                for name in entries:
+                    try:
+                        info = (local / name).stat()
+                    except OSError:
+                        continue
+                    data = name.encode("utf-8")
+                    self.send(struct.pack("<4sIIII", b"DENT", info.st_mode, info.st_size, int(info.st_mtime),
+                                          len(data)) + data)
+                self.send(struct.pack("<4sIIII", b"DONE", 0, 0, 0, 0))
+            elif request == b"RECV":
+                try:
+                    with open(local, "rb") as f:
+                        while True:
+                            chunk = f.read(SYNC_DATA_MAX)
+                            if not chunk:
+                                break
+                            self.send(struct.pack("<4sI", b"DATA", len(chunk)) + chunk)
+                except OSError as e:
+                    message = f"remote object '{path}' does not exist" if not local.exists() else str(e)
+                    data = message.encode("utf-8")
+                    # adbd ends the sync service after a failed transfer
+                    self.send(struct.pack("<4sI", b"FAIL", len(data)) + data)
+                    return
+                self.send(struct.pack("<4sI", b"DONE", 0))
+            else:
+                data = f"unknown sync request {request!r}".encode("utf-8")
+                self.send(struct.pack("<4sI", b"FAIL", len(data)) + data)
+                return
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start(port=0):
+    """Serve in a background thread; returns the server (its port is server.server_address[1])"""
+    server = Server(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=5037, help="port to listen on, 0 for any free port")
+    args = parser.parse_args(argv)
+    server = Server(("127.0.0.1", args.port), Handler)
+    print(server.server_address[1], flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Local stand-in for the parts of the Google Drive v3 API used by the uploader.
+
+Supports files.list (paged), metadata-only files.create, simple, multipart
+and resumable media uploads for files.create/files.update, and batch
+requests. Failures can be injected to exercise retry and resume paths, also
+after the request was carried out, as when a response is lost:
+
+    server = FakeDriveServer()
+    server.start()
+    service = drive_uploader.build_drive_service(root_url=server.root_url, http=build_http())
+    server.fail_next(3, status=503)
+    ...
+    server.stop()
+"""
+import email.parser
+import hashlib
+import itertools
+import json
+import re
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeDriveServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.files = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.failures = []
+        self.uploads = {}
+        self.request_log = []
+        self.httpd = ThreadingHTTPServer((host, port), self.handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def root_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def fail_next(self, count, status=503, match=None, processed=False):
+        """Answer the next `count` requests (whose path contains `match`) with `status`
+
+        With processed the request is carried out first, like a response lost
+        on its way back.
+        """
+        with self.lock:
+            self.failures.extend([(status, match, processed)] * count)
+
+    def add_file(self, name, parent, content=b""):
+        """Create a file directly on the fake server and return its id"""
+        with self.lock:
+            return self._store(None, {"name": name, "parents": [parent]}, content)["id"]
+
+    # ----------------------------------------------------------------- storage
+    def _store(self, file_id, metadata, content=None):
+        if file_id is None:
+            file_id = f"fake{next(self.ids)}"
+            self.files[file_id] = {"id": file_id, "name": "Untitled", "parents": [], "content": b""}
+        entry = self.files[file_id]
+        for key in ("name", "parents", "mimeType"):
+            if key in metadata:
+                entry[key] = metadata[key]
+        if content is not None:
+            entry["content"] = content
+        return self._describe(entry)
+
+    @staticmethod
+    def _describe(entry):
+        return {
+            "kind": "drive#file",
+            "id": entry["id"],
+            "name": entry["name"],
+            "parents": entry["parents"],
+            "size": str(len(entry["content"])),
+            "md5Checksum": hashlib.md5(entry["content"]).hexdigest(),
+        }
+
+    # ---------------------------------------------------------------- dispatch
+    def dispatch(self, method, target, headers, body):
+        """Handle one API call and return (status, headers, body_bytes)"""
+        headers = {key.lower(): value for key, value in headers.items()}
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        path = url.path
+        failure = None
+        with self.lock:
+            self.request_log.append((method, path, query.get("uploadType")))
+            for index, (status, match, processed) in enumerate(self.failures):
+                if match is None or match in target:
+                    failure = self.failures.pop(index)
+                    break
+        if failure is not None:
+            status, _, processed = failure
+            if processed:
+                self._route(method, headers, body, query, path)
+            return self._json(status, {"error": {"code": status, "message": "injected failure"}})
+        return self._route(method, headers, body, query, path)
+
+    def _route(self, method, headers, body, query, path):
+        if path.startswith("/batch/"):
+            return self._batch(headers, body)
+        if method == "GET" and path == "/drive/v3/files":
+            return self._list(query)
+
+        match = re.fullmatch(r"(/upload)?/drive/v3/files(?:/([^/]+))?", path)
+        if not match:
+            return self._json(404, {"error": {"code": 404, "message": f"no route for {path}"}})
+        is_upload, file_id = match.group(1), match.group(2)
+        if file_id and file_id not in self.files:
+            return self._json(404, {"error": {"code": 404, "message": f"File not found: {file_id}"}})
+
+        if method == "GET":
+            return self._json(200, self._describe(self.files[file_id]))
+        if not is_upload:
+            metadata = json.loads(body or b"{}")
+            with self.lock:
+                return self._json(200, self._store(file_id, metadata))
+
+        upload_type = query.get("uploadType", "media")
+        if "upload_id" in query:
+            return self._resumable_chunk(query["upload_id"], headers, body)
+        if upload_type == "resumable":
+            metadata = json.loads(body or b"{}")
+            upload_id = f"up{next(self.ids)}"
+            with self.lock:
+                self.uploads[upload_id] = {"file_id": file_id, "metadata": metadata, "data": bytearray()}
+            location = f"{self.root_url}upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+            return 200, {"Location": location, "Content-Length": "0"}, b""
+        if upload_type == "multipart":
+            metadata, content = self._split_multipart(headers, body)
+        else:
+            metadata, content = {}, body
+        with self.lock:
+            return self._json(200, self._store(file_id, metadata, content))
+
+    def _list(self, query):
+        q = query.get("q", "")
+        parent = re.search(r"'([^']+)' in parents", q)
+        name = re.search(r"name\s*=\s*'((?:[^'\\]|\\.)*)'", q)
+        with self.lock:
+            entries = [self._describe(entry) for entry in self.files.values()
+                       if (not parent or parent.group(1) in entry["parents"])
+                       and (not name or entry["name"] == name.group(1).replace("\\'", "'"))]
+        size = int(query.get("pageSize", 100))
+        start = int(query.get("pageToken", 0) or 0)
+        page = {"files": entries[start:start + size]}
+        if start + size < len(entries):
+            page["nextPageToken"] = str(start + size)
+        return self._json(200, page)
+
+    def _resumable_chunk(self, upload_id, headers, body):
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+        if upload is None:
+            return self._json(404, {"error": {"code": 404, "message": "unknown upload"}})
+        content_range = headers.get("content-range", "")
+        match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+|\*)", content_range)
+        status_query = re.fullmatch(r"bytes \*/(\d+|\*)", content_range)
+        with self.lock:
+            if match:
+                start, total = int(match.group(1)), match.group(3)
+                # Only accept chunks that continue exactly where the committed data ends
+                if start == len(upload["data"]):
+                    upload["data"].extend(body)
+                if total != "*" and len(upload["data"]) == int(total):
+                    del self.uploads[upload_id]
+                    return self._json(200, self._store(upload["file_id"], upload["metadata"], bytes(upload["data"])))
+            elif not status_query:
+                upload["data"][:] = body
+                del self.uploads[upload_id]
+                return self._json(200, self._store(upload["file_id"], upload["metadata"], bytes(upload["data"])))
+            committed = len(upload["data"])
+        headers = {"Content-Length": "0"}
+        if committed:
+            headers["Range"] = f"bytes=0-{committed - 1}"
+        return 308, headers, b""
+
+    def _batch(self, headers, body):
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {headers.get('content-type')}\r\n\r\n".encode() + body
+        )
+        boundary = "fake_batch_boundary"
+        parts = []
+        for part in message.get_payload():
+            request = part.get_payload(decode=False)
+            if isinstance(request, str):
+                request = request.encode("utf-8")
+            head, _, inner_body = request.partition(b"\r\n\r\n")
+            if not _:
+                head, _, inner_body = request.partition(b"\n\n")
+            lines = head.decode("utf-8").splitlines()
+            method, target = lines[0].split(" ")[:2]
+            inner_headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+            status, _, payload = self.dispatch(method, target, inner_headers, inner_body)
+            content_id = part.get("Content-ID", "<>")
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{payload.decode('utf-8')}\r\n"
+            )
+        content = ("".join(parts) + f"--{boundary}--\r\n").encode("utf-8")
+        return 200, {"Content-Type": f"multipart/mixed; boundary={boundary}"}, content
+
+    @staticmethod
+    def _split_multipart(headers, body):
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {headers.get('content-type')}\r\n\r\n".encode() + body
+        )
+        metadata_part, media_part = message.get_payload()
+        metadata = json.loads(metadata_part.get_payload(decode=True) or b"{}")
+        return metadata, media_part.get_payload(decode=True)
+
+    @staticmethod
+    def _json(status, payload):
+        return status, {"Content-Type": "application/json; charset=UTF-8"}, json.dumps(payload).encode("utf-8")
+
+    # ------------------------------------------------------------------ server
+    def handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                status, headers, payload = server.dispatch(self.command, self.path, dict(self.headers.items()), body)
+                self.send_response(status)
+                for key, value in headers.items():
+                    if key != "Content-Length":
+                        self.send_header(key, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = do_PUT = _handle
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import time
+
+    fake = FakeDriveServer(port=8765).start()
+    print(f"Fake Drive listening on {fake.root_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fake.stop()
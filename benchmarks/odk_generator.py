@@ -0,0 +1,167 @@
+"""Generate realistic ODK Collect submission XML for benchmarks.
+
+    python benchmarks/odk_generator.py OUTPUT_FOLDER --submissions 1000 --fields 40 --repeats 5 --depth 2
+"""
+import argparse
+import os
+import random
+import uuid
+from xml.sax.saxutils import escape
+
+CROPS = ["maize", "rice", "wheat", "millet", "sorghum", "cassava", "beans", "groundnut"]
+VILLAGES = ["Amba", "Bela", "Chitra", "Dhara", "Eklavya", "Ganga"]
+
+
+def field_value(rng, number):
+    kind = number % 5
+    if kind == 0:
+        return str(rng.randint(0, 500))
+    if kind == 1:
+        return f"{rng.uniform(0, 100):.2f}"
+    if kind == 2:
+        return rng.choice(["yes", "no"])
+    if kind == 3:
+        return rng.choice(VILLAGES)
+    return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def repeat_group(rng, depth, repeats, padding, level=1):
+    parts = []
+    for _ in range(rng.randint(1, repeats) if repeats else 0):
+        inner = [
+            f"<crop_name>{rng.choice(CROPS)}</crop_name>",
+            f"<area unit=\"acre\">{rng.uniform(0.1, 10):.2f}</area>",
+            f"<yield_kg>{rng.randint(10, 5000)}</yield_kg>",
+        ]
+        if padding:
+            inner.append(f"<notes>{escape('x' * padding)}</notes>")
+        if level < depth:
+            inner.append(repeat_group(rng, depth, max(1, repeats // 2), padding, level + 1))
+        tag = "Q3_cropping" if level == 1 else f"plot_level{level}"
+        parts.append(f"<{tag}>{''.join(inner)}</{tag}>")
+    return "".join(parts)
+
+
+def submission_xml(number, fields=20, repeats=3, depth=1, padding=0, form_id="household_survey", seed=None):
+    """One ODK submission as an XML string"""
+    rng = random.Random(number if seed is None else seed)
+    group_size = 10
+    groups = []
+    for start in range(0, fields, group_size):
+        body = "".join(f"<q{i}>{field_value(rng, i)}</q{i}>" for i in range(start, min(start + group_size, fields)))
+        groups.append(f"<group_{start // group_size}>{body}</group_{start // group_size}>")
+    instance_id = uuid.UUID(int=rng.getrandbits(128))
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<data id="{form_id}" version="2024060101">'
+        f"<start>2024-06-{number % 28 + 1:02d}T09:00:00.000+05:30</start>"
+        f"<end>2024-06-{number % 28 + 1:02d}T09:45:00.000+05:30</end>"
+        f"<deviceid>collect:{rng.getrandbits(48):012x}</deviceid>"
+        f"{''.join(groups)}"
+        f"{repeat_group(rng, depth, repeats, padding)}"
+        f"<meta><instanceID>uuid:{instance_id}</instanceID></meta>"
+        "</data>"
+    )
+
+
+FIELD_TYPES = ["int", "decimal", "select1", "string", "date"]
+
+
+def xform_xml(fields=20, depth=1, form_id="household_survey"):
+    """The XForm definition matching submission_xml(..., fields, depth)"""
+    group_size = 10
+    groups = []
+    binds = [
+        '<bind nodeset="/data/start" type="dateTime"/>',
+        '<bind nodeset="/data/end" type="dateTime"/>',
+        '<bind nodeset="/data/deviceid" type="string"/>',
+        '<bind nodeset="/data/meta/instanceID" type="string" readonly="true()"/>',
+    ]
+    for start in range(0, fields, group_size):
+        group = f"group_{start // group_size}"
+        numbers = range(start, min(start + group_size, fields))
+        groups.append(f"<{group}>{''.join(f'<q{i}/>' for i in numbers)}</{group}>")
+        binds.extend(f'<bind nodeset="/data/{group}/q{i}" type="{FIELD_TYPES[i % 5]}"/>' for i in numbers)
+
+    repeats = []
+
+    def repeat_template(level, parent):
+        tag = "Q3_cropping" if level == 1 else f"plot_level{level}"
+        nodeset = f"{parent}/{tag}"
+        repeats.append(nodeset)
+        binds.extend([
+            f'<bind nodeset="{nodeset}/crop_name" type="string"/>',
+            f'<bind nodeset="{nodeset}/area" type="decimal"/>',
+            f'<bind nodeset="{nodeset}/yield_kg" type="int"/>',
+            f'<bind nodeset="{nodeset}/notes" type="string"/>',
+        ])
+        inner = '<crop_name/><area unit="acre"/><yield_kg/><notes/>'
+        if level < depth:
+            inner += repeat_template(level + 1, nodeset)
+        return f'<{tag} jr:template="">{inner}</{tag}>'
+
+    template = repeat_template(1, "/data") if depth else ""
+    body = "".join(f'<group ref="{nodeset}"><repeat nodeset="{nodeset}"/></group>' for nodeset in repeats)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<h:html xmlns="http://www.w3.org/2002/xforms" xmlns:h="http://www.w3.org/1999/xhtml" '
+        'xmlns:jr="http://openrosa.org/javarosa" xmlns:orx="http://openrosa.org/xforms">'
+        f"<h:head><h:title>{form_id}</h:title><model>"
+        f'<instance><data id="{form_id}" version="2024060101">'
+        f"<start/><end/><deviceid/>{''.join(groups)}{template}<meta><instanceID/></meta>"
+        "</data></instance>"
+        f"{''.join(binds)}"
+        "</model></h:head>"
+        f"<h:body>{body}</h:body></h:html>"
+    )
+
+
+def write_submissions(folder, count, **options):
+    """Write `count` submissions as separate files and return their paths"""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for number in range(count):
+        path = os.path.join(folder, f"submission_{number:06d}.xml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(submission_xml(number, **options))
+        paths.append(path)
+    return paths
+
+
+def write_large_submission(path, target_bytes, fields=20, padding=0):
+    """Write one submission whose repeat group grows until the file reaches target_bytes"""
+    rng = random.Random(0)
+    head = submission_xml(0, fields=fields, repeats=0)
+    head, tail = head.rsplit("<meta>", 1)
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(head)
+        while written < target_bytes:
+            chunk = repeat_group(rng, 2, 4, padding)
+            f.write(chunk)
+            written += len(chunk)
+        f.write("<meta>" + tail)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic ODK submission XML files")
+    parser.add_argument("output")
+    parser.add_argument("--submissions", type=int, default=100)
+    parser.add_argument("--fields", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3, help="maximum repeat instances per group")
+    parser.add_argument("--depth", type=int, default=1, help="nesting depth of repeat groups")
+    parser.add_argument("--padding", type=int, default=0, help="extra characters per repeat to grow file size")
+    parser.add_argument("--xform", help="also write the matching XForm definition to this file")
+    args = parser.parse_args(argv)
+    paths = write_submissions(args.output, args.submissions, fields=args.fields, repeats=args.repeats,
+                              depth=args.depth, padding=args.padding)
+    print(f"Wrote {len(paths)} submissions to {args.output}")
+    if args.xform:
+        with open(args.xform, "w", encoding="utf-8") as f:
+            f.write(xform_xml(fields=args.fields, depth=args.depth))
+        print(f"Wrote the form definition to {args.xform}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Benchmark suite: every pipeline stage on synthetic ODK submissions, a fake adb and a fake Drive.
+
+    python benchmarks/run_suite.py --submissions 500 --fields 40 --depth 2 --output suite.json
+    python benchmarks/run_suite.py --submissions 500 --fields 40 --depth 2 --compare suite.json
+
+The submissions from odk_generator.py are put on a fake device (fake_adb.py
+on PATH), pulled with main.find_and_pull_xml, uploaded to a local fake Drive
+server (fake_drive.py) and taken through the three converters, Step 2, Step 3,
+arrange.py and header_match.py. Each stage's time, throughput and peak memory
+are printed and written as JSON; --compare flags stages that got slower than a
+saved run by more than --tolerance and exits with status 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+sys.path.insert(0, os.path.join(ROOT, "data_arrangement"))
+
+import arrange  # noqa: E402
+import drive_uploader  # noqa: E402
+import fake_adb  # noqa: E402
+import header_match  # noqa: E402
+import main  # noqa: E402
+import xmltoexcel  # noqa: E402
+import xmltoexcel1  # noqa: E402
+import xmltoexcel2  # noqa: E402
+from fake_drive import FakeDriveServer  # noqa: E402
+from googleapiclient.http import build_http  # noqa: E402
+from odk_generator import submission_xml, write_large_submission  # noqa: E402
+
+SERIAL = "FAKE001"
+STAGES = ["find_and_pull_xml", "upload_to_drive", "xmltoexcel.convert_xml_folder", "xmltoexcel1.convert_xml_folder",
+          "xmltoexcel2.convert_xml_folder", "shift_and_truncate_sheet", "combine_excels", "create_master_sheet",
+          "match_headers"]
+
+
+def make_device(devices, options):
+    """The generated submissions on the fake device, spread over form folders like ODK Collect keeps them"""
+    base = Path(devices) / SERIAL / main.DEVICE_BASE_PATH.lstrip("/") / "instances"
+    for number in range(options.submissions):
+        folder = base / f"household_survey_{number // 50}"
+        folder.mkdir(parents=True, exist_ok=True)
+        xml = submission_xml(number, fields=options.fields, repeats=options.repeats, depth=options.depth,
+                             padding=options.padding)
+        (folder / f"submission_{number:06d}.xml").write_text(xml, encoding="utf-8")
+    if options.large_mb:
+        folder = base / "household_survey_large"
+        folder.mkdir(parents=True, exist_ok=True)
+        write_large_submission(folder / "large_submission.xml", int(options.large_mb * 1e6), fields=options.fields,
+                               padding=options.padding)
+
+
+def folder_files(folder, suffix):
+    return sorted(path for path in Path(folder).iterdir() if path.is_file() and path.name.lower().endswith(suffix))
+
+
+def total_bytes(paths):
+    return sum(os.path.getsize(path) for path in paths)
+
+
+class Suite:
+    """Runs the stages in order in one work folder; with traced=True it records peak memory instead of time"""
+
+    def __init__(self, work, options, traced=False):
+        self.work = Path(work)
+        self.options = options
+        self.traced = traced
+        self.results = {}
+
+    def stage(self, name, func, items, nbytes, unit):
+        """Run func() as stage name over items inputs of nbytes bytes"""
+        if self.traced:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func()
+        elapsed = time.perf_counter() - start
+        result_info = {"items": items, "unit": unit, "input_mb": round(nbytes / 1e6, 3)}
+        if self.traced:
+            result_info["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+            tracemalloc.stop()
+        else:
+            result_info.update({
+                "seconds": round(elapsed, 4),
+                "items_per_s": round(items / elapsed, 2) if elapsed else None,
+                "mb_per_s": round(nbytes / 1e6 / elapsed, 3) if elapsed else None,
+            })
+        self.results[name] = result_info
+        return result
+
+    def run(self):
+        options = self.options
+        source = self.work / "source"
+        project = source / "path1"
+        outputs = project / "Outputs_of_path1"
+        processed = project / "processed_Outputs_of_path1"
+
+        # Pull from the fake device, with uploads done separately below
+        main.google_drive_auth = lambda: None
+        summary = self.stage("find_and_pull_xml", lambda: main.find_and_pull_xml(SERIAL, project, bulk=options.bulk),
+                             options.submissions + (1 if options.large_mb else 0), 0, "files")
+        xml_files = folder_files(project, ".xml")
+        xml_bytes = total_bytes(xml_files)
+        pulled = self.results["find_and_pull_xml"]
+        pulled["input_mb"] = round(xml_bytes / 1e6, 3)
+        if pulled.get("seconds"):
+            pulled["mb_per_s"] = round(xml_bytes / 1e6 / pulled["seconds"], 3)
+        if summary["pulled"] != len(xml_files):
+            raise RuntimeError(f"pulled {summary['pulled']} files, found {len(xml_files)}")
+
+        server = FakeDriveServer().start()
+        try:
+            def service():
+                return drive_uploader.build_drive_service(root_url=server.root_url, http=build_http())
+
+            if options.upload_workers:
+                def upload():
+                    with drive_uploader.DriveUploader(service, main.DRIVE_FOLDER_ID,
+                                                      max_workers=options.upload_workers) as uploader:
+                        return uploader.upload_files(xml_files)
+            else:
+                def upload():
+                    drive = service()
+                    return [main.upload_to_drive(drive, str(path)) for path in xml_files]
+            self.stage("upload_to_drive", upload, len(xml_files), xml_bytes, "files")
+        finally:
+            server.stop()
+
+        workers = options.workers
+        self.stage("xmltoexcel.convert_xml_folder",
+                   lambda: xmltoexcel.convert_xml_folder(str(project), str(outputs), workers=workers),
+                   len(xml_files), xml_bytes, "files")
+        self.stage("xmltoexcel1.convert_xml_folder",
+                   lambda: xmltoexcel1.convert_xml_folder(str(project), str(self.work / "xmltoexcel1"),
+                                                          workers=workers),
+                   len(xml_files), xml_bytes, "files")
+        self.stage("xmltoexcel2.convert_xml_folder",
+                   lambda: xmltoexcel2.convert_xml_folder(str(project), str(self.work / "xmltoexcel2"),
+                                                          workers=workers),
+                   len(xml_files), xml_bytes, "files")
+
+        sheets = folder_files(outputs, ".xlsx")
+        self.stage("shift_and_truncate_sheet", lambda: xmltoexcel.process_folder(str(outputs), str(processed)),
+                   len(sheets), total_bytes(sheets), "workbooks")
+        sheets = folder_files(processed, ".xlsx")
+        combined_file = outputs / "combined result.xlsx"
+        self.stage("combine_excels", lambda: xmltoexcel.combine_excels(str(processed), str(combined_file), cache=False),
+                   len(sheets), total_bytes(sheets), "workbooks")
+
+        dest_dir = self.work / "combined sheet"
+
+        def master():
+            arrange.fetch_and_rename_excel_files(source, dest_dir)
+            return arrange.create_master_sheet(dest_dir, cache=False)
+        master_path = self.stage("create_master_sheet", master, 1, os.path.getsize(combined_file), "sheets")
+
+        # Forms_IDs naming every column of the sheet, as header_match.py expects
+        ids_directory = self.work / "Forms_IDs"
+        ids_directory.mkdir()
+        columns = [str(column) for column in pd.read_excel(master_path, nrows=0).columns]
+        pd.DataFrame({"ID": columns, "Name": [f"Question {column}" for column in columns]}).to_excel(
+            ids_directory / "Form1.xlsx", index=False)
+        self.stage("match_headers",
+                   lambda: header_match.match_headers(str(master_path), str(ids_directory),
+                                                      str(self.work / "renamed_data.xlsx"), {"path1": "Form1.xlsx"},
+                                                      cache=False),
+                   1, os.path.getsize(master_path), "sheets")
+        return self.results
+
+
+def run_suite(options, traced=False):
+    with tempfile.TemporaryDirectory() as work:
+        devices = Path(work) / "devices"
+        make_device(devices, options)
+        os.environ["FAKE_ADB_ROOT"] = str(devices)
+        return Suite(Path(work) / "run", options, traced).run()
+
+
+def environment():
+    import openpyxl
+    return {"python": platform.python_version(), "pandas": pd.__version__, "openpyxl": openpyxl.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def compare(report, baseline, tolerance):
+    """Print each stage's time against the baseline; returns the stages that got slower than tolerance allows"""
+    regressions = []
+    print(f"\n compared with {baseline.get('created', 'the baseline')}")
+    for name in STAGES:
+        now = report["stages"].get(name, {}).get("seconds")
+        before = baseline.get("stages", {}).get(name, {}).get("seconds")
+        if not now or not before:
+            continue
+        ratio = now / before
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f" {name:<34}{before:9.2f}s -> {now:8.2f}s  {ratio:5.2f}x{flag}")
+    return regressions
+
+
+def main_suite(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=200)
+    parser.add_argument("--fields", type=int, default=40)
+    parser.add_argument("--repeats", type=int, default=3, help="maximum repeat instances per group")
+    parser.add_argument("--depth", type=int, default=1, help="nesting depth of repeat groups")
+    parser.add_argument("--padding", type=int, default=0, help="extra characters per repeat to grow file size")
+    parser.add_argument("--large-mb", type=float, default=0, help="also add one submission of this many MB")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every adb invocation")
+    parser.add_argument("--bulk", action="store_true", help="pull with the bulk tar transfer")
+    parser.add_argument("--upload-workers", type=int, default=0,
+                        help="upload through drive_uploader.DriveUploader with this many workers "
+                             "instead of main.upload_to_drive one file at a time")
+    parser.add_argument("--workers", type=int, default=1, help="process pool size for the converters")
+    parser.add_argument("--no-memory", action="store_true", help="skip the second, traced run for peak memory")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare the times with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slow-down before a stage is flagged")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tools:
+        fake_adb.install(Path(tools) / "bin")
+        os.environ["PATH"] = str(Path(tools) / "bin") + os.pathsep + os.environ["PATH"]
+        os.environ["FAKE_ADB_LATENCY"] = str(args.latency)
+
+        stages = run_suite(args)
+        if not args.no_memory:
+            for name, traced in run_suite(args, traced=True).items():
+                stages[name]["peak_mb"] = traced["peak_mb"]
+
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output", "compare", "tolerance")}
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "parameters": parameters,
+              "environment": environment(), "stages": stages}
+
+    print(f" {args.submissions} submissions, {args.fields} fields, repeats up to {args.repeats} nested {args.depth} deep")
+    for name in STAGES:
+        stage = stages[name]
+        peak = f"  peak {stage['peak_mb']:8.1f} MB" if "peak_mb" in stage else ""
+        print(f" {name:<34}{stage['seconds']:8.2f}s  {stage['items_per_s']:9.1f} {stage['unit']}/s"
+              f"  {stage['mb_per_s']:7.2f} MB/s{peak}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        print(f" Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_suite()
@@ -1,17 +1,30 @@
+import os
+import sys
 import shutil
+import argparse
 from pathlib import Path
-import pandas as pd
 
-def fetch_and_rename_excel_files():
-    # Define source and destination directories
-    source_base = Path("S:/Desktop/your source path")
-    dest_dir = Path("S:/Desktop/combined sheet")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_io import FORMATS, book_path, read_frames, write_sheets  # noqa: E402
+from instrumentation import add_arguments, count, instrumented, session  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+
+# Define source and destination directories
+SOURCE_BASE = Path("S:/Desktop/your source path")
+DEST_DIR = Path("S:/Desktop/combined sheet")
+
+@instrumented("arrange.fetch_and_rename_excel_files")
+def fetch_and_rename_excel_files(source_base=SOURCE_BASE, dest_dir=DEST_DIR, fmt="xlsx"):
+    """Copy each project's combined result (xlsx, parquet or feather) into dest_dir"""
+    source_base = Path(source_base)
+    dest_dir = Path(dest_dir)
     
     # Create destination directory if it doesn't exist
     dest_dir.mkdir(parents=True, exist_ok=True)
     
     # Process the initial directory without a number suffix
-    process_directory(source_base / "path" , dest_dir)
+    process_directory(source_base / "path" , dest_dir, fmt)
     
     # Process directories with number suffixes starting from 1
     i = 1
@@ -20,14 +33,14 @@ def fetch_and_rename_excel_files():
         if not dir_path.exists():
             print(f"Directory {dir_path} does not exist. Stopping.")
             break  # Stop if the directory doesn't exist
-        process_directory(dir_path, dest_dir)
+        process_directory(dir_path, dest_dir, fmt)
         i += 1
 
     print("the path is",dir_path)
 
-def process_directory(dir_path, dest_dir):
+def process_directory(dir_path, dest_dir, fmt="xlsx"):
     print(f"Processing directory: {dir_path}")  # Added log
-    excel_file = dir_path / "combined result.xlsx"
+    excel_file = dir_path / f"combined result{FORMATS[fmt]}"
     if not excel_file.exists():
         print(f"Warning: The file {excel_file} does not exist in {dir_path}.")
         return
@@ -37,38 +50,82 @@ def process_directory(dir_path, dest_dir):
     parts = original_dir_name.split('_')
     parts[0] = 'Output'  # Replace 'Outputs' with 'Output'
     new_part = ' '.join(parts)
-    new_filename = f"Combined result of {new_part}.xlsx"
+    new_filename = f"Combined result of {new_part}{FORMATS[fmt]}"
     dest_path = dest_dir / new_filename
     
     # Copy the file to the destination with the new name
     print(f"Copying file from: {excel_file} to {dest_path}")
     shutil.copy(excel_file, dest_path)
+    count(files=1, bytes=os.path.getsize(dest_path))
     print(f"Copied: {excel_file} -> {dest_path}")
 
 
-def create_master_sheet():
-    dest_dir = Path("S:\\Desktop\\combined sheet")
-    master_path = dest_dir / "master_sheet.xlsx"
+def master_sheets(fetched_files, workers=1, cache=True):
+    # Read in a pool of workers processes, a few files ahead of the sheet being written;
+    # columnar files come back typed like pd.read_excel would type them, and
+    # unchanged xlsx files come from the cache without being parsed again
+    for file, df in read_frames(fetched_files, workers, cache=cache):
+        # Extract the sheet name (e.g., "path", "path1")
+        sheet_name = file.stem.split("Combined result of Output of ")[-1].strip()
+        count(files=1, bytes=os.path.getsize(file), rows=len(df))
+        yield sheet_name, df
+
+@instrumented("arrange.create_master_sheet")
+def create_master_sheet(dest_dir=DEST_DIR, fmt="xlsx", workers=1, cache=True, fetched_files=None):
+    """Put every fetched combined result in one workbook, a sheet per project
+
+    Each sheet is written as soon as its file has been read, so memory holds
+    about one sheet per worker rather than the whole workbook. For
+    parquet/feather the workbook is a master_sheet folder with a file per sheet.
+    fetched_files lists the files to use, in sheet order, instead of every
+    "Combined result of Output of path*" file in dest_dir.
+    """
+    dest_dir = Path(dest_dir)
+    master_path = Path(book_path(dest_dir / "master_sheet.xlsx", fmt))
     
-    # Get all fetched Excel files matching the pattern
-    fetched_files = list(dest_dir.glob("Combined result of Output of path*.xlsx"))
+    # Get all fetched files matching the pattern
+    if fetched_files is None:
+        fetched_files = list(dest_dir.glob(f"Combined result of Output of path*{FORMATS[fmt]}"))
+    fetched_files = [Path(file) for file in fetched_files]
     
     if not fetched_files:
         print("No Excel files found to create master sheet.")
         return
     
-    # Create a master Excel workbook
-    with pd.ExcelWriter(master_path, engine='openpyxl') as writer:
-        for file in fetched_files:
-            # Extract the sheet name (e.g., "path", "path1")
-            sheet_name = file.stem.split("Combined result of Output of ")[-1].strip()
-            # Read the Excel file
-            df = pd.read_excel(file)
-            # Write to the master workbook as a new worksheet
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    # Create the master workbook, each file as a new worksheet
+    write_sheets(master_sheets(fetched_files, workers, cache), master_path, fmt)
     
     print(f"\nMaster workbook created at: {master_path}")
+    return master_path
+
+@instrumented("arrange.master_from_store")
+def master_sheet_from_store(store, dest_dir=DEST_DIR, fmt="xlsx", forms=None):
+    """create_master_sheet from a submission store: a sheet per form, each queried as its combined result"""
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    master_path = store.export_master(dest_dir / "master_sheet.xlsx", fmt, forms)
+    count(rows=sum(rows or 0 for form, _, rows in store.forms() if forms is None or form in forms))
+    print(f"\nMaster workbook created at: {master_path}")
+    return master_path
 
 if __name__ == "__main__":
-    fetch_and_rename_excel_files()
-    create_master_sheet()
+    parser = argparse.ArgumentParser(description="Collect the combined results into one master workbook")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="xlsx",
+                        help="format of the combined results and of the master workbook")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="read the combined results in a pool of this many processes")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always parse the combined results instead of reading unchanged ones from .frame_cache")
+    parser.add_argument("--store", metavar="DATABASE",
+                        help="build the master workbook from the SQLite submission store the converters wrote "
+                             "with --store, instead of from the combined result files")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with session(args.report, args.profile):
+        if args.store:
+            with SubmissionStore(args.store) as store:
+                master_sheet_from_store(store, fmt=args.format)
+        else:
+            fetch_and_rename_excel_files(fmt=args.format)
+            create_master_sheet(fmt=args.format, workers=args.workers, cache=not args.no_cache)
@@ -1,9 +1,16 @@
-import pandas as pd
 import os
+import sys
+import argparse
 
-main_data_path = "S:\\Desktop\\master_sheet.xlsx" 
-ids_directory = "S:\\Desktop\\Forms_IDs"    
-output_path = "S:\\Desktop\\renamed_data.xlsx"  
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_io import FORMATS, book_path, read_frame, read_sheets, write_sheets  # noqa: E402
+from instrumentation import add_arguments, count, file_sizes, instrumented, session  # noqa: E402
+from xlsx_headers import rename_headers  # noqa: E402
+
+main_data_path = "S:\\Desktop\\master_sheet.xlsx"
+ids_directory = "S:\\Desktop\\Forms_IDs"
+output_path = "S:\\Desktop\\renamed_data.xlsx"
 
 #first one is worksheet name and second one is form IDs why which its changes
 sheet_id_mapping = {
@@ -13,43 +20,118 @@ sheet_id_mapping = {
 }
 
 
-all_sheets = pd.read_excel(main_data_path, sheet_name=None)
+def id_names(id_path, cache=True):
+    """{ID: name} from an ID file (ID and Name columns)"""
+    # The ID files rarely change, so they are parsed once and then come from the cache
+    df_ids = read_frame(id_path, cache=cache)
+    return df_ids.set_index('ID')['Name'].astype(str).to_dict()
+
+
+def new_header(id_to_name, col):
+    str_col = str(col)
+    return id_to_name.get(str_col, id_to_name.get(col, col))
+
+
+def rename_columns(df, id_path, cache=True):
+    """Replace the IDs in df's header with the names from an ID file (ID and Name columns)"""
+    id_to_name = id_names(id_path, cache)
+
+
+    new_columns = []
+    for col in df.columns:
+
+        new_name = new_header(id_to_name, col)
+        new_columns.append(new_name)
+
+    df.columns = new_columns
+
+
+def rename_sheets(all_sheets, ids_directory=ids_directory, sheet_id_mapping=sheet_id_mapping, cache=True):
+    processed_sheets = {}
+
+
+    for sheet_name, df in all_sheets.items():
+
+        id_file = sheet_id_mapping.get(sheet_name)
+
+        if id_file:
 
-processed_sheets = {}
+            id_path = os.path.join(ids_directory, id_file)
 
+            try:
 
-for sheet_name, df in all_sheets.items():
- 
-    id_file = sheet_id_mapping.get(sheet_name)
-    
-    if id_file:
- 
+                rename_columns(df, id_path, cache)
+                print(f"Processed {sheet_name} using {id_file}")
+
+            except FileNotFoundError:
+                print(f"ID file {id_file} not found for {sheet_name}, keeping original headers")
+
+        processed_sheets[sheet_name] = df
+
+    return processed_sheets
+
+
+def sheet_renames(ids_directory=ids_directory, sheet_id_mapping=sheet_id_mapping, cache=True):
+    """{sheet name: rename(header value)} for every sheet whose ID file exists"""
+    renames = {}
+    for sheet_name, id_file in sheet_id_mapping.items():
         id_path = os.path.join(ids_directory, id_file)
-        
         try:
-            
-            df_ids = pd.read_excel(id_path)
-            id_to_name = df_ids.set_index('ID')['Name'].astype(str).to_dict()
-            
-            
-            new_columns = []
-            for col in df.columns:
-            
-                str_col = str(col)
-                new_name = id_to_name.get(str_col, id_to_name.get(col, col))
-                new_columns.append(new_name)
-            
-            df.columns = new_columns
-            print(f"Processed {sheet_name} using {id_file}")
-            
+            id_to_name = id_names(id_path, cache)
         except FileNotFoundError:
             print(f"ID file {id_file} not found for {sheet_name}, keeping original headers")
-    
-    processed_sheets[sheet_name] = df
+            continue
+        renames[sheet_name] = lambda col, id_to_name=id_to_name: new_header(id_to_name, col)
+    return renames
+
+
+@instrumented("header_match.match_headers")
+def match_headers(main_data_path=main_data_path, ids_directory=ids_directory, output_path=output_path,
+                  sheet_id_mapping=sheet_id_mapping, fmt="xlsx", headers_only=False, cache=True):
+    """Rename every sheet's columns and save the result
+
+    main_data_path is the master workbook, or the master_sheet folder arrange.py
+    writes for parquet/feather. This is the last step, so the output is the xlsx
+    export unless fmt asks for another format.
+
+    headers_only copies an xlsx master workbook with only its header rows
+    rewritten (xlsx_headers.py); the data cells are never loaded, and keep their
+    values and types exactly as they were.
+
+    The master workbook and the ID files are parsed once and then read from
+    frame_cache.py while they are unchanged, unless cache is False.
+    """
+    if headers_only and fmt == "xlsx" and os.path.splitext(str(main_data_path))[1].lower() == ".xlsx":
+        counts = rename_headers(main_data_path, output_path, sheet_renames(ids_directory, sheet_id_mapping, cache))
+        count(files=1, bytes=os.path.getsize(main_data_path))
+        for sheet_name, renamed in counts.items():
+            print(f"Processed {sheet_name} using {sheet_id_mapping[sheet_name]} ({renamed} headers renamed)")
+        print(f"\nAll sheets processed successfully! Saved to: {output_path}")
+        return
+    if headers_only:
+        print(" --headers-only needs an xlsx master workbook and output, renaming through DataFrames")
+
+    all_sheets = read_sheets(main_data_path, cache=cache)
+    count(files=1, bytes=file_sizes([main_data_path]), rows=sum(len(df) for df in all_sheets.values()))
+
+    processed_sheets = rename_sheets(all_sheets, ids_directory, sheet_id_mapping, cache)
+
+    # Save all processed sheets to new Excel file
+    write_sheets(processed_sheets.items(), output_path, fmt)
+
+    print(f"\nAll sheets processed successfully! Saved to: {output_path}")
+
 
-# Save all processed sheets to new Excel file
-with pd.ExcelWriter(output_path) as writer:
-    for sheet_name, df in processed_sheets.items():
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replace form IDs in the master sheet headers with their names")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="xlsx",
+                        help="format arrange.py wrote the master workbook in; renamed_data.xlsx is always xlsx")
+    parser.add_argument("--headers-only", action="store_true",
+                        help="rewrite only the header rows of master_sheet.xlsx, without loading the data")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always parse the workbooks instead of reading unchanged ones from .frame_cache")
+    add_arguments(parser)
+    args = parser.parse_args()
 
-print(f"\nAll sheets processed successfully! Saved to: {output_path}")
+    with session(args.report, args.profile):
+        match_headers(book_path(main_data_path, args.format), headers_only=args.headers_only, cache=not args.no_cache)
@@ -0,0 +1,174 @@
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from adb_client import AdbError
+
+# Collector daemon. `adb track-devices` keeps a connection to the adb server
+# open and sends the whole device list again every time a device connects,
+# disconnects or changes state (e.g. from "unauthorized" to "device" once the
+# USB debugging prompt is accepted). Each device that becomes ready gets a
+# sync in a bounded pool, so tablets plugged in at the collection desk are
+# collected without anyone starting a run. A device synced less than the
+# cooldown ago is left alone when it reconnects. Given an AdbClient the same
+# device lists come from host:track-devices on a socket, without the process.
+
+TRACK_RETRY_SECONDS = 5
+DEFAULT_COOLDOWN = 300
+
+
+def read_device_lists(stream):
+    """Yield {serial: state} for each message of `adb track-devices`
+
+    Every message is its length in 4 hex digits followed by lines of
+    "serial<TAB>state". Ends when the stream does.
+    """
+    while True:
+        header = stream.read(4)
+        if len(header) < 4:
+            return
+        length = int(header, 16)
+        payload = stream.read(length) if length else b""
+        if len(payload) < length:
+            return
+        devices = {}
+        for line in payload.decode("utf-8", "replace").splitlines():
+            parts = line.split()
+            if len(parts) >= 2:
+                devices[parts[0]] = parts[1]
+        yield devices
+
+
+class DeviceWatcher:
+    """Starts sync(serial) for every device that connects and is authorized
+
+    At most max_syncs syncs run at once; devices connecting meanwhile wait
+    their turn. A device whose last successful sync finished less than
+    cooldown seconds ago is not synced again when it reconnects. With client
+    (an adb_client.AdbClient) devices are tracked through the adb server socket.
+    """
+
+    def __init__(self, sync, max_syncs=2, cooldown=DEFAULT_COOLDOWN, clock=time.monotonic, client=None):
+        self.sync = sync
+        self.client = client
+        self.cooldown = cooldown
+        self.clock = clock
+        self.pool = ThreadPoolExecutor(max_workers=max_syncs)
+        self.lock = threading.Lock()
+        self.connected = {}    # serial -> state, from the latest device list
+        self.busy = set()      # serials with a sync queued or running
+        self.last_sync = {}    # serial -> clock() when its last successful sync finished
+        self.stopped = threading.Event()
+        self.tracker = None
+
+    def update(self, devices):
+        """Handle one device list; returns the serials a sync was queued for"""
+        queued = []
+        with self.lock:
+            previous, self.connected = self.connected, dict(devices)
+            for serial in previous:
+                if serial not in devices:
+                    print(f"[{serial}] Disconnected")
+            for serial, state in devices.items():
+                if previous.get(serial) == state:
+                    continue
+                if state == "device":
+                    if self.schedule(serial):
+                        queued.append(serial)
+                elif state == "unauthorized":
+                    print(f"[{serial}] Connected but not authorized, accept the USB debugging prompt on the tablet")
+                else:
+                    print(f"[{serial}] {state}")
+        return queued
+
+    def schedule(self, serial):
+        # Called with the lock held
+        if serial in self.busy:
+            print(f"[{serial}] Reconnected while its sync is still queued or running")
+            return False
+        finished = self.last_sync.get(serial)
+        if finished is not None and self.clock() - finished < self.cooldown:
+            print(f"[{serial}] Synced {self.clock() - finished:.0f}s ago, not syncing again for "
+                  f"{self.cooldown - (self.clock() - finished):.0f}s")
+            return False
+        self.busy.add(serial)
+        self.pool.submit(self.run_sync, serial)
+        return True
+
+    def run_sync(self, serial):
+        try:
+            with self.lock:
+                if self.connected.get(serial) != "device":
+                    print(f"[{serial}] Disconnected before its sync started")
+                    return None
+            print(f"[{serial}] Connected, starting sync")
+            summary = self.sync(serial)
+            with self.lock:
+                self.last_sync[serial] = self.clock()
+            print(f"[{serial}] Sync finished: found {summary['found']}, pulled {summary['pulled']}, "
+                  f"uploaded {summary['uploaded']}, failed {summary['failed']}")
+            return summary
+        except Exception as e:
+            # No cooldown, so the next time it connects it is tried again
+            print(f"[{serial}] Sync failed: {str(e)}")
+            return None
+        finally:
+            with self.lock:
+                self.busy.discard(serial)
+
+    def device_lists(self):
+        """Device lists from `adb track-devices`, restarted when it exits (e.g. the adb server restarted)"""
+        while not self.stopped.is_set():
+            try:
+                if self.client is not None:
+                    self.tracker = self.client.track_devices()
+                    lists = iter(self.tracker)
+                else:
+                    self.tracker = subprocess.Popen(["adb", "track-devices"], stdout=subprocess.PIPE,
+                                                    stderr=subprocess.DEVNULL)
+                    lists = read_device_lists(self.tracker.stdout)
+            except FileNotFoundError:
+                print(" ADB not found. Install Android SDK Platform-Tools and add to PATH")
+                return
+            except AdbError as e:
+                print(f" Cannot reach the adb server: {str(e)}")
+                lists = iter(())
+            try:
+                yield from lists
+            finally:
+                self.stop_tracker()
+            if self.stopped.wait(TRACK_RETRY_SECONDS):
+                return
+            print(" Lost the adb device tracker, reconnecting...")
+
+    def stop_tracker(self):
+        tracker = self.tracker
+        if isinstance(tracker, subprocess.Popen):
+            if tracker.poll() is None:
+                tracker.kill()
+                tracker.wait()
+        elif tracker is not None:
+            tracker.close()
+
+    def watch(self):
+        """Handle device events until stop() is called"""
+        for devices in self.device_lists():
+            if self.stopped.is_set():
+                break
+            self.update(devices)
+
+    def stop(self):
+        self.stopped.set()
+        self.stop_tracker()
+
+    def close(self):
+        """Stop watching and wait for the syncs already running"""
+        self.stop()
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
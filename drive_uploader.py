@@ -0,0 +1,367 @@
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import googleapiclient
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
+
+# Drive answers these with "try again later"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Drive accepts at most 100 calls in one batch request
+MAX_BATCH_SIZE = 100
+# Files at least this big are sent as chunked resumable uploads
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+# Resumable chunk sizes must be a multiple of 256 KiB
+CHUNK_SIZE = 16 * 256 * 1024
+
+
+def build_drive_service(credentials=None, http=None, root_url=None):
+    """Build a Drive v3 service from the bundled discovery document
+
+    root_url points the service (including media uploads and batch
+    requests) at another server, for example a local fake Drive.
+    """
+    document_path = os.path.join(os.path.dirname(googleapiclient.__file__),
+                                 "discovery_cache", "documents", "drive.v3.json")
+    with open(document_path, "r", encoding="utf-8") as f:
+        document = json.load(f)
+    if root_url:
+        document["rootUrl"] = root_url
+        document.pop("mtlsRootUrl", None)
+    if http is not None:
+        return build_from_document(document, http=http)
+    return build_from_document(document, credentials=credentials)
+
+
+def is_retryable(error):
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUS
+    return isinstance(error, (ConnectionError, TimeoutError, socket.timeout))
+
+
+def execute_with_retry(call, max_retries=5, backoff=1.0):
+    """Run call(), retrying 429/5xx and connection errors with exponential backoff"""
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            attempt += 1
+            time.sleep(delay)
+
+
+def local_md5(file_path, block_size=1024 * 1024):
+    """MD5 of a local file, in the hex form Drive reports as md5Checksum"""
+    digest = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def media_for(file_path, mimetype='application/xml', resumable_threshold=RESUMABLE_THRESHOLD, chunksize=CHUNK_SIZE):
+    """Media body for file_path: chunked and resumable from resumable_threshold bytes up"""
+    if os.path.getsize(file_path) >= resumable_threshold:
+        return MediaFileUpload(file_path, mimetype=mimetype, resumable=True, chunksize=chunksize)
+    return MediaFileUpload(file_path, mimetype=mimetype)
+
+
+def execute_media(request, max_retries=5, backoff=1.0):
+    """Execute a create/update request carrying media_for() media
+
+    Resumable requests are sent chunk by chunk. The request remembers its
+    upload session, so after an error the next call asks Drive how much
+    arrived and continues from the last committed byte.
+    """
+    if request.resumable is None:
+        return execute_with_retry(request.execute, max_retries, backoff)
+    response = None
+    failures = 0
+    while response is None:
+        try:
+            _, response = request.next_chunk()
+            failures = 0
+        except Exception as e:
+            if failures >= max_retries or not is_retryable(e):
+                raise
+            time.sleep(backoff * (2 ** failures) * (1 + random.random()))
+            failures += 1
+    return response
+
+
+def query_text(value):
+    """value quoted for a Drive search query"""
+    escaped = value.replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{escaped}'"
+
+
+def find_file(service, folder_id, name, max_retries=5, backoff=1.0):
+    """The first file called name in the folder, or None"""
+    request = service.files().list(
+        q=f"name = {query_text(name)} and '{folder_id}' in parents and trashed=false",
+        spaces='drive',
+        fields='files(id, name, md5Checksum, size)'
+    )
+    files = execute_with_retry(request.execute, max_retries, backoff).get('files', [])
+    return files[0] if files else None
+
+
+def create_file(service, folder_id, file_path, mimetype='application/xml', max_retries=5, backoff=1.0,
+                resumable_threshold=RESUMABLE_THRESHOLD, chunksize=CHUNK_SIZE):
+    """Create file_path in the folder, content included, and return its id, md5Checksum and size
+
+    A create is not safe to send twice: one that failed may still have made
+    the file, and sending it again would leave two. So after a retryable
+    error the folder is searched for the name first, and a file found there
+    is updated (or kept, when its content is already the same) instead.
+    """
+    name = os.path.basename(file_path)
+    attempt = 0
+    while True:
+        media = media_for(file_path, mimetype, resumable_threshold, chunksize)
+        request = service.files().create(body={'name': name, 'parents': [folder_id]}, media_body=media,
+                                         fields='id, name, md5Checksum, size')
+        try:
+            if request.resumable is not None:
+                # The upload session makes the retries of its chunks safe
+                return execute_media(request, max_retries, backoff)
+            return request.execute()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+        time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+        attempt += 1
+        existing = find_file(service, folder_id, name, max_retries, backoff)
+        if existing is not None:
+            if existing.get('md5Checksum') == local_md5(file_path):
+                return existing
+            request = service.files().update(fileId=existing['id'], media_body=media_for(
+                file_path, mimetype, resumable_threshold, chunksize), fields='id, name, md5Checksum, size')
+            return execute_media(request, max_retries, backoff)
+
+
+class DriveFolderIndex:
+    """In-memory name -> file index for one Drive folder, listed page by page"""
+
+    def __init__(self, folder_id, page_size=1000):
+        self.folder_id = folder_id
+        self.page_size = page_size
+        self.files = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self, service, max_retries=5, backoff=1.0):
+        files = {}
+        page_token = None
+        while True:
+            request = service.files().list(
+                q=f"'{self.folder_id}' in parents and trashed=false",
+                spaces='drive',
+                pageSize=self.page_size,
+                pageToken=page_token,
+                fields='nextPageToken, files(id, name, md5Checksum, size)'
+            )
+            response = execute_with_retry(request.execute, max_retries, backoff)
+            for item in response.get('files', []):
+                # Keep the first match, like the old per-file name query did
+                files.setdefault(item['name'], item)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        with self.lock:
+            self.files = files
+            self.loaded = True
+        return self
+
+    def get(self, name):
+        with self.lock:
+            return self.files.get(name)
+
+    def set(self, name, info):
+        with self.lock:
+            self.files[name] = info
+
+
+class DriveUploader:
+    """Upload many files into one Drive folder
+
+    The folder is listed once into a DriveFolderIndex, files that are not
+    in Drive yet are created with batched metadata calls, and the media
+    uploads run by id in a bounded thread pool. A name whose batched create
+    did not go through is created together with its content instead
+    (create_file). Every worker thread gets its own service from
+    service_factory because the underlying http objects are not thread-safe.
+
+    With skip_unchanged, files whose MD5 matches the Drive md5Checksum are
+    not sent again. Files of resumable_threshold bytes or more are sent in
+    chunks and continue from the last committed byte after a failure.
+    """
+
+    def __init__(self, service_factory, folder_id, max_workers=4, max_retries=5, backoff=1.0,
+                 batch_size=MAX_BATCH_SIZE, mimetype='application/xml', skip_unchanged=False,
+                 resumable_threshold=RESUMABLE_THRESHOLD, chunksize=CHUNK_SIZE):
+        self.service_factory = service_factory
+        self.folder_id = folder_id
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.mimetype = mimetype
+        self.skip_unchanged = skip_unchanged
+        self.resumable_threshold = resumable_threshold
+        self.chunksize = chunksize
+        self.index = DriveFolderIndex(folder_id)
+        self.local = threading.local()
+        self.index_lock = threading.Lock()
+        self.create_lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def service(self):
+        if getattr(self.local, "service", None) is None:
+            self.local.service = self.service_factory()
+        return self.local.service
+
+    def ensure_index(self):
+        if not self.index.loaded:
+            with self.index_lock:
+                if not self.index.loaded:
+                    self.index.load(self.service(), self.max_retries, self.backoff)
+        return self.index
+
+    def create_missing(self, names):
+        """Create metadata-only Drive entries for names not in the folder yet, in batches
+
+        Returns the names that were created. A create is not sent twice
+        blindly: after a retryable error the folder is searched for the name
+        first, since the create may have gone through with its response
+        lost. Names that could not be created stay out of the index, and
+        _upload_group creates them with their content instead.
+        """
+        created = set()
+        with self.create_lock:
+            missing = [name for name in dict.fromkeys(names) if self.index.get(name) is None]
+            attempt = 0
+            while missing:
+                failed = []
+                for start in range(0, len(missing), self.batch_size):
+                    failed.extend(self._create_batch(missing[start:start + self.batch_size], created))
+                retry = []
+                for name, error in failed:
+                    if not is_retryable(error):
+                        continue
+                    try:
+                        existing = find_file(self.service(), self.folder_id, name, self.max_retries, self.backoff)
+                    except Exception:
+                        continue
+                    if existing is not None:
+                        self.index.set(name, existing)
+                        created.add(name)
+                    else:
+                        retry.append(name)
+                if not retry or attempt >= self.max_retries:
+                    break
+                time.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+                attempt += 1
+                missing = retry
+        return created
+
+    def _create_batch(self, names, created):
+        """One batch request creating names; returns [(name, error)] for the creates that failed"""
+        service = self.service()
+        failed = []
+
+        def callback(request_id, response, exception):
+            name = names[int(request_id)]
+            if exception is not None:
+                failed.append((name, exception))
+            else:
+                self.index.set(name, response)
+                created.add(name)
+
+        batch = service.new_batch_http_request(callback=callback)
+        for number, name in enumerate(names):
+            body = {'name': name, 'parents': [self.folder_id], 'mimeType': self.mimetype}
+            batch.add(service.files().create(body=body, fields='id, name, md5Checksum, size'), request_id=str(number))
+        try:
+            # Not retried as a whole: the creates that went through must not be sent again
+            batch.execute()
+        except Exception as e:
+            return [(name, e) for name in names if self.index.get(name) is None]
+        return failed
+
+    def upload_media(self, file_id, file_path):
+        media = media_for(file_path, self.mimetype, self.resumable_threshold, self.chunksize)
+        request = self.service().files().update(fileId=file_id, media_body=media, fields='id, md5Checksum, size')
+        return execute_media(request, self.max_retries, self.backoff)
+
+    def _upload_group(self, name, file_paths, created=False):
+        # Files sharing a Drive name are sent in order so the last one wins, as before
+        results = {}
+        for file_path in file_paths:
+            try:
+                info = self.index.get(name)
+                if info is None:
+                    info = create_file(self.service(), self.folder_id, file_path, self.mimetype, self.max_retries,
+                                       self.backoff, self.resumable_threshold, self.chunksize)
+                elif created:
+                    # A new entry from create_missing still needs its content
+                    info = dict(info, **self.upload_media(info['id'], file_path))
+                    created = False
+                elif self.skip_unchanged and info.get('md5Checksum') == local_md5(file_path):
+                    results[file_path] = "skipped"
+                    continue
+                else:
+                    info = dict(info, **self.upload_media(info['id'], file_path))
+                self.index.set(name, info)
+                results[file_path] = "uploaded"
+            except Exception as e:
+                print(f" Google Drive Error: {os.path.basename(file_path)}: {str(e)}")
+                results[file_path] = "failed"
+        return results
+
+    def upload_files(self, file_paths):
+        """Upload the files and return {file_path: "uploaded" | "skipped" | "failed"}"""
+        file_paths = [str(path) for path in file_paths]
+        if not file_paths:
+            return {}
+        try:
+            self.ensure_index()
+        except Exception as e:
+            print(f" Google Drive Error: could not list folder {self.folder_id}: {str(e)}")
+            return {file_path: "failed" for file_path in file_paths}
+
+        groups = {}
+        for file_path in file_paths:
+            groups.setdefault(os.path.basename(file_path), []).append(file_path)
+        try:
+            created = self.create_missing(list(groups))
+        except Exception as e:
+            # The uploads below create these files one by one instead
+            print(f" Google Drive Error: could not create files in {self.folder_id}: {str(e)}")
+            created = set()
+
+        results = {}
+        futures = [self.pool.submit(self._upload_group, name, paths, name in created)
+                   for name, paths in groups.items()]
+        for future in futures:
+            results.update(future.result())
+        return results
@@ -0,0 +1,168 @@
+"""Parsed workbooks cached in memory and on disk, so an unchanged file is parsed only once.
+
+An entry is keyed by the file's path and what was read from it (its first
+sheet, or every sheet) and holds as long as the file keeps the size and mtime
+it had when it was parsed. Entries are kept in a .frame_cache folder next to
+the file, as Feather files (one per sheet, written through frame_io like the
+columnar intermediate files) that load in milliseconds, and the most recently
+used ones also in memory, up to MEMORY_LIMIT bytes. Without pyarrow only the
+in-memory cache is used.
+"""
+import json
+import os
+from collections import Counter, OrderedDict
+
+import pandas as pd
+
+CACHE_VERSION = 1
+CACHE_FOLDER = ".frame_cache"
+# Schema metadata (JSON) of a sidecar: what it was parsed from, and which sheet of how many it holds
+CACHE_KEY = b"frame_cache"
+# In-memory entries are dropped, least recently used first, past this many bytes
+MEMORY_LIMIT = 512 * 1024 * 1024
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def frames_nbytes(frames):
+    if isinstance(frames, dict):
+        return sum(frames_nbytes(df) for df in frames.values())
+    return int(frames.memory_usage(index=True, deep=True).sum())
+
+
+def copy_frames(frames):
+    # Callers rename columns and the like in place; the cached frames stay as parsed
+    if isinstance(frames, dict):
+        return {name: df.copy() for name, df in frames.items()}
+    return frames.copy()
+
+
+def sidecar_path(path, what, number=0):
+    folder, name = os.path.split(os.path.abspath(path))
+    return os.path.join(folder, CACHE_FOLDER, f"{name}.{what}.{number}.feather")
+
+
+def sidecar_header(stamp, sheet=None, sheets=1):
+    return {"version": CACHE_VERSION, "pandas": pd.__version__, "stamp": list(stamp), "sheet": sheet,
+            "sheets": sheets}
+
+
+class FrameCache:
+    """An LRU of parsed frames in memory, in front of the sidecar files on disk"""
+
+    def __init__(self, memory_limit=MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.entries = OrderedDict()   # (path, what) -> (stamp, frames, nbytes)
+        self.nbytes = 0
+        self.stats = Counter()         # memory / disk hits and misses
+
+    def get(self, path, what, load, disk=True):
+        """load(path), or the frames it gave while the file had its current size and mtime"""
+        key = (os.path.abspath(path), what)
+        stamp = file_stamp(path)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == stamp:
+            self.entries.move_to_end(key)
+            self.stats["memory"] += 1
+            return copy_frames(entry[1])
+
+        frames = self.load_sidecar(path, what, stamp) if disk else None
+        if frames is None:
+            self.stats["miss"] += 1
+            frames = load(path)
+            if disk:
+                self.save_sidecar(path, what, stamp, frames)
+        else:
+            self.stats["disk"] += 1
+        self.remember(key, stamp, frames)
+        return copy_frames(frames)
+
+    def remember(self, key, stamp, frames):
+        self.forget(key)
+        nbytes = frames_nbytes(frames)
+        if nbytes > self.memory_limit:
+            return
+        self.entries[key] = (stamp, frames, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.memory_limit:
+            _, (_, _, dropped) = self.entries.popitem(last=False)
+            self.nbytes -= dropped
+
+    def forget(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    @staticmethod
+    def load_sidecar(path, what, stamp):
+        """The frames saved for path, or None when there are none for this stamp"""
+        from frame_io import read_table, table_frame
+
+        frames = {}
+        number = 0
+        sheets = 1
+        while number < sheets:
+            cache_file = sidecar_path(path, what, number)
+            try:
+                table = read_table(cache_file, "feather")
+                header = json.loads((table.schema.metadata or {}).get(CACHE_KEY, b"null"))
+            except (FileNotFoundError, ImportError):
+                return None
+            except Exception as e:
+                print(f" Ignoring unreadable cache {cache_file}: {e}")
+                return None
+            # Every sheet's file must come from the same parse of the same file
+            if not isinstance(header, dict) or header != sidecar_header(stamp, header.get("sheet"),
+                                                                        header.get("sheets") if number == 0 else sheets):
+                return None
+            if header["sheet"] is None:
+                return table_frame(table)
+            frames[header["sheet"]] = table_frame(table)
+            sheets = header["sheets"]
+            number += 1
+        return frames
+
+    @staticmethod
+    def save_sidecar(path, what, stamp, frames):
+        try:
+            from frame_io import frame_table, write_table
+        except ImportError:
+            return
+        sheets = list(frames.items()) if isinstance(frames, dict) else [(None, frames)]
+        for number, (sheet, df) in enumerate(sheets):
+            cache_file = sidecar_path(path, what, number)
+            # Several processes can parse the same file; each writes its own temporary file
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            try:
+                table = frame_table(df)
+                header = sidecar_header(stamp, sheet, len(sheets))
+                metadata = dict(table.schema.metadata)
+                metadata[CACHE_KEY] = json.dumps(header)
+                table = table.replace_schema_metadata(metadata)
+                os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                write_table(table, tmp_file, "feather")
+                os.replace(tmp_file, cache_file)
+            except ImportError:
+                return
+            except Exception as e:
+                print(f" Could not cache {path}: {e}")
+                try:
+                    os.remove(tmp_file)
+                except OSError:
+                    pass
+                return
+
+
+CACHE = FrameCache()
+
+
+def cached_read(path, what, load, disk=True):
+    """CACHE.get: the frames load(path) gives, parsed only when the file has changed"""
+    return CACHE.get(path, what, load, disk)
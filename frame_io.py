@@ -0,0 +1,446 @@
+"""DataFrame files handed between pipeline stages: xlsx, or Parquet/Feather through pyarrow."""
+import datetime
+import decimal
+import json
+import os
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES, TYPE_ERROR, TYPE_NUMERIC
+from pandas.io.parsers import TextParser
+
+import xlsx_stream
+from frame_cache import cached_read
+
+FORMATS = {"xlsx": ".xlsx", "parquet": ".parquet", "feather": ".feather"}
+
+# Schema metadata (JSON): the real column names (they can repeat, and need not
+# be strings) and which columns hold type-tagged values
+METADATA_KEY = b"frame_io"
+# Object columns holding only one of these (and missing values) convert to Arrow as they are
+ARROW_KINDS = {"empty", "string", "bytes", "integer", "floating", "boolean", "datetime64", "datetime",
+               "date", "time", "timedelta64", "timedelta", "decimal"}
+# Sheet order inside a columnar workbook folder
+SHEETS_FILE = "sheets.txt"
+
+
+def file_format(path):
+    """'xlsx', 'parquet' or 'feather' from the file extension"""
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext == ".xls":
+        return "xlsx"
+    for fmt, fmt_ext in FORMATS.items():
+        if ext == fmt_ext:
+            return fmt
+    raise ValueError(f"not a data file: {path}")
+
+
+def with_format(path, fmt):
+    """path with the extension of fmt"""
+    return f"{os.path.splitext(str(path))[0]}{FORMATS[fmt]}"
+
+
+def book_path(path, fmt):
+    """Where a multi-sheet workbook goes: an .xlsx file, or a folder with one file per sheet"""
+    if fmt == "xlsx":
+        return with_format(path, fmt)
+    return os.path.splitext(str(path))[0]
+
+
+# ----------------------- xlsx round trip -----------------------
+def excel_cell(value):
+    """What pd.read_excel gets back for a value written by DataFrame.to_excel"""
+    if value is None or value is pd.NaT or value is pd.NA:
+        return ""
+    if isinstance(value, str):
+        # openpyxl keeps at most 32767 characters and stores "=..." as a
+        # formula, which reads back empty; error codes read back as NaN
+        value = value[:32767]
+        if len(value) > 1 and value.startswith("="):
+            return ""
+        if value in ERROR_CODES:
+            return np.nan
+        return value
+    if isinstance(value, float):
+        if value != value:
+            return ""
+        if value.is_integer():
+            # pandas' openpyxl reader turns whole floats into ints
+            return int(value)
+        return value
+    if hasattr(value, "item") and not isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return excel_cell(value.item())
+    return value
+
+
+def excel_like_frame(df):
+    """df as it would come back from to_excel followed by read_excel
+
+    The values go through the same parser read_excel uses, so numbers in text
+    become numbers, "NA"/"null" become NaN, repeated headers get ".1" suffixes
+    and trailing empty rows are dropped. Reading a columnar file this way gives
+    the next stage the same frame an xlsx file would have given it.
+    """
+    return excel_like_columns(list(df.columns), [series.tolist() for _, series in df.items()])
+
+
+def excel_like_columns(names, columns):
+    """excel_like_frame for a header and a list of value lists, one per column"""
+    data = [[excel_cell(name) for name in names]]
+    data.extend(map(list, zip(*([excel_cell(value) for value in column] for column in columns))))
+
+    # Trailing empty rows and columns are never written to the sheet
+    while data and not any(cell != "" for cell in data[-1]):
+        data.pop()
+    if not data:
+        return pd.DataFrame()
+    width = max((max((i for i, cell in enumerate(row) if cell != ""), default=-1) + 1 for row in data))
+    data = [row[:width] for row in data]
+
+    return TextParser(data, header=0, skip_blank_lines=False).read()
+
+
+def xlsx_cell(cell):
+    """A cell's value the way pandas' openpyxl reader converts it"""
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        whole = int(cell.value)
+        return whole if whole == cell.value else float(cell.value)
+    return cell.value
+
+
+def sheet_frame(ws):
+    """A read-only worksheet as the DataFrame pd.read_excel gives for it
+
+    The rows are converted one at a time as openpyxl parses them, so no cell
+    objects are kept, and go through the same parser read_excel uses.
+    """
+    ws.reset_dimensions()
+    data = []
+    last_row = -1
+    for number, row in enumerate(ws.rows):
+        values = [xlsx_cell(cell) for cell in row]
+        while values and values[-1] == "":
+            values.pop()
+        if values:
+            last_row = number
+        data.append(values)
+
+    # Trailing empty rows are dropped, shorter rows padded with empty cells
+    del data[last_row + 1:]
+    if not data:
+        return pd.DataFrame()
+    width = max(len(values) for values in data)
+    data = [values + [""] * (width - len(values)) for values in data]
+    return TextParser(data, header=0, skip_blank_lines=False).read()
+
+
+def read_xlsx(path, all_sheets=False):
+    """The first sheet of a workbook, or {sheet name: DataFrame} for all of them"""
+    if str(path).lower().endswith(".xls"):
+        # openpyxl only reads the xlsx package
+        return pd.read_excel(path, sheet_name=None if all_sheets else 0)
+    wb = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        if all_sheets:
+            return {ws.title: sheet_frame(ws) for ws in wb.worksheets}
+        return sheet_frame(wb.worksheets[0])
+    finally:
+        wb.close()
+
+
+def read_all_xlsx(path):
+    return read_xlsx(path, all_sheets=True)
+
+
+# ----------------------- Parquet / Feather -----------------------
+def tag_value(value):
+    """(type tag, text) for a value of a mixed column or a column name
+
+    The text turns back into an equal value of the same type with
+    untag_value. Values of any other type are stored as str(value), tagged
+    "str", so they come back as that text.
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None:
+        return "none", None
+    if value is pd.NA:
+        return "na", None
+    if value is pd.NaT:
+        return "nat", None
+    if isinstance(value, bool):
+        return "bool", str(value)
+    if isinstance(value, int):
+        return "int", str(value)
+    if isinstance(value, float):
+        return "float", repr(value)
+    if isinstance(value, str):
+        return "str", value
+    if isinstance(value, bytes):
+        return "bytes", value.hex()
+    if isinstance(value, pd.Timestamp):
+        return "timestamp", value.isoformat()
+    if isinstance(value, datetime.datetime):
+        return "datetime", value.isoformat()
+    if isinstance(value, datetime.date):
+        return "date", value.isoformat()
+    if isinstance(value, datetime.time):
+        return "time", value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return "timedelta", str(pd.Timedelta(value).value)
+    if isinstance(value, decimal.Decimal):
+        return "decimal", str(value)
+    return "str", str(value)
+
+
+UNTAG = {
+    "none": lambda text: None,
+    "na": lambda text: pd.NA,
+    "nat": lambda text: pd.NaT,
+    "bool": lambda text: text == "True",
+    "int": int,
+    "float": float,
+    "str": str,
+    "bytes": bytes.fromhex,
+    "timestamp": pd.Timestamp,
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "timedelta": lambda text: pd.Timedelta(int(text)),
+    "decimal": decimal.Decimal,
+}
+
+
+def untag_value(tag, text):
+    return UNTAG[tag](text)
+
+
+def type_column(position):
+    """Name of the column holding the type tags of the mixed column at position"""
+    return f"{position}:type"
+
+
+def frame_table(df):
+    """df as a pyarrow Table; the columns are stored by position with the names in the metadata
+
+    Object columns whose values have no single Arrow type (numbers from one
+    file and text from another) are stored as Arrow strings, with each
+    value's type tag in an extra "<position>:type" column, so the file stays
+    readable by any Parquet/Arrow tool.
+    """
+    import pyarrow as pa
+
+    data = df.set_axis([str(position) for position in range(df.shape[1])], axis=1)
+    mixed = []
+    tags = {}
+    for position in range(data.shape[1]):
+        series = data.iloc[:, position]
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ARROW_KINDS:
+            # pyarrow would raise on these, or coerce them
+            if not mixed:
+                data = data.copy(deep=False)
+            tagged = [tag_value(value) for value in series]
+            data.isetitem(position, pd.Series([text for _, text in tagged], index=series.index, dtype=object))
+            tags[type_column(position)] = pd.Series([tag for tag, _ in tagged], index=series.index, dtype=object)
+            mixed.append(position)
+    if tags:
+        data = pd.concat([data, pd.DataFrame(tags, index=data.index)], axis=1)
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA_KEY] = info_metadata(df.columns, mixed)
+    return table.replace_schema_metadata(metadata)
+
+
+def info_metadata(columns, mixed=()):
+    return json.dumps({"columns": [tag_value(name) for name in columns], "mixed": list(mixed)}).encode("utf-8")
+
+
+def table_info(table):
+    metadata = (table.schema.metadata or {}).get(METADATA_KEY)
+    if metadata is None:
+        return None
+    info = json.loads(metadata)
+    info["columns"] = [untag_value(tag, text) for tag, text in info["columns"]]
+    return info
+
+
+def table_columns(table):
+    """(column names, a list of Python values per column), without going through pandas"""
+    info = table_info(table)
+    if info is None:
+        return table.column_names, [column.to_pylist() for column in table.columns]
+    names = info["columns"]
+    columns = [column.to_pylist() for column in table.columns[:len(names)]]
+    for position in info["mixed"]:
+        types = table.column(type_column(position)).to_pylist()
+        columns[position] = [untag_value(tag, text) for tag, text in zip(types, columns[position])]
+    return names, columns
+
+
+def table_frame(table):
+    info = table_info(table)
+    if info is None:
+        return table.to_pandas()
+    names = info["columns"]
+    df = table.select(list(range(len(names)))).to_pandas()
+    for position in info["mixed"]:
+        types = table.column(type_column(position)).to_pylist()
+        values = [untag_value(tag, text) for tag, text in zip(types, df.iloc[:, position])]
+        df.isetitem(position, pd.Series(values, index=df.index, dtype=object))
+    df.columns = names
+    return df
+
+
+def write_table(table, path, fmt):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, path)
+
+
+def read_table(path, fmt):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(path)
+    import pyarrow.feather as feather
+    return feather.read_table(path)
+
+
+# ----------------------- Public API -----------------------
+def write_frame(df, path, fmt=None):
+    """Write df without its index; the format comes from the extension unless given"""
+    fmt = fmt or file_format(path)
+    if fmt == "xlsx":
+        df.to_excel(path, index=False, engine="openpyxl")
+    else:
+        write_table(frame_table(df), path, fmt)
+
+
+def read_frame(path, excel_types=True, cache=True):
+    """Read a file written by write_frame (or the first sheet of any xlsx)
+
+    Columnar files come back exactly as written, or with excel_types (the
+    default) typed the way pd.read_excel would have typed the xlsx version.
+    xlsx files are parsed once and then come from frame_cache until they
+    change, unless cache is False.
+    """
+    fmt = file_format(path)
+    if fmt == "xlsx":
+        if cache:
+            return cached_read(path, "first", read_xlsx)
+        return read_xlsx(path)
+    table = read_table(path, fmt)
+    if excel_types:
+        # Straight from the Arrow columns; a DataFrame in between only costs time
+        return excel_like_columns(*table_columns(table))
+    return table_frame(table)
+
+
+def read_frames(paths, workers=1, excel_types=True, cache=True):
+    """(path, DataFrame) for every path, in order
+
+    With workers > 1 the files are read in a process pool, never more than
+    workers files ahead of the one being used, so only about that many frames
+    are held at once however many paths there are.
+    """
+    paths = list(paths)
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, read_frame(path, excel_types, cache)
+        return
+
+    workers = min(workers, len(paths))
+    upcoming = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque((path, pool.submit(read_frame, path, excel_types, cache)) for path in islice(upcoming, workers))
+        while pending:
+            path, future = pending.popleft()
+            df = future.result()
+            for next_path in islice(upcoming, 1):
+                pending.append((next_path, pool.submit(read_frame, next_path, excel_types, cache)))
+            yield path, df
+
+
+def write_rows(path, columns, rows, batch_rows=65536):
+    """Header and rows of text (None for an empty cell), written in batches
+
+    The columnar counterpart of xlsx_stream.write_rows, which is used for .xlsx.
+    Returns the number of data rows written.
+    """
+    fmt = file_format(path)
+    if fmt == "xlsx":
+        return xlsx_stream.write_rows(path, columns, rows)
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = list(columns)
+    schema = pa.schema([(str(position), pa.string()) for position in range(len(columns))],
+                       metadata={METADATA_KEY: info_metadata(columns)})
+    writer = pq.ParquetWriter(path, schema) if fmt == "parquet" else pa.ipc.new_file(path, schema)
+
+    def flush(batch):
+        arrays = [pa.array([row[position] for row in batch], pa.string(), from_pandas=True)
+                  for position in range(len(columns))]
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+    count = 0
+    batch = []
+    with writer:
+        for row in rows:
+            batch.append(list(row))
+            if len(batch) == batch_rows:
+                flush(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            flush(batch)
+            count += len(batch)
+    return count
+
+
+def write_sheets(sheets, path, fmt="xlsx"):
+    """Write (sheet name, DataFrame) pairs as one workbook; sheets can be a generator
+
+    For xlsx that is a write-only Excel workbook at path; otherwise path is a folder
+    with a <sheet>.<fmt> file per sheet and the sheet order in sheets.txt.
+    """
+    if fmt == "xlsx":
+        # Each sheet is streamed to disk as it comes, instead of the whole
+        # workbook being held until it is saved as with pd.ExcelWriter
+        book = xlsx_stream.WorkbookWriter()
+        for sheet_name, df in sheets:
+            book.add_frame(sheet_name, df)
+        book.save(path)
+        return
+
+    os.makedirs(path, exist_ok=True)
+    names = []
+    for sheet_name, df in sheets:
+        file_name = f"{sheet_name}{FORMATS[fmt]}"
+        write_frame(df, os.path.join(path, file_name), fmt)
+        names.append(file_name)
+    with open(os.path.join(path, SHEETS_FILE), "w", encoding="utf-8") as f:
+        f.write("".join(f"{name}\n" for name in names))
+
+
+def read_sheets(path, excel_types=True, cache=True):
+    """{sheet name: DataFrame} from an xlsx workbook or a folder written by write_sheets"""
+    path = str(path)
+    if not os.path.isdir(path):
+        if cache:
+            return cached_read(path, "sheets", read_all_xlsx)
+        return read_xlsx(path, all_sheets=True)
+    with open(os.path.join(path, SHEETS_FILE), encoding="utf-8") as f:
+        names = [line.rstrip("\n") for line in f if line.strip()]
+    return {os.path.splitext(name)[0]: read_frame(os.path.join(path, name), excel_types) for name in names}
@@ -0,0 +1,418 @@
+import cProfile
+import functools
+import json
+import os
+import platform
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Run instrumentation shared by the collector (main.py), the converters,
+# arrange.py and header_match.py. A function wrapped with @instrumented (or a
+# block in `with stage(name)`) is a stage: its wall and CPU time are added up
+# over every call, along with the files, bytes and rows it reports through
+# count(). Stages can nest; a stage's self time leaves out the stages it called.
+# Inside a session() a background thread samples the process's resident memory
+# to get each stage's peak, and the session ends with a summary table and,
+# if asked, a JSON run report. With a profile folder the session also runs
+# cProfile (on the main thread) and keeps a tracemalloc snapshot of each stage
+# at its largest traced memory, to show where the time and memory go. Work
+# sent to a process pool through recorded() comes back with the worker's
+# stages, which merge() adds to this process's.
+
+SAMPLE_INTERVAL = 0.05
+TRACE_FRAMES = 10
+# A new snapshot is only taken when a stage's traced memory grows by this much
+SNAPSHOT_GROWTH = 1.1
+PROFILE_LINES = 40
+
+
+def current_rss():
+    """Resident memory of this process in bytes, or None where it cannot be read"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def per_second(amount, seconds):
+    return round(amount / seconds, 2) if seconds > 0 else None
+
+
+def megabytes(nbytes):
+    return round(nbytes / 1e6, 2) if nbytes is not None else None
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.child_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.first_start = None
+        self.last_end = None
+        self.files = 0
+        self.bytes = 0
+        self.rows = 0
+        self.peak_rss = None
+        self.peak_traced = 0
+        self.snapshot = None
+        self.snapshot_traced = 0
+
+    def report(self):
+        # Calls running at the same time (devices, upload threads) overlap, so
+        # seconds can add up to more than the wall time from first start to last end
+        wall = (self.last_end - self.first_start) if self.calls else 0.0
+        return {
+            "stage": self.name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 4),
+            "self_seconds": round(self.seconds - self.child_seconds, 4),
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(self.cpu_seconds, 4),
+            "files": self.files,
+            "bytes": self.bytes,
+            "rows": self.rows,
+            "files_per_second": per_second(self.files, wall),
+            "mb_per_second": per_second(self.bytes / 1e6, wall),
+            "rows_per_second": per_second(self.rows, wall),
+            "peak_rss_mb": megabytes(self.peak_rss),
+            "peak_traced_mb": megabytes(self.peak_traced) if self.peak_traced else None,
+        }
+
+
+class Recorder:
+    """Stage statistics of this process; RUN below is the one every module records into"""
+
+    def __init__(self):
+        self.stages = {}    # name -> StageStats, in the order they first ran
+        self.active = {}    # StageStats -> number of calls running now
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.sampling = False
+        self.tracing = False
+        self.peak_rss = None
+
+    def stack(self):
+        """The stages open in this thread, innermost last, as [StageStats, seconds spent in nested stages]"""
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    @contextmanager
+    def stage(self, name):
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats(name)
+            self.active[stats] = self.active.get(stats, 0) + 1
+        stack = self.stack()
+        frame = [stats, 0.0]
+        stack.append(frame)
+        if self.sampling:
+            self.sample()
+        start = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield stats
+        except BaseException:
+            with self.lock:
+                stats.errors += 1
+            raise
+        finally:
+            end = time.perf_counter()
+            elapsed = end - start
+            if self.sampling:
+                self.sample()
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            with self.lock:
+                stats.calls += 1
+                stats.seconds += elapsed
+                stats.child_seconds += frame[1]
+                stats.cpu_seconds += time.thread_time() - cpu
+                if stats.first_start is None:
+                    stats.first_start = start
+                stats.last_end = end
+                self.active[stats] -= 1
+                if not self.active[stats]:
+                    del self.active[stats]
+
+    def count(self, files=0, bytes=0, rows=0, errors=0):
+        """Add to the counters of the innermost stage open in this thread"""
+        stack = self.stack()
+        if not stack:
+            return
+        stats = stack[-1][0]
+        with self.lock:
+            stats.files += files
+            stats.bytes += bytes
+            stats.rows += rows
+            stats.errors += errors
+
+    def sample(self):
+        """Record the current memory as a candidate peak of every stage running now"""
+        rss = current_rss()
+        traced = tracemalloc.get_traced_memory()[0] if self.tracing and tracemalloc.is_tracing() else 0
+        grown = []
+        with self.lock:
+            if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+                self.peak_rss = rss
+            for stats in self.active:
+                if rss is not None and (stats.peak_rss is None or rss > stats.peak_rss):
+                    stats.peak_rss = rss
+                if traced > stats.peak_traced:
+                    stats.peak_traced = traced
+                    if traced > stats.snapshot_traced * SNAPSHOT_GROWTH:
+                        grown.append(stats)
+        if grown:
+            snapshot = tracemalloc.take_snapshot()
+            with self.lock:
+                for stats in grown:
+                    stats.snapshot = snapshot
+                    stats.snapshot_traced = traced
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.active = {}
+            self.peak_rss = None
+
+    def start_worker(self):
+        """Forget what a forked pool worker inherited, including the stages its parent had open"""
+        # The lock may have been copied while the parent's sampler thread held it
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+        self.tracing = False
+
+    def recording(self):
+        """The stages of this process as plain data, for merge() in another process"""
+        now = time.perf_counter()
+        with self.lock:
+            return [{"name": stats.name, "calls": stats.calls, "errors": stats.errors, "seconds": stats.seconds,
+                     "child_seconds": stats.child_seconds, "cpu_seconds": stats.cpu_seconds,
+                     "files": stats.files, "bytes": stats.bytes, "rows": stats.rows, "peak_rss": stats.peak_rss,
+                     # perf_counter values mean nothing in another process, so the times are relative
+                     "started_ago": now - stats.first_start if stats.calls else None,
+                     "ended_ago": now - stats.last_end if stats.calls else None}
+                    for stats in self.stages.values()]
+
+    def merge(self, recording):
+        """Add the stages a worker process recorded to this one's
+
+        The workers ran next to the stage that started them, so their time is
+        not taken out of its self time.
+        """
+        now = time.perf_counter()
+        with self.lock:
+            for item in recording:
+                stats = self.stages.get(item["name"])
+                if stats is None:
+                    stats = self.stages[item["name"]] = StageStats(item["name"])
+                for field in ("calls", "errors", "seconds", "child_seconds", "cpu_seconds", "files", "bytes", "rows"):
+                    setattr(stats, field, getattr(stats, field) + item[field])
+                if item["started_ago"] is not None:
+                    start, end = now - item["started_ago"], now - item["ended_ago"]
+                    stats.first_start = start if stats.first_start is None else min(stats.first_start, start)
+                    stats.last_end = end if stats.last_end is None else max(stats.last_end, end)
+                if item["peak_rss"] is not None and (stats.peak_rss is None or item["peak_rss"] > stats.peak_rss):
+                    stats.peak_rss = item["peak_rss"]
+
+    def report(self):
+        with self.lock:
+            return [stats.report() for stats in self.stages.values()]
+
+
+RUN = Recorder()
+
+
+def stage(name):
+    """Context manager timing the block as stage name"""
+    return RUN.stage(name)
+
+
+def count(files=0, bytes=0, rows=0, errors=0):
+    RUN.count(files, bytes, rows, errors)
+
+
+def instrumented(name):
+    """Decorator making every call of the function a run of stage name"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with RUN.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def recorded(name, func, *args):
+    """Pool task: func(*args) as stage name (None for no stage), recorded afresh in this worker
+
+    Returns (result, recording); merge(recording) in the parent adds the
+    worker's stages and counters to the parent's run report.
+    """
+    RUN.start_worker()
+    with stage(name) if name else nullcontext():
+        result = func(*args)
+    return result, RUN.recording()
+
+
+def merge(recording):
+    RUN.merge(recording)
+
+
+def file_sizes(paths):
+    """Total size of the files in paths that exist; a folder counts the files directly in it"""
+    total = 0
+    for path in paths:
+        try:
+            if os.path.isdir(path):
+                total += file_sizes(entry.path for entry in os.scandir(path) if entry.is_file())
+            else:
+                total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+class Sampler:
+    def __init__(self, recorder, interval=SAMPLE_INTERVAL):
+        self.recorder = recorder
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.recorder.sample()
+
+    def __enter__(self):
+        self.recorder.sampling = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.recorder.sampling = False
+
+
+def file_label(name):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+def write_profile(profile_dir, profiler, recorder):
+    """cProfile statistics and each stage's tracemalloc snapshot in profile_dir; returns the files written"""
+    os.makedirs(profile_dir, exist_ok=True)
+    written = []
+    stats_file = os.path.join(profile_dir, "cprofile.pstats")
+    profiler.dump_stats(stats_file)
+    written.append(stats_file)
+    text_file = os.path.join(profile_dir, "cprofile.txt")
+    with open(text_file, "w", encoding="utf-8") as f:
+        stats = pstats.Stats(profiler, stream=f)
+        stats.sort_stats("cumulative").print_stats(PROFILE_LINES)
+        stats.sort_stats("tottime").print_stats(PROFILE_LINES)
+    written.append(text_file)
+
+    summary_file = os.path.join(profile_dir, "tracemalloc.txt")
+    with open(summary_file, "w", encoding="utf-8") as summary:
+        for stats in recorder.stages.values():
+            if stats.snapshot is None:
+                continue
+            snapshot_file = os.path.join(profile_dir, f"{file_label(stats.name)}.tracemalloc")
+            stats.snapshot.dump(snapshot_file)
+            written.append(snapshot_file)
+            summary.write(f"{stats.name}: {megabytes(stats.snapshot_traced)} MB traced at its peak\n")
+            for line in stats.snapshot.statistics("lineno")[:15]:
+                summary.write(f"  {line}\n")
+            summary.write("\n")
+    written.append(summary_file)
+    return written
+
+
+def print_summary(stages):
+    print("\n Run report:")
+    print(f"  {'stage':<36} {'calls':>6} {'seconds':>9} {'self':>9} {'files':>7} {'MB':>9} {'rows':>9} {'peak MB':>8}")
+    for stats in stages:
+        peak = stats["peak_rss_mb"] if stats["peak_rss_mb"] is not None else "-"
+        print(f"  {stats['stage']:<36} {stats['calls']:>6} {stats['seconds']:>9.2f} {stats['self_seconds']:>9.2f} "
+              f"{stats['files']:>7} {stats['bytes'] / 1e6:>9.2f} {stats['rows']:>9} {peak:>8}")
+
+
+@contextmanager
+def session(report_path=None, profile_dir=None, quiet=False):
+    """Record a run of a script: peak memory is sampled, and at the end the stages are printed
+    (unless quiet) and written as JSON to report_path. With profile_dir the run is also
+    profiled with cProfile and tracemalloc (see write_profile).
+    """
+    RUN.reset()
+    started = datetime.now()
+    start = time.perf_counter()
+    profiler = None
+    if profile_dir:
+        tracemalloc.start(TRACE_FRAMES)
+        RUN.tracing = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with Sampler(RUN), stage("total"):
+            yield RUN
+    finally:
+        profile_files = []
+        if profiler is not None:
+            profiler.disable()
+            profile_files = write_profile(profile_dir, profiler, RUN)
+            RUN.tracing = False
+            tracemalloc.stop()
+
+        stages = RUN.report()
+        report = {
+            "command": " ".join(sys.argv),
+            "started": started.isoformat(timespec="seconds"),
+            "seconds": round(time.perf_counter() - start, 4),
+            "peak_rss_mb": megabytes(RUN.peak_rss),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "stages": stages,
+            "profile": profile_files,
+        }
+        if not quiet:
+            print_summary(stages)
+        if report_path:
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            if not quiet:
+                print(f" Run report saved to: {report_path}")
+        if profile_files and not quiet:
+            print(f" Profile saved to: {profile_dir}")
+
+
+def add_arguments(parser):
+    """The --report and --profile options every script takes"""
+    parser.add_argument("--report", help="write a JSON run report (time, files, bytes, rows and peak memory "
+                                         "of every stage) to this file")
+    parser.add_argument("--profile", metavar="FOLDER",
+                        help="also profile the run: cProfile statistics and tracemalloc snapshots of each stage's "
+                             "memory peak are saved in this folder")
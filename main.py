@@ -3,11 +3,22 @@ import subprocess
 import sys
 import os
 import re
+import argparse
+import json
+import posixpath
+import shlex
+import shutil
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from adb_client import AdbClient, AdbError
+from device_watch import DEFAULT_COOLDOWN, DeviceWatcher
+from drive_uploader import DriveUploader, create_file, execute_media, local_md5, media_for
+from instrumentation import add_arguments, count, instrumented, session, stage
 
 # Google Drive configuration
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
@@ -15,7 +26,27 @@ CREDENTIALS_FILE = 'credential.json'
 TOKEN_FILE = 'token.json'
 DRIVE_FOLDER_ID = 'Folder ID'
 
+# Device collection configuration
+DEVICE_BASE_PATH = "/sdcard/Android/data/your directory/"
+DOWNLOADS_DIR = Path.home() / "Downloads/path"
+SYNC_MANIFEST_FILE = ".sync_manifest.json"
+# Keep each explicit-path tar command well below the device shell's command length limit
+MAX_DEVICE_COMMAND_LENGTH = 8000
+# Set by --native-adb: device commands then go over sockets to the adb server
+# (see adb_client.py) instead of each starting an `adb` process
+ADB_CLIENT = None
+# --skip-unchanged: leave files alone whose MD5 matches the copy on Drive
+SKIP_UNCHANGED = False
+
+def use_native_adb(client=None):
+    """Send every device command through an AdbClient from now on"""
+    global ADB_CLIENT
+    ADB_CLIENT = client or AdbClient()
+    return ADB_CLIENT
+
 def check_adb_availability():
+    if ADB_CLIENT is not None:
+        return ADB_CLIENT.available()
     try:
         subprocess.run(["adb", "--version"], check=True, capture_output=True)
         return True
@@ -30,18 +61,104 @@ def check_adb_availability():
 
 
 
-def check_device_connected():
+def adb_command(serial, *args):
+    """Build an adb command line, targeting one device when a serial is given"""
+    cmd = ["adb"]
+    if serial:
+        cmd += ["-s", serial]
+    return cmd + list(args)
+
+
+
+def adb_shell(serial, command, check=False, timeout=None):
+    """Run command in the device shell, returning (returncode, stdout text)
+
+    With check a non-zero exit raises subprocess.CalledProcessError. Over the
+    native client a lost device or server counts as exit code 255.
+    """
+    if ADB_CLIENT is not None:
+        try:
+            result = ADB_CLIENT.device(serial).shell(command, timeout=timeout)
+            returncode = result.returncode
+            stdout = result.stdout.decode("utf-8", "replace")
+            stderr = result.stderr.decode("utf-8", "replace")
+        except AdbError as e:
+            returncode, stdout, stderr = 255, "", str(e)
+    else:
+        result = subprocess.run(adb_command(serial, "shell", command), capture_output=True, text=True,
+                                timeout=timeout)
+        returncode, stdout, stderr = result.returncode, result.stdout, result.stderr
+    if check and returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command, stdout, stderr)
+    return returncode, stdout
+
+
+
+@contextmanager
+def exec_out_stream(serial, command):
+    """Binary stdout of a device command as it arrives, like `adb exec-out`"""
+    if ADB_CLIENT is not None:
+        stream = ADB_CLIENT.device(serial).exec_out(command)
+        try:
+            yield stream
+        finally:
+            stream.close()
+        return
+    proc = subprocess.Popen(adb_command(serial, "exec-out", command),
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        yield proc.stdout
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+
+
+def list_authorized_devices():
+    """Return the serials of every authorized device listed by `adb devices`"""
+    if ADB_CLIENT is not None:
+        try:
+            return [serial for serial, state in ADB_CLIENT.devices().items() if state == "device"]
+        except AdbError:
+            return []
+    try:
+        result = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=5)
+    except Exception:
+        return []
+
+    serials = []
+    # First line is the "List of devices attached" banner
+    for line in result.stdout.strip().splitlines()[1:]:
+        parts = line.split()
+        if len(parts) >= 2 and parts[1] == "device":
+            serials.append(parts[0])
+    return serials
+
+
+
+def check_device_connected(serial=None):
     """Check device connection and display name if connected"""
     try:
         # Check connection status
-        devices = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=5)
-        if "device" not in devices.stdout or "unauthorized" in devices.stdout:
-            print("No device connected")
-            return False
+        if serial:
+            if serial not in list_authorized_devices():
+                print(f"No device connected: {serial}")
+                return False
+        elif ADB_CLIENT is not None:
+            states = ADB_CLIENT.devices().values()
+            if "device" not in states or "unauthorized" in states:
+                print("No device connected")
+                return False
+        else:
+            devices = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=5)
+            if "device" not in devices.stdout or "unauthorized" in devices.stdout:
+                print("No device connected")
+                return False
             
         # Get device name if connected
-        name = subprocess.check_output(["adb", "shell", "getprop", "ro.product.model"], 
-                                      text=True, timeout=5).strip()
+        name = adb_shell(serial, "getprop ro.product.model", check=True, timeout=5)[1].strip()
         print(f"Device connected: {name}")
         return True
         
@@ -72,98 +189,509 @@ def google_drive_auth():
             token.write(creds.to_json())
     return build('drive', 'v3', credentials=creds)
 
-def upload_to_drive(service, file_path):
+@instrumented("upload_to_drive")
+def upload_to_drive(service, file_path, skip_unchanged=None):
+    """Create or update file_path in the Drive folder: "uploaded", "skipped" when unchanged, or False
+
+    Like DriveUploader, files whose MD5 matches the Drive copy are left
+    alone with skip_unchanged (default: --skip-unchanged), and large files
+    go up in resumable chunks.
+    """
+    if skip_unchanged is None:
+        skip_unchanged = SKIP_UNCHANGED
     file_name = os.path.basename(file_path)
-    media = MediaFileUpload(file_path, mimetype='application/xml')
     
     try:
         response = service.files().list(
             q=f"name='{file_name}' and '{DRIVE_FOLDER_ID}' in parents",
             spaces='drive',
-            fields='files(id, name)'
+            fields='files(id, name, md5Checksum)'
         ).execute()
         
         if len(response.get('files', [])) > 0:
-            file_id = response['files'][0]['id']
-            service.files().update(
-                fileId=file_id,
-                media_body=media
-            ).execute()
+            existing = response['files'][0]
+            if skip_unchanged and existing.get('md5Checksum') == local_md5(file_path):
+                return "skipped"
+            request = service.files().update(
+                fileId=existing['id'],
+                media_body=media_for(file_path)
+            )
+            execute_media(request)
         else:
-            file_metadata = {
-                'name': file_name,
-                'parents': [DRIVE_FOLDER_ID]
-            }
-            service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
-        return True
+            # Not retried blindly: a create that failed may still have made the file
+            create_file(service, DRIVE_FOLDER_ID, file_path)
+        count(files=1, bytes=os.path.getsize(file_path))
+        return "uploaded"
     except Exception as e:
         print(f" Google Drive Error: {str(e)}")
+        count(errors=1)
         return False
 
 
 
-def find_and_pull_xml():
-    base_path = "/sdcard/Android/data/your directory/"
-    downloads = Path.home() / "Downloads/path"
-    
-    try:
-        # Corrected find command to locate all XML files
-        find_cmd = f'find "{base_path}" -name "*.xml"'
-        result = subprocess.run(["adb", "shell", find_cmd], check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError:
-        print(" No XML files found or search error")
-        return
+def unique_dest_path(downloads, remote_path):
+    """Pick the local path for a remote file, adding (1), (2)... when the name is taken"""
+    original_filename = os.path.basename(remote_path)
+    base_name, extension = os.path.splitext(original_filename)
+    extension = extension.lstrip('.')  # Remove leading dot
+
+    # Handle duplicate filenames
+    index = 0
+    while True:
+        if index == 0:
+            filename = f"{base_name}.{extension}"
+        else:
+            filename = f"{base_name}({index}).{extension}"
+        
+        dest_path = downloads / filename
+        if not dest_path.exists():
+            return dest_path
+        index += 1
+
+
 
-    files = result.stdout.strip().split('\n')
-    if not files or files[0] == '':
-        print(" No XML files found")
+def pull_files_individually(serial, files, downloads, dest_for=None):
+    """Pull each remote file with its own `adb pull`, yielding (remote_path, dest_path)"""
+    tag = f"[{serial}]" if serial else ""
+    dest_for = dest_for or (lambda remote_path: unique_dest_path(downloads, remote_path))
+    if ADB_CLIENT is not None:
+        yield from pull_files_native(serial, files, dest_for, tag)
         return
+    for remote_path in files:
+        try:
+            dest_path = dest_for(remote_path)
+            subprocess.run(adb_command(serial, "pull", remote_path, str(dest_path)), check=True, capture_output=bool(serial))
+            yield remote_path, dest_path
+        except subprocess.CalledProcessError as e:
+            print(f"{tag} Failed to copy {remote_path}: {e.stderr}")
+            yield remote_path, None
+        except Exception as e:
+            print(f"{tag} Error processing {remote_path}: {str(e)}")
+            yield remote_path, None
 
-    # Initialize Google Drive service once
+
+
+def pull_files_native(serial, files, dest_for, tag=""):
+    """Pull the files over one sync connection to the device, yielding (remote_path, dest_path)
+
+    A failed transfer closes the connection on the device side, so only then
+    is a new one opened for the files after it.
+    """
+    device = ADB_CLIENT.device(serial)
+    connection = None
     try:
-        drive_service = google_drive_auth()
-    except Exception as e:
-        print(f"Google Drive authentication failed: {str(e)}")
-        drive_service = None
+        for remote_path in files:
+            try:
+                dest_path = dest_for(remote_path)
+                if connection is None:
+                    connection = device.sync()
+                connection.pull(remote_path, str(dest_path))
+                yield remote_path, dest_path
+            except AdbError as e:
+                print(f"{tag} Failed to copy {remote_path}: {str(e)}")
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                yield remote_path, None
+            except Exception as e:
+                print(f"{tag} Error processing {remote_path}: {str(e)}")
+                yield remote_path, None
+    finally:
+        if connection is not None:
+            connection.close()
+
+
+
+def device_has_tar(serial):
+    """Check whether the device shell provides the tar binary used for bulk transfers"""
+    try:
+        returncode, stdout = adb_shell(serial, "command -v tar", timeout=10)
+    except Exception:
+        return False
+    return returncode == 0 and stdout.strip() != ""
+
+
+
+def bulk_tar_commands(base_path, files, only_files):
+    """Device commands that write the wanted files as tar streams to stdout"""
+    if not only_files:
+        return [f'find "{base_path}" -name "*.xml" 2>/dev/null | tar -cf - -T - 2>/dev/null']
 
+    # Explicit file lists are split so every command stays short enough for the device shell
+    commands, batch, length = [], [], 0
     for remote_path in files:
+        quoted = shlex.quote(remote_path)
+        if batch and length + len(quoted) > MAX_DEVICE_COMMAND_LENGTH:
+            commands.append(f"tar -cf - {' '.join(batch)} 2>/dev/null")
+            batch, length = [], 0
+        batch.append(quoted)
+        length += len(quoted) + 1
+    if batch:
+        commands.append(f"tar -cf - {' '.join(batch)} 2>/dev/null")
+    return commands
+
+
+
+def pull_files_bulk(serial, base_path, files, downloads, dest_for=None, only_files=False):
+    """Stream the XML files in tar transfers over `adb exec-out`, yielding (remote_path, dest_path)
+
+    By default one `find | tar` stream carries every XML under base_path;
+    with only_files=True just the given files are sent. Files are unpacked
+    as they arrive. Anything the stream did not deliver (no tar on the
+    device, broken transfer) is pulled one file at a time.
+    """
+    tag = f"[{serial}]" if serial else ""
+    dest_for = dest_for or (lambda remote_path: unique_dest_path(downloads, remote_path))
+    pending = {posixpath.normpath(remote_path): remote_path for remote_path in files}
+
+    if not device_has_tar(serial):
+        print(f"{tag} tar not available on device, pulling files one by one")
+    else:
+        for tar_cmd in bulk_tar_commands(base_path, files, only_files):
+            partial = None
+            try:
+                with exec_out_stream(serial, tar_cmd) as stream, tarfile.open(fileobj=stream, mode="r|") as archive:
+                    for member in archive:
+                        if not member.isfile():
+                            continue
+                        # tar stores the paths without their leading "/"
+                        key = posixpath.normpath("/" + member.name)
+                        if key not in pending:
+                            continue
+                        dest_path = dest_for(pending[key])
+                        # A member cut off mid-stream must not be left behind as a finished file
+                        partial = Path(f"{dest_path}.part")
+                        with archive.extractfile(member) as source, open(partial, "wb") as target:
+                            shutil.copyfileobj(source, target)
+                        os.replace(partial, dest_path)
+                        partial = None
+                        yield pending.pop(key), dest_path
+            except (tarfile.TarError, AdbError, OSError) as e:
+                print(f"{tag} Bulk transfer interrupted: {str(e)}")
+                if partial is not None:
+                    partial.unlink(missing_ok=True)
+
+    if pending:
+        remaining = [remote_path for remote_path in files if posixpath.normpath(remote_path) in pending]
+        if len(remaining) != len(files):
+            print(f"{tag} {len(remaining)} file(s) missing from bulk transfer, pulling them one by one")
+        yield from pull_files_individually(serial, remaining, downloads, dest_for)
+
+
+
+def process_pulled_files(pulled, drive_service, summary, tag=""):
+    """Report and upload pulled files, yielding the (remote_path, dest_path) pairs that succeeded"""
+    for remote_path, dest_path in pulled:
+        if dest_path is None:
+            summary["failed"] += 1
+            count(errors=1)
+            continue
         try:
-            original_filename = os.path.basename(remote_path)
-            base_name, extension = os.path.splitext(original_filename)
-            extension = extension.lstrip('.')  # Remove leading dot
-
-            # Handle duplicate filenames
-            index = 0
-            while True:
-                if index == 0:
-                    filename = f"{base_name}.{extension}"
-                else:
-                    filename = f"{base_name}({index}).{extension}"
-                
-                dest_path = downloads / filename
-                if not dest_path.exists():
-                    break
-                index += 1
-
-            # Pull file from device
-            subprocess.run(["adb", "pull", remote_path, str(dest_path)], check=True)
-            print(f" Saved locally: {filename}")
+            filename = dest_path.name
+            print(f"{tag} Saved locally: {filename}")
+            summary["pulled"] += 1
+            count(files=1, bytes=dest_path.stat().st_size)
 
             # Upload to Google Drive
             if drive_service:
-                if upload_to_drive(drive_service, str(dest_path)):
-                    print(f" Uploaded to Drive: {filename}")
+                status = upload_to_drive(drive_service, str(dest_path))
+                if status == "uploaded":
+                    print(f"{tag} Uploaded to Drive: {filename}")
+                    summary["uploaded"] += 1
+                elif status == "skipped":
+                    print(f"{tag} Unchanged on Drive: {filename}")
                 else:
-                    print(f" Failed to upload: {filename}")
+                    print(f"{tag} Failed to upload: {filename}")
+            yield remote_path, dest_path
 
-        except subprocess.CalledProcessError as e:
-            print(f" Failed to copy {remote_path}: {e.stderr}")
         except Exception as e:
-            print(f"Error processing {remote_path}: {str(e)}")
+            print(f"{tag} Error processing {remote_path}: {str(e)}")
+            summary["failed"] += 1
+
+
+
+def upload_pulled_files(uploader, dest_paths, summary, tag=""):
+    """Send the pulled files through the concurrent Drive uploader"""
+    if not dest_paths:
+        return
+    with stage("upload_to_drive"):
+        results = uploader.upload_files(dest_paths)
+        for dest_path in dest_paths:
+            status = results.get(str(dest_path))
+            if status == "uploaded":
+                print(f"{tag} Uploaded to Drive: {dest_path.name}")
+                summary["uploaded"] += 1
+                count(files=1, bytes=dest_path.stat().st_size)
+            elif status == "skipped":
+                print(f"{tag} Unchanged on Drive: {dest_path.name}")
+            else:
+                print(f"{tag} Failed to upload: {dest_path.name}")
+                count(errors=1)
+
+
+
+def start_drive_service(tag=""):
+    try:
+        return google_drive_auth()
+    except Exception as e:
+        print(f"{tag} Google Drive authentication failed: {str(e)}")
+        return None
+
+
+
+@instrumented("find_remote_xml")
+def find_remote_xml(serial=None, base_path=DEVICE_BASE_PATH):
+    """List the XML files on the device, or None when the search failed"""
+    try:
+        # Corrected find command to locate all XML files
+        find_cmd = f'find "{base_path}" -name "*.xml"'
+        _, stdout = adb_shell(serial, find_cmd, check=True)
+    except subprocess.CalledProcessError:
+        return None
+    return [line.strip() for line in stdout.strip().split('\n') if line.strip()]
+
+
+
+@instrumented("find_and_pull_xml")
+def find_and_pull_xml(serial=None, downloads=None, bulk=False, uploader=None):
+    base_path = DEVICE_BASE_PATH
+    downloads = Path(downloads) if downloads else DOWNLOADS_DIR
+    tag = f"[{serial}]" if serial else ""
+    summary = {"device": serial or "default", "found": 0, "pulled": 0, "uploaded": 0, "failed": 0}
+    
+    files = find_remote_xml(serial, base_path)
+    if files is None:
+        print(f"{tag} No XML files found or search error")
+        return summary
+    if not files:
+        print(f"{tag} No XML files found")
+        return summary
+    summary["found"] = len(files)
+    downloads.mkdir(parents=True, exist_ok=True)
+
+    # Initialize Google Drive service once
+    drive_service = None if uploader else start_drive_service(tag)
+
+    if bulk:
+        pulled = pull_files_bulk(serial, base_path, files, downloads)
+    else:
+        pulled = pull_files_individually(serial, files, downloads)
+
+    saved = [dest_path for _, dest_path in process_pulled_files(pulled, drive_service, summary, tag)]
+    if uploader:
+        upload_pulled_files(uploader, saved, summary, tag)
+
+    return summary
+
+
+
+@instrumented("fetch_remote_manifest")
+def fetch_remote_manifest(serial, base_path, with_hash=False):
+    """Get size, mtime and optionally MD5 of every remote XML file in one `adb shell` call
+
+    Returns {remote_path: {"size": ..., "mtime": ..., "md5": ...}}, or None
+    when the listing could not be read.
+    """
+    stat_cmd = f'find "{base_path}" -name "*.xml" -exec stat -c "%s %Y %n" {{}} +'
+    command = stat_cmd
+    if with_hash:
+        command += f'; echo "--md5--"; find "{base_path}" -name "*.xml" -exec md5sum {{}} +'
+
+    try:
+        returncode, stdout = adb_shell(serial, command, timeout=300)
+    except Exception:
+        return None
+
+    manifest = {}
+    in_hashes = False
+    for line in stdout.splitlines():
+        line = line.rstrip("\r")
+        if not line:
+            continue
+        if line == "--md5--":
+            in_hashes = True
+            continue
+        try:
+            if in_hashes:
+                digest, remote_path = line.split(None, 1)
+                if remote_path in manifest:
+                    manifest[remote_path]["md5"] = digest
+            else:
+                size, mtime, remote_path = line.split(" ", 2)
+                manifest[remote_path] = {"size": int(size), "mtime": int(mtime)}
+        except ValueError:
+            return None
+
+    if not manifest and returncode != 0:
+        return None
+    return manifest
+
+
+
+def load_sync_manifest(downloads):
+    """Read the local record of files already pulled into a downloads folder"""
+    manifest_path = Path(downloads) / SYNC_MANIFEST_FILE
+    if not manifest_path.exists():
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError):
+        print(f" Ignoring unreadable sync manifest: {manifest_path}")
+        return {}
+
+
+
+def save_sync_manifest(downloads, files):
+    manifest_path = Path(downloads) / SYNC_MANIFEST_FILE
+    temp_path = manifest_path.with_suffix(".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"files": files}, f, indent=1, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+
+def remote_file_changed(known, remote, downloads):
+    """Decide whether a remote file has to be pulled again"""
+    if not known or not (Path(downloads) / known.get("local", "")).is_file():
+        return True
+    if known.get("md5") and remote.get("md5"):
+        return known["md5"] != remote["md5"]
+    return known.get("size") != remote["size"] or known.get("mtime") != remote["mtime"]
+
+
+
+@instrumented("sync_device")
+def sync_device(serial=None, downloads=None, bulk=False, with_hash=False, uploader=None):
+    """Pull only the XML files that are new or changed since the last sync"""
+    base_path = DEVICE_BASE_PATH
+    downloads = Path(downloads) if downloads else DOWNLOADS_DIR
+    tag = f"[{serial}]" if serial else ""
+    summary = {"device": serial or "default", "found": 0, "pulled": 0, "uploaded": 0, "failed": 0, "skipped": 0}
+
+    remote = fetch_remote_manifest(serial, base_path, with_hash)
+    if remote is None:
+        print(f"{tag} Could not list remote files, running a full pull instead")
+        return find_and_pull_xml(serial, downloads, bulk, uploader)
+    if not remote:
+        print(f"{tag} No XML files found")
+        return summary
+    summary["found"] = len(remote)
+    downloads.mkdir(parents=True, exist_ok=True)
+
+    known = load_sync_manifest(downloads)
+    changed = [remote_path for remote_path, info in remote.items()
+               if remote_file_changed(known.get(remote_path), info, downloads)]
+    summary["skipped"] = len(remote) - len(changed)
+
+    # Files that disappeared from the device are forgotten, their local copies stay
+    files = {remote_path: known[remote_path] for remote_path in remote if remote_path in known}
+    changed_set = set(changed)
+    for remote_path in files:
+        if remote_path not in changed_set:
+            files[remote_path].update(remote[remote_path])
+
+    print(f"{tag} {len(changed)} new or changed file(s), {summary['skipped']} unchanged")
+    if not changed:
+        save_sync_manifest(downloads, files)
+        return summary
+
+    def dest_for(remote_path):
+        # A changed file replaces its earlier local copy instead of adding name(1).xml
+        local = files.get(remote_path, {}).get("local")
+        return downloads / local if local else unique_dest_path(downloads, remote_path)
+
+    drive_service = None if uploader else start_drive_service(tag)
+
+    if bulk:
+        pulled = pull_files_bulk(serial, base_path, changed, downloads, dest_for, only_files=True)
+    else:
+        pulled = pull_files_individually(serial, changed, downloads, dest_for)
+
+    saved = []
+    try:
+        for remote_path, dest_path in process_pulled_files(pulled, drive_service, summary, tag):
+            files[remote_path] = dict(remote[remote_path], local=dest_path.name)
+            saved.append(dest_path)
+    finally:
+        save_sync_manifest(downloads, files)
+
+    if uploader:
+        upload_pulled_files(uploader, saved, summary, tag)
+
+    return summary
+
+
+
+def device_folder_name(serial):
+    """Turn a device serial into a safe per-device folder name"""
+    return re.sub(r'[^a-zA-Z0-9_-]', '_', serial)
+
+
+
+@instrumented("collect_all_devices")
+def collect_all_devices(max_workers=4, downloads=None, bulk=False, incremental=False, with_hash=False,
+                        uploader=None):
+    """Run find/pull for every authorized device at once, one subfolder per device"""
+    downloads = Path(downloads) if downloads else DOWNLOADS_DIR
+    serials = list_authorized_devices()
+    if not serials:
+        print(" No authorized device connected")
+        return []
+
+    print(f" Collecting from {len(serials)} device(s) with {max_workers} worker(s)...")
+
+    # Authenticate once up front so the workers reuse the saved token
+    if not uploader:
+        start_drive_service()
+
+    summaries = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            serial: pool.submit(sync_device, serial, downloads / device_folder_name(serial), bulk, with_hash, uploader)
+            if incremental else
+            pool.submit(find_and_pull_xml, serial, downloads / device_folder_name(serial), bulk, uploader)
+            for serial in serials
+        }
+        for serial, future in futures.items():
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                print(f"[{serial}] Collection failed: {str(e)}")
+                summaries.append({"device": serial, "found": 0, "pulled": 0, "uploaded": 0, "failed": 0,
+                                  "error": str(e)})
+
+    print("\n Per-device summary:")
+    for item in summaries:
+        skipped = f", unchanged {item['skipped']}" if "skipped" in item else ""
+        print(f"  {item['device']}: found {item['found']}, pulled {item['pulled']}, "
+              f"uploaded {item['uploaded']}, failed {item['failed']}{skipped}")
+    return summaries
+
+
+
+def watch_devices(max_syncs=2, cooldown=DEFAULT_COOLDOWN, downloads=None, bulk=False, with_hash=False,
+                  uploader=None):
+    """Run until interrupted, syncing each device incrementally as it is plugged in
+
+    Every device gets its own subfolder, as with --all-devices.
+    """
+    downloads = Path(downloads) if downloads else DOWNLOADS_DIR
+
+    # Authenticate once up front so the syncs reuse the saved token
+    if not uploader:
+        start_drive_service()
+
+    def sync(serial):
+        return sync_device(serial, downloads / device_folder_name(serial), bulk, with_hash, uploader)
+
+    with DeviceWatcher(sync, max_syncs=max_syncs, cooldown=cooldown, client=ADB_CLIENT) as watcher:
+        print(f" Watching for devices (up to {max_syncs} syncs at once, {cooldown:.0f}s cooldown). "
+              "Press Ctrl+C to stop.")
+        try:
+            watcher.watch()
+        except KeyboardInterrupt:
+            print("\n Stopping, waiting for the running syncs to finish...")
 
 
 
@@ -230,21 +758,81 @@ def find_and_pull_xml():
 #         except Exception as e:
 #             print(f"Error processing {remote_path}: {str(e)}")
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Collect ODK XML files from Android devices over ADB")
+    parser.add_argument("--all-devices", action="store_true",
+                        help="collect from every authorized device at once, one subfolder per device")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="maximum number of devices collected concurrently (with --all-devices or --watch)")
+    parser.add_argument("--bulk", action="store_true",
+                        help="stream all XML files in one tar transfer instead of one adb pull per file")
+    parser.add_argument("--incremental", action="store_true",
+                        help="pull only files that are new or changed since the last sync")
+    parser.add_argument("--hash", action="store_true",
+                        help="with --incremental, also compare MD5 checksums of the remote files")
+    parser.add_argument("--upload-workers", type=int, default=0,
+                        help="upload through the concurrent Drive uploader with this many workers "
+                             "(folder listed once, batched metadata calls, retry with backoff)")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="skip uploading files whose MD5 matches the copy on Drive")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and sync every tablet incrementally as soon as it is plugged in "
+                             "and authorized, one subfolder per device")
+    parser.add_argument("--cooldown", type=float, default=DEFAULT_COOLDOWN,
+                        help="with --watch, seconds after a device's sync before it is synced again on reconnect")
+    parser.add_argument("--native-adb", action="store_true",
+                        help="talk to the adb server over its socket (port 5037, or ANDROID_ADB_SERVER_PORT) "
+                             "instead of starting an adb process per command; pulls reuse one connection per device")
+    add_arguments(parser)
+    return parser.parse_args(argv)
+
+def make_uploader(workers, skip_unchanged=False):
+    """Create the concurrent Drive uploader, or None when Drive is not available"""
+    if workers <= 0 or start_drive_service() is None:
+        return None
+    # The first call above stores a valid token, so each worker thread can build its own service
+    return DriveUploader(google_drive_auth, DRIVE_FOLDER_ID, max_workers=workers, skip_unchanged=skip_unchanged)
+
+def main(argv=None):
+    global SKIP_UNCHANGED
+    args = parse_args(argv)
+    SKIP_UNCHANGED = args.skip_unchanged
+    if args.native_adb:
+        use_native_adb()
+
     if not check_adb_availability():
         print(" ADB not found. Install Android SDK Platform-Tools and add to PATH")
         sys.exit(1)
 
-    if not check_device_connected():
-        print(" No authorized device connected")
-        sys.exit(1)
-
-    print(" Searching for .xml files...")
-    find_and_pull_xml()
-    print("\nOperation completed. Check your Downloads folder and Google Drive.")
+    with session(args.report, args.profile):
+        uploader = make_uploader(args.upload_workers, args.skip_unchanged)
+        try:
+            if args.watch:
+                watch_devices(max_syncs=args.workers, cooldown=args.cooldown, bulk=args.bulk, with_hash=args.hash,
+                              uploader=uploader)
+                return
+
+            if args.all_devices:
+                print(" Searching for .xml files on all devices...")
+                if not collect_all_devices(max_workers=args.workers, bulk=args.bulk, incremental=args.incremental,
+                                           with_hash=args.hash, uploader=uploader):
+                    sys.exit(1)
+                print("\nOperation completed. Check your Downloads folder and Google Drive.")
+                return
+
+            if not check_device_connected():
+                print(" No authorized device connected")
+                sys.exit(1)
+
+            print(" Searching for .xml files...")
+            if args.incremental:
+                sync_device(bulk=args.bulk, with_hash=args.hash, uploader=uploader)
+            else:
+                find_and_pull_xml(bulk=args.bulk, uploader=uploader)
+            print("\nOperation completed. Check your Downloads folder and Google Drive.")
+        finally:
+            if uploader:
+                uploader.close()
 
 if __name__ == "__main__":
     main()
-
-
-
@@ -0,0 +1,404 @@
+"""Run the whole conversion workflow from one project config, redoing only what changed.
+
+    python orchestrate.py project.json
+    python orchestrate.py project.json --dry-run
+    python orchestrate.py project.json --parallel 4 --force
+
+The config (see project.example.json) lists the project folders and the
+converter each one uses, the sheets of the master workbook and the Forms_IDs
+file of each sheet, in place of the folder loops and paths written into
+xmltoexcel.py, xmltoexcel1.py, arrange.py and header_match.py. It is turned
+into a graph of stages:
+
+    convert <project>   one per project folder: xmltoexcel Steps 1-3, or xmltoexcel1/2
+      -> master         arrange.py: the combined results into master_sheet
+        -> rename       header_match.py: renamed_data.xlsx
+
+Before a stage runs, its input files (by MD5) and settings are fingerprinted.
+A stage whose fingerprint matches the last run and whose outputs are unchanged
+is skipped, like make. Project stages do not depend on each other and run at
+the same time in a pool of --parallel processes. The converters run
+incrementally, so a few new XML files in one folder convert only those files,
+then rebuild the master workbook and the renamed export.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, ".xml to .xlsx conversion"))
+sys.path.insert(0, os.path.join(ROOT, "data_arrangement"))
+
+import arrange  # noqa: E402
+import header_match  # noqa: E402
+import xmltoexcel  # noqa: E402
+import xmltoexcel1  # noqa: E402
+import xmltoexcel2  # noqa: E402
+from frame_io import FORMATS, book_path  # noqa: E402
+from incremental import file_md5  # noqa: E402
+from instrumentation import add_arguments, count, merge, recorded, session, stage  # noqa: E402
+
+STATE_VERSION = 1
+STATE_FILE = ".orchestrate_state.json"
+# The name each converter gives its combined result
+COMBINED_NAMES = {"xmltoexcel": "combined result", "xmltoexcel1": "combined_results", "xmltoexcel2": "combined result"}
+# Project settings that change what a convert stage writes (workers only change how fast)
+PROJECT_SETTINGS = ("converter", "input", "output", "processed", "form", "plan", "streaming", "compact", "typed")
+
+
+# ----------------------- Config -----------------------
+def load_config(config_file):
+    """The project config with defaults filled in and every path absolute
+
+    Relative paths are taken from the folder of the config file. Raises
+    ValueError when the config names an unknown converter, format or sheet.
+    """
+    with open(config_file, encoding="utf-8") as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(config_file))
+
+    def resolve(path):
+        return os.path.normpath(os.path.join(base, path)) if path else None
+
+    fmt = config.get("format", "xlsx")
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format '{fmt}', expected one of {', '.join(sorted(FORMATS))}")
+
+    projects = {}
+    for name, project in config.get("projects", {}).items():
+        converter = project.get("converter", "xmltoexcel")
+        if converter not in COMBINED_NAMES:
+            raise ValueError(f"project '{name}': unknown converter '{converter}'")
+        if "input" not in project:
+            raise ValueError(f"project '{name}' has no input folder")
+        input_folder = resolve(project["input"])
+        project = dict(project, name=name, converter=converter, input=input_folder,
+                       output=resolve(project.get("output")) or os.path.join(input_folder, f"Outputs_of_{name}"),
+                       form=resolve(project.get("form")), plan=resolve(project.get("plan")))
+        if converter == "xmltoexcel":
+            project["processed"] = (resolve(project.get("processed"))
+                                    or os.path.join(input_folder, f"processed_Outputs_of_{name}"))
+        projects[name] = project
+
+    master = config.get("master")
+    if master is not None:
+        sheets = master.get("sheets", list(projects))
+        unknown = [sheet for sheet in sheets if sheet not in projects]
+        if unknown:
+            raise ValueError(f"master sheets without a project: {', '.join(unknown)}")
+        master = dict(master, folder=resolve(master["folder"]), sheets=sheets)
+
+    rename = config.get("rename")
+    if rename is not None:
+        if master is None:
+            raise ValueError("rename needs a master workbook")
+        rename = dict(rename, ids=resolve(rename["ids"]), output=resolve(rename["output"]),
+                      sheets=rename.get("sheets", {}), headers_only=rename.get("headers_only", False))
+
+    return {
+        "format": fmt,
+        "workers": config.get("workers", 1),
+        "parallel": config.get("parallel", os.cpu_count() or 1),
+        "state": resolve(config.get("state", STATE_FILE)),
+        "projects": projects,
+        "master": master,
+        "rename": rename,
+    }
+
+
+def combined_file(project, fmt):
+    return os.path.join(project["output"], f"{COMBINED_NAMES[project['converter']]}{FORMATS[fmt]}")
+
+
+def master_path(config):
+    return book_path(os.path.join(config["master"]["folder"], "master_sheet.xlsx"), config["format"])
+
+
+# ----------------------- Stage tasks (run in the pool) -----------------------
+def convert_project(project, fmt, workers):
+    """Bring one project's converted files and combined result up to date
+
+    Raises when any XML file failed, so the stage is not recorded as done and
+    the next run tries those files again.
+    """
+    if project["converter"] == "xmltoexcel":
+        failed = xmltoexcel.update_project(project["input"], project["output"], project["processed"],
+                                           combined_file(project, fmt), streaming=project.get("streaming", False),
+                                           workers=workers, compact=project.get("compact", False), fmt=fmt)
+    else:
+        module = xmltoexcel1 if project["converter"] == "xmltoexcel1" else xmltoexcel2
+        failed = module.convert_xml_folder(project["input"], project["output"],
+                                           streaming=project.get("streaming", False), form_file=project["form"],
+                                           plan_file=project["plan"], workers=workers, fmt=fmt, incremental=True,
+                                           typed=project.get("typed", False))
+    if failed:
+        raise RuntimeError(f"{failed} XML file(s) failed to convert")
+
+
+def build_master(sheets, folder, fmt, workers):
+    """Copy the combined results into folder under arrange.py's names and build the master workbook"""
+    os.makedirs(folder, exist_ok=True)
+    fetched = []
+    for sheet, source in sheets:
+        dest = os.path.join(folder, f"Combined result of Output of {sheet}{FORMATS[fmt]}")
+        shutil.copy(source, dest)
+        fetched.append(dest)
+    arrange.create_master_sheet(folder, fmt, workers, fetched_files=fetched)
+
+
+def rename_master(master, ids, output, sheets, headers_only):
+    header_match.match_headers(master, ids, output, sheets, headers_only=headers_only)
+
+
+def run_task(name, task, args):
+    """Pool task: run a stage's task as stage name, returning how long it took and the worker's recording"""
+    start = time.perf_counter()
+    _, recording = recorded(name, task, *args)
+    return time.perf_counter() - start, recording
+
+
+# ----------------------- Stage graph -----------------------
+class Stage:
+    """A task with the files it reads and writes
+
+    inputs are files, folders (all the files in them) or (folder, suffix)
+    pairs, listed when the stage is about to run, so files added since the
+    config was read count. settings is anything else that changes the outputs.
+    """
+
+    def __init__(self, name, task, args, inputs, outputs, settings, deps=()):
+        self.name = name
+        self.task = task
+        self.args = args
+        self.inputs = inputs
+        self.outputs = outputs
+        self.settings = settings
+        self.deps = list(deps)
+
+
+def build_stages(config):
+    fmt = config["format"]
+    workers = config["workers"]
+    stages = []
+    for name, project in config["projects"].items():
+        # Only the form: the cached plan is the converter's own output, rewritten as new paths show up
+        inputs = [(project["input"], ".xml")] + ([project["form"]] if project["form"] else [])
+        settings = {key: project.get(key) for key in PROJECT_SETTINGS}
+        stages.append(Stage(f"convert {name}", convert_project, (project, fmt, workers), inputs,
+                            [combined_file(project, fmt)], dict(settings, format=fmt)))
+
+    master = config["master"]
+    if master is not None:
+        sheets = [(sheet, combined_file(config["projects"][sheet], fmt)) for sheet in master["sheets"]]
+        stages.append(Stage("master", build_master, (sheets, master["folder"], fmt, workers),
+                            [source for _, source in sheets], [master_path(config)],
+                            {"sheets": master["sheets"], "folder": master["folder"], "format": fmt},
+                            deps=[f"convert {sheet}" for sheet in master["sheets"]]))
+
+    rename = config["rename"]
+    if rename is not None:
+        ids_files = [os.path.join(rename["ids"], ids_file) for ids_file in rename["sheets"].values()]
+        stages.append(Stage("rename", rename_master,
+                            (master_path(config), rename["ids"], rename["output"], rename["sheets"],
+                             rename["headers_only"]),
+                            [master_path(config)] + ids_files, [rename["output"]],
+                            {"sheets": rename["sheets"], "headers_only": rename["headers_only"]}, deps=["master"]))
+    return stages
+
+
+# ----------------------- Fingerprints -----------------------
+class Fingerprints:
+    """MD5 of files, kept with their size and mtime so unchanged files are not read again"""
+
+    def __init__(self, digests):
+        self.digests = digests   # path -> [size, mtime_ns, md5]
+
+    def file_digest(self, path):
+        stat = os.stat(path)
+        known = self.digests.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        md5 = file_md5(path)
+        self.digests[path] = [stat.st_size, stat.st_mtime_ns, md5]
+        count(files=1, bytes=stat.st_size)
+        return md5
+
+    def digest(self, path):
+        """MD5 of a file, of the (name, MD5) list of a folder's files, or None when it does not exist"""
+        if os.path.isdir(path):
+            names = sorted(entry.name for entry in os.scandir(path) if entry.is_file())
+            listing = [(name, self.file_digest(os.path.join(path, name))) for name in names]
+            return hashlib.md5(json.dumps(listing).encode("utf-8")).hexdigest()
+        if os.path.exists(path):
+            return self.file_digest(path)
+        return None
+
+    def prune(self):
+        """Forget files that no longer exist"""
+        for path in [path for path in self.digests if not os.path.exists(path)]:
+            del self.digests[path]
+
+
+def input_files(sources):
+    files = []
+    for source in sources:
+        if isinstance(source, tuple):
+            folder, suffix = source
+            if os.path.isdir(folder):
+                files.extend(os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                             if name.lower().endswith(suffix))
+        else:
+            files.append(source)
+    return files
+
+
+def stage_fingerprint(item, fingerprints):
+    with stage("orchestrate.fingerprint"):
+        inputs = [(path, fingerprints.digest(path)) for path in input_files(item.inputs)]
+    payload = json.dumps({"settings": item.settings, "inputs": inputs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def output_digests(item, fingerprints):
+    """{output: digest}, or None when an output is missing"""
+    with stage("orchestrate.fingerprint"):
+        digests = {path: fingerprints.digest(path) for path in item.outputs}
+    if any(digest is None for digest in digests.values()):
+        return None
+    return digests
+
+
+def load_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") == STATE_VERSION:
+            return state
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        print(f" Ignoring unreadable state file: {path}")
+    return {"version": STATE_VERSION, "digests": {}, "stages": {}}
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    os.replace(temporary, path)
+
+
+# ----------------------- Scheduler -----------------------
+def run_stages(stages, state, state_path, parallel=1, force=False, dry_run=False):
+    """Run the stages as their dependencies finish, skipping the ones that are up to date
+
+    Returns {stage name: (status, seconds)} with status "ran", "up to date",
+    "failed", "blocked" (a dependency failed) or, with dry_run, "would run".
+    The state is saved after every stage, so an interrupted run keeps its progress.
+    """
+    fingerprints = Fingerprints(state["digests"])
+    results = {}
+    waiting = list(stages)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=max(1, parallel)) as pool:
+        while waiting or running:
+            for item in list(waiting):
+                if any(dep not in results for dep in item.deps):
+                    continue
+                waiting.remove(item)
+                statuses = {results[dep][0] for dep in item.deps}
+                if statuses & {"failed", "blocked"}:
+                    results[item.name] = ("blocked", 0.0)
+                    print(f" {item.name}: not run, a stage it needs failed")
+                    continue
+                if "would run" in statuses:
+                    results[item.name] = ("would run", 0.0)
+                    continue
+
+                fingerprint = stage_fingerprint(item, fingerprints)
+                previous = state["stages"].get(item.name)
+                if (not force and previous and previous["fingerprint"] == fingerprint
+                        and output_digests(item, fingerprints) == previous["outputs"]):
+                    results[item.name] = ("up to date", 0.0)
+                    print(f" {item.name}: up to date")
+                    continue
+                if dry_run:
+                    results[item.name] = ("would run", 0.0)
+                    continue
+                print(f" {item.name}: running")
+                running[pool.submit(run_task, item.name, item.task, item.args)] = (item, fingerprint)
+
+            if not running:
+                if waiting and not any(all(dep in results for dep in item.deps) for item in waiting):
+                    raise ValueError(f"stages with unknown dependencies: {', '.join(item.name for item in waiting)}")
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, fingerprint = running.pop(future)
+                try:
+                    elapsed, recording = future.result()
+                    merge(recording)
+                except Exception as e:
+                    results[item.name] = ("failed", 0.0)
+                    print(f" {item.name}: failed - {str(e)}")
+                    continue
+                outputs = output_digests(item, fingerprints)
+                if outputs is None:
+                    results[item.name] = ("failed", elapsed)
+                    missing = [path for path in item.outputs if not os.path.exists(path)]
+                    print(f" {item.name}: failed - did not write {', '.join(missing)}")
+                    continue
+                state["stages"][item.name] = {"fingerprint": fingerprint, "outputs": outputs,
+                                              "seconds": round(elapsed, 3)}
+                save_state(state_path, state)
+                results[item.name] = ("ran", elapsed)
+                print(f" {item.name}: done in {elapsed:.2f}s")
+
+    fingerprints.prune()
+    if not dry_run:
+        save_state(state_path, state)
+    return results
+
+
+def print_results(results):
+    print("\n Stages:")
+    for name, (status, seconds) in results.items():
+        took = f" ({seconds:.2f}s)" if status == "ran" else ""
+        print(f"  {name:<28} {status}{took}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the conversion workflow from a project config, "
+                                                 "skipping stages whose inputs have not changed")
+    parser.add_argument("config", help="project config (JSON), see project.example.json")
+    parser.add_argument("--parallel", type=int, default=None,
+                        help="project stages run at the same time (default: the config's, else the CPU count)")
+    parser.add_argument("--force", action="store_true", help="run every stage, even those that are up to date")
+    parser.add_argument("--dry-run", action="store_true", help="only show which stages would run")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError, KeyError) as e:
+        print(f" Invalid project config {args.config}: {str(e)}")
+        sys.exit(1)
+
+    with session(args.report, args.profile, quiet=args.dry_run):
+        results = run_stages(build_stages(config), load_state(config["state"]), config["state"],
+                             parallel=args.parallel or config["parallel"], force=args.force, dry_run=args.dry_run)
+        print_results(results)
+    if any(status in ("failed", "blocked") for status, _ in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""Pipelined collector: pull -> upload -> convert as concurrent stages.
+
+Each stage has its own worker threads and hands files to the next one
+through a bounded queue, so ADB transfers, Drive uploads and XML->Excel
+conversion overlap instead of running one after another. Conversion runs
+in a process pool because parsing is CPU-bound. At the end a report shows
+per-stage throughput and queue depth to point at the bottleneck.
+
+    python pipeline.py --all-devices --bulk --upload-workers 4 --convert-workers 4
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+CONVERSION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".xml to .xlsx conversion")
+sys.path.insert(0, CONVERSION_DIR)
+
+import main as collector  # noqa: E402
+import xmltoexcel  # noqa: E402
+from instrumentation import merge, recorded  # noqa: E402
+
+STOP = object()
+
+
+class StageStats:
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.bytes = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def record(self, seconds, size=0, ok=True):
+        with self.lock:
+            self.busy += seconds
+            if ok:
+                self.items += 1
+                self.bytes += size
+            else:
+                self.failed += 1
+
+    def report(self):
+        wall = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "wall_seconds": round(wall, 3),
+            "busy_seconds": round(self.busy, 3),
+            "items_per_second": round(self.items / wall, 2) if wall > 0 else None,
+            "mb_per_second": round(self.bytes / wall / 1e6, 3) if wall > 0 else None,
+            # Share of the stage's worker time spent working rather than waiting
+            "utilization": round(self.busy / (wall * self.workers), 3) if wall > 0 else None,
+        }
+
+
+class QueueMonitor:
+    """Sample queue depths in the background"""
+
+    def __init__(self, queues, interval=0.05):
+        self.queues = queues
+        self.interval = interval
+        self.samples = {name: [] for name in queues}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.is_set():
+            for name, q in self.queues.items():
+                self.samples[name].append(q.qsize())
+            self.stopped.wait(self.interval)
+
+    def report(self):
+        result = {}
+        for name, q in self.queues.items():
+            samples = self.samples[name] or [0]
+            result[name] = {
+                "capacity": q.maxsize,
+                "max_depth": max(samples),
+                "mean_depth": round(sum(samples) / len(samples), 2),
+            }
+        return result
+
+
+def convert_file(xml_path, output_folder):
+    """Process-pool task: convert one XML file and return the output path"""
+    excel_file = os.path.join(output_folder, f"{Path(xml_path).stem}.xlsx")
+    # odk_xml_to_excel prints its own error and returns False instead of raising
+    if not xmltoexcel.odk_xml_to_excel(xml_path, excel_file):
+        raise RuntimeError(f"could not convert {Path(xml_path).name}")
+    return excel_file
+
+
+class CollectionPipeline:
+    def __init__(self, serials, downloads, output_folder, bulk=False, uploader=None,
+                 upload_workers=2, convert_workers=2, queue_size=64, upload_batch=25):
+        self.serials = serials
+        self.downloads = Path(downloads)
+        self.output_folder = Path(output_folder)
+        self.bulk = bulk
+        self.uploader = uploader
+        self.upload_workers = upload_workers if uploader else 0
+        self.convert_workers = convert_workers
+        self.upload_batch = upload_batch
+        self.upload_queue = queue.Queue(maxsize=queue_size) if uploader else None
+        self.convert_queue = queue.Queue(maxsize=queue_size)
+        self.stats = {
+            "pull": StageStats("pull", len(serials)),
+            "convert": StageStats("convert", convert_workers),
+        }
+        if uploader:
+            self.stats["upload"] = StageStats("upload", self.upload_workers)
+
+    # ------------------------------------------------------------------ stages
+    def pull_worker(self, serial, outbox):
+        stats = self.stats["pull"]
+        downloads = self.downloads / collector.device_folder_name(serial) if len(self.serials) > 1 else self.downloads
+        files = collector.find_remote_xml(serial)
+        if not files:
+            print(f"[{serial}] No XML files found or search error")
+            return
+        downloads.mkdir(parents=True, exist_ok=True)
+        if self.bulk:
+            pulled = collector.pull_files_bulk(serial, collector.DEVICE_BASE_PATH, files, downloads)
+        else:
+            pulled = collector.pull_files_individually(serial, files, downloads)
+
+        started = time.perf_counter()
+        for _, dest_path in pulled:
+            now = time.perf_counter()
+            if dest_path is None:
+                stats.record(now - started, ok=False)
+            else:
+                stats.record(now - started, dest_path.stat().st_size)
+                outbox.put(dest_path)
+            started = time.perf_counter()
+
+    def upload_worker(self, inbox, outbox):
+        stats = self.stats["upload"]
+        while True:
+            item = inbox.get()
+            if item is STOP:
+                inbox.put(STOP)
+                return
+            # Drain what is already waiting, so the Drive entries of the new files among
+            # them are created in one batch request (DriveUploader.create_missing)
+            batch = [item]
+            while len(batch) < self.upload_batch:
+                try:
+                    item = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                if item is STOP:
+                    inbox.put(STOP)
+                    break
+                batch.append(item)
+
+            started = time.perf_counter()
+            results = self.uploader.upload_files(batch)
+            elapsed = (time.perf_counter() - started) / len(batch)
+            for path in batch:
+                status = results.get(str(path))
+                stats.record(elapsed, path.stat().st_size, ok=status in ("uploaded", "skipped"))
+                outbox.put(path)
+
+    def convert_worker(self, inbox, pool):
+        stats = self.stats["convert"]
+        while True:
+            item = inbox.get()
+            if item is STOP:
+                inbox.put(STOP)
+                return
+            started = time.perf_counter()
+            try:
+                # Per-device download subfolders are mirrored in the output folder
+                output_folder = self.output_folder / item.parent.relative_to(self.downloads)
+                output_folder.mkdir(parents=True, exist_ok=True)
+                _, recording = pool.submit(recorded, "pipeline.convert_file", convert_file, str(item),
+                                           str(output_folder)).result()
+                merge(recording)
+                stats.record(time.perf_counter() - started, item.stat().st_size)
+            except Exception as e:
+                print(f" Failed to convert {item.name}: {str(e)}")
+                stats.record(time.perf_counter() - started, ok=False)
+
+    # --------------------------------------------------------------------- run
+    def run_stage(self, name, targets):
+        stats = self.stats[name]
+        stats.started = time.perf_counter()
+        threads = [threading.Thread(target=target, args=args, daemon=True) for target, args in targets]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def finish_stage(self, name, threads, outbox=None):
+        for thread in threads:
+            thread.join()
+        self.stats[name].finished = time.perf_counter()
+        if outbox is not None:
+            outbox.put(STOP)
+
+    def run(self):
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        queues = {"convert": self.convert_queue}
+        if self.upload_queue is not None:
+            queues = {"upload": self.upload_queue, "convert": self.convert_queue}
+        monitor = QueueMonitor(queues)
+        monitor.thread.start()
+
+        first_queue = self.upload_queue if self.upload_queue is not None else self.convert_queue
+        with ProcessPoolExecutor(max_workers=self.convert_workers) as pool:
+            pullers = self.run_stage("pull", [(self.pull_worker, (serial, first_queue)) for serial in self.serials])
+            uploaders = []
+            if self.upload_queue is not None:
+                uploaders = self.run_stage("upload", [(self.upload_worker, (self.upload_queue, self.convert_queue))
+                                                      for _ in range(self.upload_workers)])
+            converters = self.run_stage("convert", [(self.convert_worker, (self.convert_queue, pool))
+                                                    for _ in range(self.convert_workers)])
+
+            self.finish_stage("pull", pullers, first_queue)
+            if uploaders:
+                self.finish_stage("upload", uploaders, self.convert_queue)
+            self.finish_stage("convert", converters)
+
+        monitor.stopped.set()
+        monitor.thread.join()
+        order = ["pull", "upload", "convert"]
+        return {
+            "stages": [self.stats[name].report() for name in order if name in self.stats],
+            "queues": monitor.report(),
+        }
+
+
+def print_report(report):
+    print("\n Pipeline report:")
+    print(f"  {'stage':<8} {'items':>7} {'failed':>6} {'items/s':>9} {'MB/s':>8} {'util':>6}")
+    for stage in report["stages"]:
+        print(f"  {stage['stage']:<8} {stage['items']:>7} {stage['failed']:>6} "
+              f"{stage['items_per_second'] or 0:>9} {stage['mb_per_second'] or 0:>8} {stage['utilization'] or 0:>6}")
+    for name, depth in report["queues"].items():
+        print(f"  queue before {name}: max {depth['max_depth']}/{depth['capacity']}, mean {depth['mean_depth']}")
+    busiest = max(report["stages"], key=lambda stage: stage["utilization"] or 0)
+    print(f"  Busiest stage: {busiest['stage']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pull, upload and convert ODK XML files as overlapping stages")
+    parser.add_argument("--all-devices", action="store_true", help="collect from every authorized device")
+    parser.add_argument("--bulk", action="store_true", help="use the bulk tar transfer for pulling")
+    parser.add_argument("--upload-workers", type=int, default=0, help="Drive upload workers (0 = no upload)")
+    parser.add_argument("--skip-unchanged", action="store_true", help="skip files already identical on Drive")
+    parser.add_argument("--convert-workers", type=int, default=os.cpu_count() or 2, help="conversion processes")
+    parser.add_argument("--queue-size", type=int, default=64, help="capacity of each queue between stages")
+    parser.add_argument("--downloads", default=str(collector.DOWNLOADS_DIR), help="folder for pulled XML files")
+    parser.add_argument("--output", default=None, help="folder for converted Excel files")
+    parser.add_argument("--report", default=None, help="write the pipeline report as JSON to this file")
+    parser.add_argument("--native-adb", action="store_true",
+                        help="talk to the adb server over its socket instead of starting an adb process per command")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    if args.native_adb:
+        collector.use_native_adb()
+    if not collector.check_adb_availability():
+        print(" ADB not found. Install Android SDK Platform-Tools and add to PATH")
+        sys.exit(1)
+
+    serials = collector.list_authorized_devices()
+    if not serials:
+        print(" No authorized device connected")
+        sys.exit(1)
+    if not args.all_devices:
+        serials = serials[:1]
+
+    uploader = collector.make_uploader(args.upload_workers, args.skip_unchanged)
+    output = args.output or os.path.join(args.downloads, "Outputs")
+    try:
+        pipeline = CollectionPipeline(serials, args.downloads, output, bulk=args.bulk, uploader=uploader,
+                                      upload_workers=args.upload_workers, convert_workers=args.convert_workers,
+                                      queue_size=args.queue_size)
+        report = pipeline.run()
+    finally:
+        if uploader:
+            uploader.close()
+
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f" Report saved to: {args.report}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,393 @@
+"""Flattened submissions in an indexed SQLite database, as an alternative sink to the combined Excel files.
+
+    python submission_store.py submissions.db forms
+    python submission_store.py submissions.db find --device collect:3f9a0c --since 2024-06-01
+    python submission_store.py submissions.db export path3 "combined result.xlsx"
+    python submission_store.py submissions.db master master_sheet.xlsx
+
+The converters write here with --store: each XML file is one submission of a
+form (the project folder name, e.g. path3), holding the rows its flattened
+sheet has. Its device (deviceid), instanceID and date (end, else start, else
+today) are read from the XML into indexed columns, so lookups by form, device,
+instance or date are index searches instead of loading every workbook. The
+rows are kept as JSON, so SQLite's json functions can reach into them too.
+Exports rebuild the layouts of combined result.xlsx (one form) and
+master_sheet.xlsx (a sheet per form) from queries.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from datetime import date, datetime
+from datetime import time as day_time
+
+import pandas as pd
+
+from frame_io import FORMATS, book_path, file_format, write_frame, write_sheets
+from xlsx_stream import StackedRows, clean_value, write_rows
+
+SCHEMA_VERSION = 1
+# Submissions per executemany batch
+BATCH_SIZE = 2000
+# ODK fields giving a submission's date, the first one present wins
+DATE_FIELDS = ("end", "start", "today")
+META_FIELDS = {"deviceid", "instanceID"}.union(DATE_FIELDS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS layouts (
+    id INTEGER PRIMARY KEY,
+    columns TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS forms (
+    name TEXT PRIMARY KEY,
+    columns TEXT
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    form TEXT NOT NULL,
+    file TEXT NOT NULL,
+    device TEXT,
+    instance_id TEXT,
+    submission_date TEXT,
+    layout INTEGER NOT NULL REFERENCES layouts (id),
+    row_count INTEGER NOT NULL,
+    rows TEXT NOT NULL,
+    UNIQUE (form, file)
+);
+CREATE INDEX IF NOT EXISTS submissions_form_date ON submissions (form, submission_date, row_count);
+CREATE INDEX IF NOT EXISTS submissions_device ON submissions (device);
+CREATE INDEX IF NOT EXISTS submissions_instance ON submissions (instance_id);
+CREATE INDEX IF NOT EXISTS submissions_date ON submissions (submission_date);
+"""
+# (form, file) is also indexed, by its UNIQUE constraint
+SUBMISSION_FIELDS = ("form", "file", "device", "instance_id", "submission_date", "row_count")
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def submission_meta(xml_file):
+    """(device, instance ID, date) of a submission from its XML; None for whatever it lacks
+
+    The fields are only taken from the root's direct children and its meta
+    group, so a question or repeat field named "start" or "end" is ignored.
+    """
+    found = {}
+    ancestors = []
+    try:
+        for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+            if event == "start":
+                ancestors.append(local_name(elem.tag))
+                continue
+            name = ancestors.pop()
+            top_level = len(ancestors) == 1 or (len(ancestors) == 2 and ancestors[1] == "meta")
+            if top_level and name in META_FIELDS and name not in found and elem.text and elem.text.strip():
+                found[name] = elem.text.strip()
+            if not len(elem):
+                elem.clear()
+    except (OSError, ET.ParseError):
+        pass
+    submitted = next((found[field] for field in DATE_FIELDS if field in found), None)
+    return found.get("deviceid"), found.get("instanceID"), submitted
+
+
+def json_value(value):
+    """A cell as a JSON value: missing values become null, numpy scalars Python ones, dates ISO text"""
+    value = clean_value(value)
+    if hasattr(value, "item") and not isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        value = clean_value(value.item())
+    if value is None or isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, float):
+        return None if math.isinf(value) else value
+    if isinstance(value, (datetime, date, day_time)):
+        return value.isoformat()
+    return str(value)
+
+
+def records_layout(records):
+    """(columns, rows) for dict records: the keys in order of first appearance, a row per record"""
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    return columns, [[record.get(column) for column in columns] for record in records]
+
+
+def natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+class StoreWriter:
+    """Submissions of one form written in a single transaction, BATCH_SIZE at a time
+
+    Adding a file that is already stored replaces it. With replace every
+    stored submission of the form is dropped first, as for a full conversion.
+    columns, when given, fixes the column order of the form's exports.
+    """
+
+    def __init__(self, store, form, columns=None, replace=False):
+        self.store = store
+        self.form = form
+        self.columns = columns
+        self.replace = replace
+        self.batch = []
+        self.written = 0
+
+    def __enter__(self):
+        db = self.store.db
+        db.execute("BEGIN")
+        if self.replace:
+            db.execute("DELETE FROM submissions WHERE form = ?", (self.form,))
+        db.execute("INSERT INTO forms (name, columns) VALUES (?, ?) "
+                   "ON CONFLICT (name) DO UPDATE SET columns = excluded.columns",
+                   (self.form, json.dumps(list(self.columns)) if self.columns is not None else None))
+        return self
+
+    def add(self, xml_file, columns, rows, meta=None):
+        """One submission: the rows (sequences of values) of xml_file laid out on columns
+
+        meta is its (device, instance ID, date) when known, else they are read from xml_file.
+        """
+        device, instance_id, submitted = meta or submission_meta(xml_file)
+        data = json.dumps([[json_value(value) for value in row] for row in rows], ensure_ascii=False)
+        self.batch.append((self.form, os.path.basename(xml_file), device, instance_id, submitted,
+                           self.store.layout_id(columns), len(rows), data))
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def remove(self, names):
+        """Drop the submissions of XML files (by file name) that are gone"""
+        self.store.db.executemany("DELETE FROM submissions WHERE form = ? AND file = ?",
+                                  [(self.form, name) for name in names])
+
+    def flush(self):
+        if self.batch:
+            self.store.db.executemany(
+                "INSERT OR REPLACE INTO submissions (form, file, device, instance_id, submission_date, layout, "
+                "row_count, rows) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.batch)
+            self.written += len(self.batch)
+            self.batch = []
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.flush()
+            self.store.db.execute("COMMIT")
+        else:
+            self.store.db.execute("ROLLBACK")
+            # Layouts inserted in the transaction are gone with it
+            self.store.layouts.clear()
+
+
+class SubmissionStore:
+    def __init__(self, path):
+        self.path = str(path)
+        # Transactions are opened and committed explicitly (see StoreWriter)
+        self.db = sqlite3.connect(self.path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+        self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.layouts = {}   # JSON column list -> layout id
+
+    def layout_id(self, columns):
+        key = json.dumps([column if isinstance(column, (str, int, float)) else str(column) for column in columns],
+                         ensure_ascii=False)
+        layout = self.layouts.get(key)
+        if layout is None:
+            self.db.execute("INSERT OR IGNORE INTO layouts (columns) VALUES (?)", (key,))
+            layout = self.layouts[key] = self.db.execute("SELECT id FROM layouts WHERE columns = ?", (key,)).fetchone()[0]
+        return layout
+
+    def writer(self, form, columns=None, replace=False):
+        return StoreWriter(self, form, columns, replace)
+
+    def files(self, form):
+        """Names of the XML files stored for form"""
+        return {file for file, in self.db.execute("SELECT file FROM submissions WHERE form = ?", (form,))}
+
+    # ----------------------- queries -----------------------
+    @staticmethod
+    def where(form=None, device=None, instance_id=None, since=None, before=None):
+        """WHERE clause and parameters; since and before bound submission_date (since <= date < before)"""
+        terms, params = [], []
+        for column, value in (("form", form), ("device", device), ("instance_id", instance_id)):
+            if value is not None:
+                terms.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            terms.append("submission_date >= ?")
+            params.append(since)
+        if before is not None:
+            terms.append("submission_date < ?")
+            params.append(before)
+        return (f" WHERE {' AND '.join(terms)}" if terms else ""), params
+
+    def find(self, limit=None, **filters):
+        """Submissions matching the filters (see where), as dicts of SUBMISSION_FIELDS"""
+        clause, params = self.where(**filters)
+        sql = f"SELECT {', '.join(SUBMISSION_FIELDS)} FROM submissions{clause} ORDER BY form, file"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(zip(SUBMISSION_FIELDS, row)) for row in self.db.execute(sql, params)]
+
+    def forms(self):
+        """(form, submissions, rows) for every form, in natural name order (path2 before path10)"""
+        counts = {name: (0, 0) for name, in self.db.execute("SELECT name FROM forms")}
+        for form, submissions, rows in self.db.execute(
+                "SELECT form, COUNT(*), SUM(row_count) FROM submissions GROUP BY form"):
+            counts[form] = (submissions, rows)
+        return [(form, *counts[form]) for form in sorted(counts, key=natural_key)]
+
+    def form_columns(self, form):
+        """The fixed export columns of form, or None to take the union of its submissions' columns"""
+        row = self.db.execute("SELECT columns FROM forms WHERE name = ?", (form,)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def submission_rows(self, **filters):
+        """(columns, rows) of every matching submission, by form and then XML file name"""
+        clause, params = self.where(**filters)
+        layouts = {}
+        for layout, data in self.db.execute(
+                f"SELECT layout, rows FROM submissions{clause} ORDER BY form, file", params):
+            if layout not in layouts:
+                layouts[layout] = json.loads(
+                    self.db.execute("SELECT columns FROM layouts WHERE id = ?", (layout,)).fetchone()[0])
+            yield layouts[layout], json.loads(data)
+
+    @contextmanager
+    def stacked(self, form, **filters):
+        """The form's rows stacked the way its combined result lays them out: (columns, row iterator)"""
+        fixed = self.form_columns(form)
+        if fixed is not None:
+            positions = {column: i for i, column in enumerate(fixed)}
+
+            def laid_out():
+                for columns, rows in self.submission_rows(form=form, **filters):
+                    places = [positions.get(column) for column in columns]
+                    for values in rows:
+                        row = [None] * len(fixed)
+                        for place, value in zip(places, values):
+                            if place is not None:
+                                row[place] = value
+                        yield row
+
+            yield fixed, laid_out()
+            return
+        with StackedRows() as combined:
+            for columns, rows in self.submission_rows(form=form, **filters):
+                combined.add_rows(columns, rows)
+            yield combined.columns, combined.rows()
+
+    def frame(self, form, **filters):
+        """The form's combined result as a DataFrame"""
+        with self.stacked(form, **filters) as (columns, rows):
+            return pd.DataFrame(list(rows), columns=columns)
+
+    def export_combined(self, form, path, **filters):
+        """Write the form's combined result (xlsx streamed row by row, or parquet/feather); returns the rows"""
+        if file_format(path) == "xlsx":
+            with self.stacked(form, **filters) as (columns, rows):
+                return write_rows(path, columns, rows)
+        df = self.frame(form, **filters)
+        write_frame(df, path)
+        return len(df)
+
+    def export_master(self, path, fmt="xlsx", forms=None):
+        """Write the master workbook, a sheet per form; returns where it went (see frame_io.book_path)"""
+        forms = forms or [form for form, _, _ in self.forms()]
+        master_path = book_path(path, fmt)
+        write_sheets(((form, self.frame(form)) for form in forms), master_path, fmt)
+        return master_path
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def form_name(input_folder):
+    """The form a project folder's submissions are stored under: the folder's name"""
+    return os.path.basename(os.path.normpath(input_folder))
+
+
+def store_submissions(store, input_folder, results, columns=None, changed=None):
+    """Make the stored submissions of input_folder's form the (XML file name, columns, rows) in results
+
+    results has every file the form has now. Without changed (a full run) the
+    form is replaced. With changed, the names converted in this run, only those
+    and files the store does not have yet are written; stored files no longer
+    in results are removed. Returns the number of submissions written.
+    """
+    form = form_name(input_folder)
+    replace = changed is None
+    known = set() if replace else store.files(form)
+    changed = set(changed or ())
+    live = set()
+    with store.writer(form, columns, replace=replace) as writer:
+        for name, file_columns, rows in results:
+            live.add(name)
+            if name in known and name not in changed:
+                continue
+            writer.add(os.path.join(input_folder, name), file_columns, rows)
+        writer.remove(sorted(known - live))
+    print(f" Stored {writer.written} submissions of '{form}' in {store.path}")
+    return writer.written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("database", help="SQLite file the converters wrote with --store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("forms", help="list the forms with their submission and row counts")
+    find = commands.add_parser("find", help="list the submissions matching the filters")
+    export = commands.add_parser("export", help="write one form's combined result")
+    export.add_argument("form")
+    export.add_argument("output", help=".xlsx, .parquet or .feather file")
+    find.add_argument("--form")
+    for command in (find, export):
+        command.add_argument("--device", help="deviceid of the tablet")
+        command.add_argument("--instance-id", help="meta/instanceID, e.g. uuid:...")
+        command.add_argument("--since", help="submission date from (inclusive), e.g. 2024-06-01")
+        command.add_argument("--before", help="submission date up to (exclusive), e.g. 2024-07-01")
+    find.add_argument("--limit", type=int, default=None)
+    master = commands.add_parser("master", help="write the master workbook, a sheet per form")
+    master.add_argument("output", help="master_sheet.xlsx (for parquet/feather, a folder of that name)")
+    master.add_argument("--format", choices=sorted(FORMATS), default="xlsx")
+    master.add_argument("--forms", nargs="+", help="only these forms, in this order")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        print(f" No submission store at {args.database}")
+        sys.exit(1)
+    with SubmissionStore(args.database) as store:
+        start = time.perf_counter()
+        if args.command == "forms":
+            for form, submissions, rows in store.forms():
+                print(f" {form}: {submissions} submissions, {rows or 0} rows")
+        elif args.command == "find":
+            found = store.find(limit=args.limit, form=args.form, device=args.device, instance_id=args.instance_id,
+                               since=args.since, before=args.before)
+            for submission in found:
+                print(" " + "  ".join(str(submission[field]) for field in SUBMISSION_FIELDS))
+            print(f" {len(found)} submissions in {(time.perf_counter() - start) * 1000:.1f} ms")
+        elif args.command == "export":
+            rows = store.export_combined(args.form, args.output, device=args.device, instance_id=args.instance_id,
+                                         since=args.since, before=args.before)
+            print(f" {rows} rows of {args.form} written to {args.output}")
+        else:
+            master_path = store.export_master(args.output, args.format, args.forms)
+            print(f" Master workbook written to {master_path}")
+
+
+if __name__ == "__main__":
+    main()
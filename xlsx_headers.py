@@ -0,0 +1,318 @@
+"""Rename the header row of xlsx sheets without loading their data cells.
+
+An .xlsx file is a zip package of XML parts. Only the first row of each sheet
+being renamed is parsed and replaced; everything after it is streamed through
+unchanged, and every other part (other sheets, shared strings, styles ...) is
+copied as its raw compressed bytes, never inflated or deflated again. Memory
+does not depend on the size of the workbook.
+
+The raw copy appends to ZipFile's own member list, which is not public API.
+That is confined to copy_member and only done on the Python versions in
+RAW_COPY_VERSIONS; elsewhere the other parts go through ZipFile.open and are
+compressed again.
+"""
+import copy
+import html
+import posixpath
+import re
+import shutil
+import struct
+import sys
+import xml.etree.ElementTree as ET
+import zipfile
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+DOC_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+# How much of a sheet part is decompressed at a time while looking for the header row
+CHUNK_SIZE = 64 * 1024
+ROW_END = re.compile(rb"</(?:[\w.-]+:)?row>|<(?:[\w.-]+:)?row\b[^>]*/>|</(?:[\w.-]+:)?sheetData>|<(?:[\w.-]+:)?sheetData\s*/>")
+ROW_START = re.compile(rb"<(?P<prefix>[\w.-]+:)?row\b(?P<attrs>[^>]*?)(?P<empty>/)?>")
+CELL = re.compile(rb"<(?P<prefix>[\w.-]+:)?c\b(?P<attrs>[^>]*?)(?:/>|>(?P<body>.*?)</(?:[\w.-]+:)?c>)", re.S)
+ATTR = re.compile(rb"([\w.:-]+)\s*=\s*(\"[^\"]*\"|'[^']*')")
+VALUE = re.compile(rb"<(?:[\w.-]+:)?v>(.*?)</(?:[\w.-]+:)?v>", re.S)
+TEXT = re.compile(rb"<(?:[\w.-]+:)?t(?:\s[^>]*)?>(.*?)</(?:[\w.-]+:)?t>|<(?:[\w.-]+:)?t(?:\s[^>]*)?/>", re.S)
+PHONETIC = re.compile(rb"<(?:[\w.-]+:)?rPh\b.*?</(?:[\w.-]+:)?rPh>", re.S)
+
+# Zip local file header (zipfile.structFileHeader); the name and extra field lengths are its last two fields
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+USES_DESCRIPTOR = 0x08
+# Deflate level for the compression option in bits 1-2 of a member's flags: normal, maximum, fast, super fast
+DEFLATE_LEVELS = (6, 9, 1, 1)
+# Python versions whose ZipFile keeps its members in fp, start_dir, filelist and NameToInfo
+# the way copy_member expects
+RAW_COPY_VERSIONS = ((3, 8), (3, 14))
+
+
+def rels_targets(zf, part):
+    """{relationship id: part name} from the .rels of a package part"""
+    folder, name = posixpath.split(part)
+    rels = posixpath.join(folder, "_rels", f"{name}.rels")
+    if rels not in zf.NameToInfo:
+        return {}
+    targets = {}
+    for rel in ET.fromstring(zf.read(rels)).iter(f"{{{REL_NS}}}Relationship"):
+        target = rel.get("Target", "")
+        if rel.get("TargetMode") == "External":
+            continue
+        if target.startswith("/"):
+            targets[rel.get("Id")] = target.lstrip("/")
+        else:
+            targets[rel.get("Id")] = posixpath.normpath(posixpath.join(folder, target))
+    return targets
+
+
+def workbook_part(zf):
+    for target in rels_targets(zf, "").values():
+        if target.endswith(".xml") and "workbook" in posixpath.basename(target).lower():
+            return target
+    return "xl/workbook.xml"
+
+
+def sheet_parts(zf):
+    """{sheet name: part name of its XML} in workbook order"""
+    workbook = workbook_part(zf)
+    targets = rels_targets(zf, workbook)
+    parts = {}
+    for sheet in ET.fromstring(zf.read(workbook)).iter(f"{{{MAIN_NS}}}sheet"):
+        target = targets.get(sheet.get(f"{{{DOC_REL_NS}}}id"))
+        if target in zf.NameToInfo:
+            parts[sheet.get("name")] = target
+    return parts
+
+
+def shared_strings_part(zf):
+    workbook = workbook_part(zf)
+    for target in rels_targets(zf, workbook).values():
+        if posixpath.basename(target).lower() == "sharedstrings.xml":
+            return target
+    return None
+
+
+def item_text(body):
+    """The text of an inline string or shared string item, without phonetic runs"""
+    body = PHONETIC.sub(b"", body)
+    return "".join(html.unescape(match.group(1).decode("utf-8")) for match in TEXT.finditer(body)
+                   if match.group(1) is not None)
+
+
+def shared_strings(zf, indexes):
+    """{index: text} for the shared string indexes wanted, reading no further than the last one"""
+    part = shared_strings_part(zf)
+    if not indexes or part is None:
+        return {}
+    last = max(indexes)
+    found = {}
+    index = 0
+    with zf.open(part) as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag != f"{{{MAIN_NS}}}si":
+                continue
+            if index in indexes:
+                # Plain text, or the text of each rich text run; phonetic runs are not part of it
+                runs = elem.findall(f"{{{MAIN_NS}}}t") + elem.findall(f"{{{MAIN_NS}}}r/{{{MAIN_NS}}}t")
+                found[index] = "".join(t.text or "" for t in runs)
+            elem.clear()
+            index += 1
+            if index > last:
+                break
+    return found
+
+
+def read_header(f):
+    """(bytes read so far, span of the header row in them or None) for an open sheet part
+
+    Reads until the end of the first row. The header is the first row only when
+    it is row 1, as pd.read_excel takes it.
+    """
+    data = b""
+    while True:
+        match = ROW_END.search(data)
+        if match:
+            break
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return data, None
+        data += chunk
+    start = ROW_START.search(data, 0, match.end())
+    if start is None:
+        return data, None
+    attrs = dict((name, value[1:-1]) for name, value in ATTR.findall(start.group("attrs")))
+    if attrs.get(b"r", b"1") != b"1" or start.group("empty"):
+        return data, None
+    return data, (start.end(), match.start())
+
+
+def header_cells(row):
+    """(match, attributes, type, raw value) for every cell of a header row"""
+    cells = []
+    for match in CELL.finditer(row):
+        attrs = dict((name, value[1:-1]) for name, value in ATTR.findall(match.group("attrs")))
+        body = match.group("body") or b""
+        cell_type = attrs.get(b"t", b"n").decode()
+        if cell_type == "inlineStr":
+            raw = item_text(body) if body else None
+        else:
+            value = VALUE.search(body)
+            raw = html.unescape(value.group(1).decode("utf-8")) if value else None
+        cells.append((match, attrs, cell_type, raw))
+    return cells
+
+
+def cell_value(cell_type, raw, strings):
+    """The header value pd.read_excel would give the cell, or None when it is empty"""
+    if raw is None:
+        return None
+    if cell_type == "s":
+        return strings.get(int(raw))
+    if cell_type in ("inlineStr", "str", "e"):
+        return raw
+    if cell_type == "b":
+        return raw == "1"
+    try:
+        number = float(raw)
+    except ValueError:
+        return raw
+    return int(number) if number.is_integer() else number
+
+
+def inline_cell(match, attrs, text):
+    """The cell with text as an inline string, keeping its reference and style"""
+    prefix = (match.group("prefix") or b"").decode()
+    kept = "".join(f' {name.decode()}="{value.decode()}"' for name, value in attrs.items() if name != b"t")
+    escaped = html.escape(text, quote=False)
+    return (f'<{prefix}c{kept} t="inlineStr"><{prefix}is><{prefix}t xml:space="preserve">{escaped}'
+            f"</{prefix}t></{prefix}is></{prefix}c>").encode("utf-8")
+
+
+def renamed_row(row, cells, strings, rename):
+    """The header row bytes with every cell rename changes turned into an inline string"""
+    pieces = []
+    position = 0
+    renamed = 0
+    for match, attrs, cell_type, raw in cells:
+        value = cell_value(cell_type, raw, strings)
+        if value is None:
+            continue
+        new_name = rename(value)
+        if new_name is None or new_name == value:
+            continue
+        pieces += [row[position:match.start()], inline_cell(match, attrs, str(new_name))]
+        position = match.end()
+        renamed += 1
+    pieces.append(row[position:])
+    return b"".join(pieces), renamed
+
+
+def descriptor_size(f, info):
+    """Length of the data descriptor at f's position, written after the member's data when its flags say so"""
+    if not info.flag_bits & USES_DESCRIPTOR:
+        return 0
+    data = f.read(24)
+    start = len(DESCRIPTOR_SIGNATURE) if data.startswith(DESCRIPTOR_SIGNATURE) else 0
+    # Zip64 descriptors have 8-byte sizes; the central directory's values tell which one this is
+    if data[start:start + 20] == struct.pack("<LQQ", info.CRC, info.compress_size, info.file_size):
+        return start + 20
+    return start + 12
+
+
+def can_copy_raw(dst):
+    """Whether members can be appended to the ZipFile dst as they are stored"""
+    return (RAW_COPY_VERSIONS[0] <= sys.version_info[:2] <= RAW_COPY_VERSIONS[1]
+            and all(hasattr(dst, name) for name in ("fp", "start_dir", "filelist", "NameToInfo")))
+
+
+def member_info(info):
+    """A ZipInfo to write info's member again with its compression method and level"""
+    out_info = zipfile.ZipInfo(info.filename, info.date_time)
+    out_info.compress_type = info.compress_type
+    out_info.external_attr = info.external_attr
+    level = DEFLATE_LEVELS[(info.flag_bits >> 1) & 3]
+    # ZipFile.open takes the level from the ZipInfo when given one; public from Python 3.13
+    if hasattr(out_info, "compress_level"):
+        out_info.compress_level = level
+    elif hasattr(out_info, "_compresslevel"):
+        out_info._compresslevel = level
+    return out_info
+
+
+def copy_member(src, src_file, dst, info):
+    """Append a member of the zip src, also open as src_file, to dst as it is stored
+
+    The local header, the compressed data and the data descriptor are copied
+    byte for byte, so the member keeps its compression and CRC. Where
+    can_copy_raw says no, the member is written through ZipFile.open instead.
+    """
+    if not can_copy_raw(dst):
+        with src.open(info) as f, dst.open(member_info(info), "w", force_zip64=info.file_size > (1 << 31)) as out:
+            shutil.copyfileobj(f, out, CHUNK_SIZE * 16)
+        return
+
+    src_file.seek(info.header_offset)
+    header = src_file.read(LOCAL_HEADER.size)
+    name_length, extra_length = LOCAL_HEADER.unpack(header)[-2:]
+    header += src_file.read(name_length + extra_length)
+    src_file.seek(info.compress_size, 1)
+    length = len(header) + info.compress_size + descriptor_size(src_file, info)
+
+    out_info = copy.copy(info)
+    dst.fp.seek(dst.start_dir)
+    out_info.header_offset = dst.fp.tell()
+    src_file.seek(info.header_offset)
+    while length:
+        block = src_file.read(min(length, CHUNK_SIZE * 16))
+        if not block:
+            raise zipfile.BadZipFile(f"Truncated member {info.filename}")
+        dst.fp.write(block)
+        length -= len(block)
+    # Listed like the members ZipFile writes itself, so close() puts it in the central directory
+    dst.start_dir = dst.fp.tell()
+    dst.filelist.append(out_info)
+    dst.NameToInfo[out_info.filename] = out_info
+
+
+def rename_headers(input_file, output_file, renames):
+    """Copy an xlsx workbook with the header row of some sheets renamed
+
+    renames is {sheet name: rename}, where rename(value) returns the new header for
+    a header cell's value, or the value itself (or None) to keep it. Renamed cells
+    become inline strings; data cells are never parsed. Only the sheet parts with
+    a renamed header are compressed again, at the level they were stored with;
+    every other part is copied as it is stored (see copy_member). Returns
+    {sheet name: number of headers renamed}.
+    """
+    with zipfile.ZipFile(input_file) as src, open(input_file, "rb") as src_file:
+        parts = {part: name for name, part in sheet_parts(src).items() if name in renames}
+
+        # First pass: the header rows only, to know which shared strings they use and what changes
+        rows = {}
+        for part in parts:
+            with src.open(part) as f:
+                data, span = read_header(f)
+            if span:
+                rows[part] = data[span[0]:span[1]]
+        wanted = set()
+        for row in rows.values():
+            wanted.update(int(raw) for _, _, cell_type, raw in header_cells(row) if cell_type == "s" and raw is not None)
+        strings = shared_strings(src, wanted)
+
+        counts = {name: 0 for name in parts.values()}
+        renamed = {}
+        for part, row in rows.items():
+            new_row, counts[parts[part]] = renamed_row(row, header_cells(row), strings, renames[parts[part]])
+            if counts[parts[part]]:
+                renamed[part] = new_row
+
+        with zipfile.ZipFile(output_file, "w") as dst:
+            for info in src.infolist():
+                if info.filename not in renamed:
+                    copy_member(src, src_file, dst, info)
+                    continue
+                force_zip64 = info.file_size > (1 << 31)
+                with src.open(info) as f, dst.open(member_info(info), "w", force_zip64=force_zip64) as out:
+                    data, span = read_header(f)
+                    out.write(data[:span[0]] + renamed[info.filename] + data[span[1]:])
+                    shutil.copyfileobj(f, out, CHUNK_SIZE * 16)
+    return counts
@@ -0,0 +1,127 @@
+"""Constant-memory xlsx writing shared by the conversion and arrangement scripts."""
+import math
+import pickle
+import tempfile
+
+import pandas as pd
+from openpyxl import Workbook
+
+# Rows per worksheet in Excel, header row included
+EXCEL_MAX_ROWS = 1048576
+
+
+def clean_value(value):
+    """Map missing values (None/NaN/NaT/NA) to an empty cell, like DataFrame.to_excel"""
+    if value is None or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class WorkbookWriter:
+    """A write-only workbook that sheets are streamed into one after another
+
+    Rows go to disk as they are added, so memory does not grow with the
+    workbook. When a sheet is full (max_rows, header included) its rows continue
+    on a new sheet named "<sheet_name> (2)", "(3)"... that repeats the header.
+    """
+
+    def __init__(self):
+        self.wb = Workbook(write_only=True)
+
+    def add_sheet(self, sheet_name, columns, rows, max_rows=EXCEL_MAX_ROWS):
+        """Header row, then each row (a dict or a sequence); returns the number of data rows"""
+        columns = list(columns)
+        ws = self.wb.create_sheet(title=sheet_name)
+        ws.append(columns)
+        count = 0
+        in_sheet = 0
+        sheets = 1
+        for row in rows:
+            if in_sheet == max_rows - 1:
+                sheets += 1
+                ws = self.wb.create_sheet(title=f"{sheet_name} ({sheets})")
+                ws.append(columns)
+                in_sheet = 0
+            if isinstance(row, dict):
+                row = [row.get(column) for column in columns]
+            ws.append([clean_value(value) for value in row])
+            count += 1
+            in_sheet += 1
+        return count
+
+    def add_frame(self, sheet_name, df, max_rows=EXCEL_MAX_ROWS):
+        """A DataFrame as a sheet, like df.to_excel(writer, sheet_name=sheet_name, index=False)"""
+        return self.add_sheet(sheet_name, df.columns, df.itertuples(index=False, name=None), max_rows)
+
+    def save(self, output_file):
+        self.wb.save(output_file)
+
+
+def write_rows(output_file, columns, rows, sheet_name="Sheet1", max_rows=EXCEL_MAX_ROWS):
+    """Write a header row and then each row (a dict or a sequence) with a write-only workbook
+
+    Returns the number of data rows written; see WorkbookWriter for sheets past max_rows.
+    """
+    book = WorkbookWriter()
+    count = book.add_sheet(sheet_name, columns, rows, max_rows)
+    book.save(output_file)
+    return count
+
+
+class StackedRows:
+    """Stack DataFrames like repeated pd.concat, in linear time and without holding them
+
+    Columns are the union in order of first appearance. Each frame's rows go
+    to a temporary spool file as it is added and are only laid out on the
+    final columns when written.
+    """
+
+    def __init__(self):
+        self.columns = []
+        self.positions = {}
+        self.count = 0
+        self.spool = tempfile.TemporaryFile()
+        self.chunks = 0
+
+    def add_frame(self, df):
+        self.add_rows(list(df.columns), list(df.itertuples(index=False, name=None)))
+
+    def add_rows(self, columns, rows):
+        """Add rows (sequences of values) laid out on columns, like a frame with those columns"""
+        for column in columns:
+            if column not in self.positions:
+                self.positions[column] = len(self.columns)
+                self.columns.append(column)
+        pickle.dump((columns, rows), self.spool, protocol=pickle.HIGHEST_PROTOCOL)
+        self.chunks += 1
+        self.count += len(rows)
+
+    def rows(self):
+        self.spool.seek(0)
+        width = len(self.columns)
+        for _ in range(self.chunks):
+            columns, rows = pickle.load(self.spool)
+            positions = [self.positions[column] for column in columns]
+            for values in rows:
+                row = [None] * width
+                for position, value in zip(positions, values):
+                    row[position] = value
+                yield row
+
+    def write(self, output_file, sheet_name="Sheet1", max_rows=EXCEL_MAX_ROWS):
+        return write_rows(output_file, self.columns, self.rows(), sheet_name, max_rows)
+
+    def to_frame(self):
+        """Everything added as one DataFrame (held in memory)"""
+        return pd.DataFrame(list(self.rows()), columns=self.columns)
+
+    def close(self):
+        self.spool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()